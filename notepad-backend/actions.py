@@ -0,0 +1,216 @@
+"""
+Assistant Actions
+Parses every [ACTION:...] directive in an AI reply and runs them as batched writes
+"""
+
+import logging
+import os
+from datetime import timedelta
+
+from time_parser import time_parser
+
+logger = logging.getLogger(__name__)
+
+# Action Configuration
+ACTION_PREFIX = "[ACTION:"
+ACTION_MAX_PER_REPLY = int(os.getenv("ACTION_MAX_PER_REPLY", "20"))
+EVENT_DEFAULT_DURATION = timedelta(hours=1)
+
+# Inside a directive, "\|", "\]" and "\\" stand for the literal character
+_ESCAPABLE = "|]\\"
+
+
+class Action:
+    def __init__(self, index: int, kind: str, title: str = "", content: str = "", when: str = "",
+                 error: str = None):
+        self.index = index
+        self.kind = kind
+        self.title = title
+        self.content = content
+        self.when = when
+        self.error = error
+        self.span = None  # (start, end) of the directive in the reply
+
+
+def _directive_end(text: str, i: int) -> bool:
+    """An unescaped ']' ends a directive when only whitespace follows on its line, or another directive"""
+    rest = text[i + 1:].lstrip(" \t")
+    return not rest or rest[0] in "\r\n" or rest.startswith(ACTION_PREFIX)
+
+
+def _scan(text: str, start: int):
+    """
+    Split one directive (text[start:] follows "[ACTION:") into raw fields.
+    Returns (fields, end) or (None, end) if it never closes. A ']' that
+    isn't followed by the end of the line is kept as part of the field
+    (titles like "Fix [bug] today"); if no ']' qualifies, the last one
+    before the next directive closes it.
+    """
+    fields, buf = [], []
+    fallback = None
+    i = start
+    while i < len(text):
+        if text.startswith(ACTION_PREFIX, i):
+            break
+        ch = text[i]
+        if ch == "\\" and i + 1 < len(text) and text[i + 1] in _ESCAPABLE:
+            buf.append(text[i + 1])
+            i += 2
+            continue
+        if ch == "|":
+            fields.append("".join(buf))
+            buf = []
+        elif ch == "]":
+            if _directive_end(text, i):
+                return fields + ["".join(buf)], i + 1
+            fallback = (fields + ["".join(buf)], i + 1)
+            buf.append(ch)
+        else:
+            buf.append(ch)
+        i += 1
+    if fallback is not None:
+        return fallback
+    return None, i
+
+
+def _build(index: int, fields: list) -> Action:
+    kind = fields[0].strip().upper()
+    raw = fields[1:]
+    values = [f.strip() for f in raw]
+
+    if kind == "NOTE":
+        # An unescaped '|' most likely belongs to the content
+        title, content = (values[0], "|".join(raw[1:]).strip()) if values else ("", "")
+        if not title:
+            return Action(index, kind, error="A note needs a title")
+        return Action(index, kind, title=title, content=content)
+
+    if kind == "EVENT":
+        # Times never contain '|', so the last field is the time and the rest is the title
+        if len(values) < 2 or not values[-1]:
+            return Action(index, kind, title=values[0] if values else "", error="An event needs a title and a time")
+        title = "|".join(raw[:-1]).strip()
+        if not title:
+            return Action(index, kind, when=values[-1], error="An event needs a title")
+        return Action(index, kind, title=title, when=values[-1])
+
+    return Action(index, kind, title=values[0] if values else "", error=f"Unsupported action '{kind}'")
+
+
+def parse_actions(text: str) -> list:
+    """Every directive in the reply, in order; invalid ones carry an error instead of being dropped"""
+    actions = []
+    pos = text.find(ACTION_PREFIX)
+    while pos != -1:
+        fields, end = _scan(text, pos + len(ACTION_PREFIX))
+        if fields is not None and len(fields) > 1:
+            index = len(actions)
+            if index >= ACTION_MAX_PER_REPLY:
+                action = Action(index, fields[0].strip().upper(),
+                                error=f"At most {ACTION_MAX_PER_REPLY} actions per reply")
+            else:
+                action = _build(index, fields)
+            action.span = (pos, end)
+            actions.append(action)
+        pos = text.find(ACTION_PREFIX, max(end, pos + 1))
+    return actions
+
+
+def strip_actions(text: str, actions: list) -> str:
+    """The reply with the parsed directives cut out"""
+    kept, last = [], 0
+    for action in actions:
+        start, end = action.span
+        kept.append(text[last:start])
+        last = end
+    kept.append(text[last:])
+    return "\n".join(line.rstrip() for line in "".join(kept).strip().splitlines() if line.strip())
+
+
+class ActionResult:
+    """Per-action results in reply order, plus the rows that were written"""
+
+    def __init__(self, actions: list):
+        self.actions = actions
+        self.results = [None] * len(actions)
+        self.notes = []
+        self.events = []
+
+    def ok(self, action: Action, message: str, row: dict):
+        self.results[action.index] = {
+            "index": action.index, "type": action.kind, "title": action.title,
+            "ok": True, "message": message, "id": row.get("id"),
+        }
+
+    def fail(self, action: Action, message: str):
+        self.results[action.index] = {
+            "index": action.index, "type": action.kind, "title": action.title,
+            "ok": False, "message": message,
+        }
+
+    def summary(self) -> str:
+        return "\n".join(result["message"] for result in self.results)
+
+
+async def execute_actions(storage, user_id: str, actions: list) -> ActionResult:
+    """
+    Validate everything, resolve all event times in one pass, then write
+    all notes in one insert and all events in one insert. If the events
+    insert fails after the notes went in, the notes are deleted again so
+    the reply's actions land together or not at all.
+    """
+    result = ActionResult(actions)
+    notes, events = [], []
+
+    for action in actions:
+        if action.error:
+            result.fail(action, f"⚠️ {action.error}.")
+        elif action.kind == "NOTE":
+            notes.append(action)
+
+    pending_events = [a for a in actions if a.kind == "EVENT" and not a.error]
+    times = await time_parser.parse_many_async([a.when for a in pending_events]) if pending_events else {}
+    for action in pending_events:
+        start = times.get(action.when)
+        if start is None:
+            result.fail(action, f"⚠️ I understood you wanted an event, but I couldn't understand the time '{action.when}'.")
+        else:
+            events.append((action, start))
+
+    inserted_notes = []
+    try:
+        if notes:
+            inserted_notes = await storage.insert("notes", user_id, [
+                {"title": a.title, "content": a.content, "status": "Pending"} for a in notes
+            ])
+        inserted_events = []
+        if events:
+            inserted_events = await storage.insert("events", user_id, [
+                {
+                    "title": a.title,
+                    "description": f"Scheduled via AI: {a.when}",
+                    "start_time": start.isoformat(),
+                    "end_time": (start + EVENT_DEFAULT_DURATION).isoformat(),
+                }
+                for a, start in events
+            ])
+    except Exception as e:
+        logger.exception("Action write failed: %s", e)
+        if inserted_notes:
+            try:
+                await storage.delete("notes", user_id, [row["id"] for row in inserted_notes])
+            except Exception as cleanup_error:
+                logger.error("Could not roll back notes %s: %s",
+                             [row.get("id") for row in inserted_notes], cleanup_error)
+                result.notes = inserted_notes  # they exist; let the caller announce them
+        for action in notes + [a for a, _ in events]:
+            result.fail(action, "⚠️ I tried to perform that action but something went wrong.")
+        return result
+
+    for action, row in zip(notes, inserted_notes):
+        result.ok(action, f"✅ I've created the note: '{action.title}'.", row)
+    for (action, start), row in zip(events, inserted_events):
+        result.ok(action, f"✅ Scheduled '{action.title}' for {start.strftime('%b %d at %I:%M %p')}.", row)
+    result.notes = inserted_notes
+    result.events = inserted_events
+    return result
@@ -0,0 +1,426 @@
+"""
+AI Provider Layer
+Pluggable text-generation backends with latency tracking, hedged requests
+and circuit breaking
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import deque
+
+from http_pool import get_client
+from metrics import span
+
+# Provider Configuration
+# Comma separated, in priority order: pollinations, ollama, fake
+AI_PROVIDERS = os.getenv("AI_PROVIDERS", "pollinations")
+POLLINATIONS_API_URL = os.getenv("POLLINATIONS_API_URL", "https://text.pollinations.ai/")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434/v1")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "30"))
+FAKE_AI_LATENCY_MS = float(os.getenv("FAKE_AI_LATENCY_MS", "0"))
+
+# Hedging: if the primary hasn't answered after its own p95 latency
+# (clamped to these bounds), ask the next healthy provider as well
+AI_HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "true").lower() == "true"
+AI_HEDGE_MIN_MS = float(os.getenv("AI_HEDGE_MIN_MS", "300"))
+AI_HEDGE_MAX_MS = float(os.getenv("AI_HEDGE_MAX_MS", "10000"))
+AI_HEDGE_DEFAULT_MS = float(os.getenv("AI_HEDGE_DEFAULT_MS", "3000"))
+
+# Circuit breaker: open after N consecutive failures, retry after a cooldown
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", "5"))
+AI_BREAKER_RESET_S = float(os.getenv("AI_BREAKER_RESET_S", "30"))
+
+
+class ProviderError(Exception):
+    """Upstream answered, but not with a usable reply"""
+
+    def __init__(self, provider: str, status_code: int = None, message: str = ""):
+        self.provider = provider
+        self.status_code = status_code
+        super().__init__(message or f"{provider} returned HTTP {status_code}")
+
+
+# -----------------------
+# Providers
+# -----------------------
+
+class AIProvider:
+    """Interface: generate() returns the whole reply, stream() yields text chunks"""
+
+    name = "base"
+    model = ""
+
+    async def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def stream(self, prompt: str):
+        yield await self.generate(prompt)
+
+
+class PollinationsProvider(AIProvider):
+    """Pollinations.ai plain-text endpoint; the prompt is the POST body"""
+
+    name = "pollinations"
+    model = "pollinations-text"
+
+    def __init__(self, url: str = POLLINATIONS_API_URL):
+        self.url = url
+
+    def _request(self, prompt: str) -> dict:
+        return {
+            "content": prompt.encode("utf-8"),
+            "headers": {"Content-Type": "text/plain; charset=utf-8"},
+            "timeout": AI_TIMEOUT,
+        }
+
+    async def generate(self, prompt: str) -> str:
+        response = await get_client("ai").post(self.url, **self._request(prompt))
+        if response.status_code != 200:
+            raise ProviderError(self.name, response.status_code)
+        return response.text
+
+    async def stream(self, prompt: str):
+        async with get_client("ai").stream("POST", self.url, **self._request(prompt)) as response:
+            if response.status_code != 200:
+                raise ProviderError(self.name, response.status_code)
+            async for chunk in response.aiter_text():
+                if chunk:
+                    yield chunk
+
+
+class OpenAICompatibleProvider(AIProvider):
+    """Any /v1/chat/completions server, e.g. a local Ollama"""
+
+    name = "ollama"
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, model: str = OLLAMA_MODEL, name: str = None):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.model = model
+        if name:
+            self.name = name
+
+    def _payload(self, prompt: str, stream: bool) -> dict:
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": stream,
+        }
+
+    async def generate(self, prompt: str) -> str:
+        response = await get_client("ai").post(self.url, json=self._payload(prompt, False), timeout=AI_TIMEOUT)
+        if response.status_code != 200:
+            raise ProviderError(self.name, response.status_code)
+        try:
+            return response.json()["choices"][0]["message"]["content"] or ""
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise ProviderError(self.name, response.status_code, "Malformed completion response")
+
+    async def stream(self, prompt: str):
+        async with get_client("ai").stream(
+            "POST", self.url, json=self._payload(prompt, True), timeout=AI_TIMEOUT
+        ) as response:
+            if response.status_code != 200:
+                raise ProviderError(self.name, response.status_code)
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                except (ValueError, KeyError, IndexError, TypeError):
+                    continue
+                if delta:
+                    yield delta
+
+
+class FakeProvider(AIProvider):
+    """
+    Deterministic in-process stand-in for tests and load runs.
+    Messages starting with "note:" or "schedule:" produce an action reply;
+    anything else gets a canned reply chosen by a hash of the message.
+    """
+
+    name = "fake"
+    model = "fake"
+
+    REPLIES = (
+        "Sure, here is what I found in your notes.",
+        "You have a few things coming up this week.",
+        "I can help with that. Could you tell me a bit more?",
+    )
+
+    def __init__(self, latency_ms: float = FAKE_AI_LATENCY_MS):
+        self.latency_ms = latency_ms
+
+    @staticmethod
+    def _message(prompt: str) -> str:
+        tail = prompt.rsplit("User:", 1)[-1]
+        return tail.rsplit("Assistant:", 1)[0].strip()
+
+    def reply_for(self, prompt: str) -> str:
+        message = self._message(prompt)
+        lowered = message.lower()
+        if lowered.startswith("note:"):
+            title, _, content = message[5:].strip().partition(" - ")
+            return f"[ACTION:NOTE|{title or 'Untitled'}|{content}]"
+        if lowered.startswith("schedule:"):
+            title, _, when = message[9:].strip().partition(" at ")
+            return f"[ACTION:EVENT|{title or 'Untitled'}|{when or 'tomorrow at 9am'}]"
+        digest = int(hashlib.sha256(message.encode()).hexdigest(), 16)
+        return self.REPLIES[digest % len(self.REPLIES)]
+
+    async def generate(self, prompt: str) -> str:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self.reply_for(prompt)
+
+    async def stream(self, prompt: str):
+        reply = await self.generate(prompt)
+        for word in reply.split(" "):
+            yield word + " "
+
+
+PROVIDER_FACTORIES = {
+    "pollinations": PollinationsProvider,
+    "ollama": OpenAICompatibleProvider,
+    "fake": FakeProvider,
+}
+
+
+# -----------------------
+# Health Tracking
+# -----------------------
+
+class LatencyTracker:
+    """Recent successful latencies (seconds) for percentile estimates"""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half-open after cooldown (one trial call)"""
+
+    def __init__(self, failure_threshold: int = AI_BREAKER_FAILURES, reset_timeout: float = AI_BREAKER_RESET_S):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        """Would a request be let through? No side effects, for picking candidates"""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+
+    def allow(self) -> bool:
+        """Call only when a request is actually about to be sent: takes the half-open trial"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+# -----------------------
+# Router
+# -----------------------
+
+class ProviderRouter:
+    """
+    Sends each request to the first healthy provider. If it hasn't answered
+    (or, for streams, produced its first chunk) within its p95 latency, the
+    next healthy provider is asked too and the first success wins.
+    A provider that keeps failing is skipped until its breaker cools down.
+    """
+
+    def __init__(self, providers: list, hedge: bool = AI_HEDGE_ENABLED):
+        if not providers:
+            raise ValueError("At least one AI provider is required")
+        self.providers = providers
+        self.hedge = hedge
+        self.latency = {p.name: LatencyTracker() for p in providers}
+        self.breakers = {p.name: CircuitBreaker() for p in providers}
+        self.hedges_started = 0
+        self.hedges_won = 0
+
+    @property
+    def names(self) -> list:
+        return [p.name for p in self.providers]
+
+    def _hedge_delay(self, provider: AIProvider) -> float:
+        p95 = self.latency[provider.name].percentile(0.95)
+        delay_ms = AI_HEDGE_DEFAULT_MS if p95 is None else p95 * 1000
+        return min(max(delay_ms, AI_HEDGE_MIN_MS), AI_HEDGE_MAX_MS) / 1000
+
+    def _healthy(self) -> list:
+        return [p for p in self.providers if self.breakers[p.name].available()]
+
+    async def _tracked(self, provider: AIProvider, call):
+        tracker = self.latency[provider.name]
+        tracker.requests += 1
+        start = time.monotonic()
+        try:
+            with span(f"ai.{provider.name}"):
+                result = await call(provider)
+        except asyncio.CancelledError:
+            # Lost a hedge race; says nothing about the provider's health
+            self.breakers[provider.name].trial_in_flight = False
+            raise
+        except Exception:
+            tracker.failures += 1
+            self.breakers[provider.name].record_failure()
+            raise
+        tracker.record(time.monotonic() - start)
+        self.breakers[provider.name].record_success()
+        return result
+
+    async def _race(self, call):
+        """
+        Run `call(provider)` with hedging and failover.
+        Returns (provider, result); raises the last error if every provider fails.
+        """
+        candidates = self._healthy()
+        if not candidates:
+            raise ProviderError("router", 503, "No healthy AI provider available")
+
+        pending = {}
+        hedged = set()
+        last_error = None
+        queue = list(candidates)
+
+        def launch():
+            # The trial of a half-open breaker is taken here, when the call is
+            # really made; it may have gone to another request since selection
+            while queue:
+                provider = queue.pop(0)
+                if self.breakers[provider.name].allow():
+                    task = asyncio.create_task(self._tracked(provider, call))
+                    pending[task] = provider
+                    return provider
+            return None
+
+        primary = launch()
+        if primary is None:
+            raise ProviderError("router", 503, "No healthy AI provider available")
+        try:
+            while pending:
+                timeout = None
+                if self.hedge and queue and len(pending) == 1 and primary in pending.values():
+                    timeout = self._hedge_delay(primary)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedge = launch()
+                    if hedge is not None:
+                        self.hedges_started += 1
+                        hedged.add(hedge.name)
+                    continue
+
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception() is None:
+                        if provider.name in hedged:
+                            self.hedges_won += 1
+                        return provider, task.result()
+                    last_error = task.exception()
+
+                # Everything in flight failed: fail over to the next provider
+                if not pending and queue:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    async def generate(self, prompt: str) -> str:
+        _, reply = await self._race(lambda p: p.generate(prompt))
+        return reply
+
+    async def stream(self, prompt: str):
+        """Hedging and failover apply up to the first chunk; after that we stay with the winner"""
+
+        async def first_chunk(provider):
+            chunks = provider.stream(prompt)
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                chunk = ""
+            except BaseException:
+                await chunks.aclose()
+                raise
+            return chunks, chunk
+
+        _, (chunks, chunk) = await self._race(first_chunk)
+        try:
+            if chunk:
+                yield chunk
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    def stats(self) -> dict:
+        providers = {}
+        for p in self.providers:
+            tracker = self.latency[p.name]
+            p50, p95 = tracker.percentile(0.5), tracker.percentile(0.95)
+            providers[p.name] = {
+                "model": p.model,
+                "state": self.breakers[p.name].state,
+                "requests": tracker.requests,
+                "failures": tracker.failures,
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+        return {"providers": providers, "hedges_started": self.hedges_started, "hedges_won": self.hedges_won}
+
+
+def build_router(spec: str = AI_PROVIDERS) -> ProviderRouter:
+    names = [n.strip() for n in spec.split(",") if n.strip()]
+    unknown = [n for n in names if n not in PROVIDER_FACTORIES]
+    if unknown:
+        raise ValueError(f"Unknown AI provider(s): {', '.join(unknown)}")
+    return ProviderRouter([PROVIDER_FACTORIES[n]() for n in names])
+
+
+ai_router = build_router()
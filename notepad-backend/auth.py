@@ -3,34 +3,118 @@ Authentication Module
 Validates JWT tokens from Supabase Auth
 """
 
-import requests
-from fastapi import Header, HTTPException
+import hashlib
+import logging
+import time
+from fastapi import Header, HTTPException, Query
+from jose import jwt, JWTError, ExpiredSignatureError
 import os
-from dotenv import load_dotenv
+import config  # loads .env
+from cache import TTLCache
+from http_pool import get_client
+from singleflight import SingleFlight
+from metrics import span
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 # Supabase Configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_KEY")
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 
+# Auth Configuration
+# AUTH_MODE=local verifies tokens in-process (needs SUPABASE_JWT_SECRET),
+# AUTH_MODE=remote always asks the Supabase auth server.
+AUTH_MODE = os.getenv("AUTH_MODE", "local" if SUPABASE_JWT_SECRET else "remote")
+AUTH_REMOTE_FALLBACK = os.getenv("AUTH_REMOTE_FALLBACK", "true").lower() == "true"
+JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWT_ALGORITHM = "HS256"
 
-def get_current_user(authorization: str = Header(None)):
+# Validated tokens, keyed by token hash. Entries never outlive the token's exp.
+token_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL", "300")),
+)
+
+# A page load sends several requests with the same token at once; only
+# one of them verifies it, the rest wait for that result
+auth_flight = SingleFlight("auth")
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _seconds_until_exp(claims: dict) -> float:
+    exp = claims.get("exp")
+    if exp is None:
+        return 0
+    return float(exp) - time.time()
+
+
+def _user_from_claims(claims: dict) -> dict:
+    """Shape verified claims like the /auth/v1/user response"""
+    return {
+        "id": claims.get("sub"),
+        "email": claims.get("email"),
+        "phone": claims.get("phone"),
+        "role": claims.get("role"),
+        "aud": claims.get("aud"),
+        "app_metadata": claims.get("app_metadata", {}),
+        "user_metadata": claims.get("user_metadata", {}),
+    }
+
+
+def _verify_local(token: str):
     """
-    Validates JWT token from Supabase Auth
-    Returns the user object with user['id'], user['email'], etc.
+    Verifies signature, exp and aud in-process.
+    Returns (user, claims), or None when the token can't be checked locally.
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Missing Authorization header")
+    if not SUPABASE_JWT_SECRET:
+        return None
 
-    # Extract token from "Bearer <token>"
-    token = authorization.replace("Bearer ", "").strip()
-    
-    if not token:
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token format")
 
+    # Asymmetric keys can only be checked by the auth server
+    if header.get("alg") != JWT_ALGORITHM:
+        return None
+
     try:
-        res = requests.get(
+        claims = jwt.decode(
+            token,
+            SUPABASE_JWT_SECRET,
+            algorithms=[JWT_ALGORITHM],
+            audience=JWT_AUDIENCE,
+            options={"require_exp": True, "require_sub": True},
+        )
+    except ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    except JWTError as e:
+        logger.info("Local auth rejected token: %s", e)
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    return _user_from_claims(claims), claims
+
+
+def warm_up():
+    """Sign and verify a throwaway token so jose's backends are loaded before the first request"""
+    if not SUPABASE_JWT_SECRET:
+        return
+    token = jwt.encode(
+        {"sub": "warm-up", "aud": JWT_AUDIENCE, "exp": int(time.time()) + 60},
+        SUPABASE_JWT_SECRET,
+        algorithm=JWT_ALGORITHM,
+    )
+    _verify_local(token)
+
+
+async def _verify_remote(token: str):
+    """Asks the Supabase auth server. Returns (user, claims)."""
+    try:
+        res = await get_client("supabase").get(
             f"{SUPABASE_URL}/auth/v1/user",
             headers={
                 "Authorization": f"Bearer {token}",
@@ -42,18 +126,87 @@ def get_current_user(authorization: str = Header(None)):
         raise HTTPException(status_code=500, detail=f"Auth server error: {str(e)}")
 
     if res.status_code != 200:
-        print(f"[DEBUG] Auth error: {res.status_code} - {res.text}")
+        logger.info("Auth server rejected token: %s - %s", res.status_code, res.text)
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
     user_data = res.json()
-    
+
     # Verify user_data is a dictionary and has 'id'
     if not isinstance(user_data, dict):
-        print(f"[DEBUG] User data is not dict: {type(user_data)}")
+        logger.warning("Auth user data is not a dict: %s", type(user_data))
         raise HTTPException(status_code=401, detail="Invalid user data format")
-    
+
     if "id" not in user_data:
-        print(f"[DEBUG] User data missing 'id': {user_data.keys()}")
+        logger.warning("Auth user data missing 'id': %s", list(user_data.keys()))
         raise HTTPException(status_code=401, detail="User ID not found in token")
-    
-    return user_data  # Returns dict with 'id', 'email', etc
+
+    # The server accepted the token, so its exp claim is trustworthy enough
+    # to bound how long we keep the result around.
+    try:
+        claims = jwt.get_unverified_claims(token)
+    except JWTError:
+        claims = {}
+
+    return user_data, claims
+
+
+def get_auth_cache_stats() -> dict:
+    """Token cache counters; every hit is one auth round trip saved"""
+    return {"mode": AUTH_MODE, **token_cache.stats(), "single_flight": auth_flight.stats()}
+
+
+async def get_current_user(authorization: str = Header(None)):
+    """
+    Validates JWT token from Supabase Auth
+    Returns the user object with user['id'], user['email'], etc.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing Authorization header")
+
+    # Extract token from "Bearer <token>"
+    token = authorization.replace("Bearer ", "").strip()
+    return await authenticate(token)
+
+
+async def get_current_user_or_query(
+    authorization: str = Header(None),
+    access_token: str = Query(default=None),
+):
+    """
+    For EventSource and WebSocket clients, which can't set headers: the
+    token may come as ?access_token= instead. Prefer the header where possible.
+    """
+    if authorization:
+        return await get_current_user(authorization)
+    if not access_token:
+        raise HTTPException(status_code=401, detail="Missing Authorization header")
+    return await authenticate(access_token)
+
+
+async def authenticate(token: str) -> dict:
+    """Verified user for a bare access token; raises 401 HTTPException otherwise"""
+    if not token:
+        raise HTTPException(status_code=401, detail="Invalid token format")
+
+    key = _token_key(token)
+    cached = token_cache.get(key)
+    if cached is not None:
+        return cached
+
+    return await auth_flight.do(key, lambda: _verify(token, key))  # Returns dict with 'id', 'email', etc
+
+
+async def _verify(token: str, key: str) -> dict:
+    result = None
+    if AUTH_MODE == "local":
+        with span("auth.local"):
+            result = _verify_local(token)
+    if result is None:
+        if AUTH_MODE == "local" and not AUTH_REMOTE_FALLBACK:
+            raise HTTPException(status_code=401, detail="Token cannot be verified locally")
+        with span("auth.remote"):
+            result = await _verify_remote(token)
+
+    user_data, claims = result
+    token_cache.set(key, user_data, ttl=_seconds_until_exp(claims))
+    return user_data
@@ -0,0 +1,204 @@
+"""
+Batch Operations
+Runs many create/update/delete operations on one table in a few round trips
+"""
+
+import json
+import os
+from typing import List, Literal, Optional, Union
+from pydantic import BaseModel, ValidationError, field_validator
+
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "500"))
+
+
+class BatchOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    id: Optional[Union[int, str]] = None
+    data: Optional[dict] = None
+
+    @field_validator("id")
+    @classmethod
+    def _id_as_str(cls, value):
+        # Both backends hand out integer ids; results are matched on str(row["id"])
+        return None if value is None else str(value)
+
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
+
+
+class BatchResult:
+    """Per-item results in request order, plus the rows that changed"""
+
+    def __init__(self, operations: list):
+        self.operations = operations
+        self.results = [None] * len(operations)
+        self.upserted = []
+        self.deleted = []
+
+    def ok(self, index: int, status: int, data=None):
+        self.results[index] = {"index": index, "op": self.operations[index].op, "ok": True, "status": status, "data": data}
+
+    def fail(self, index: int, status: int, error: str):
+        self.results[index] = {"index": index, "op": self.operations[index].op, "ok": False, "status": status, "error": error}
+
+    def to_response(self) -> dict:
+        succeeded = sum(1 for r in self.results if r["ok"])
+        return {
+            "results": self.results,
+            "succeeded": succeeded,
+            "failed": len(self.results) - succeeded,
+        }
+
+
+def _validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+
+async def _insert(storage, table: str, user_id: str, creates: list, batch: BatchResult):
+    rows = [row for _, row in creates]
+    try:
+        inserted = await storage.insert(table, user_id, rows)
+        if len(inserted) != len(rows):
+            raise RuntimeError("insert returned an unexpected number of rows")
+        for (index, _), row in zip(creates, inserted):
+            batch.ok(index, 201, row)
+        batch.upserted.extend(inserted)
+        return
+    except Exception as e:
+        if len(creates) == 1:
+            batch.fail(creates[0][0], 500, f"Database error: {str(e)}")
+            return
+
+    # The bulk insert failed as a whole; retry one by one to find the bad rows
+    for item in creates:
+        await _insert(storage, table, user_id, [item], batch)
+
+
+def _by_id(items: list) -> list:
+    """Split (index, id) items into one group per distinct id, for item-by-item retries"""
+    groups = {}
+    for index, row_id in items:
+        groups.setdefault(row_id, []).append((index, row_id))
+    return list(groups.values())
+
+
+async def _update_group(storage, table: str, user_id: str, payload: dict, items: list, batch: BatchResult):
+    ids = list(dict.fromkeys(row_id for _, row_id in items))
+    try:
+        rows = await storage.update(table, user_id, ids, payload)
+    except Exception as e:
+        if len(ids) == 1:
+            for index, _ in items:
+                batch.fail(index, 500, f"Database error: {str(e)}")
+            return
+        # One bad id (e.g. not a number for a bigint column) fails the whole
+        # statement; retry one id at a time so only that item reports it
+        for group in _by_id(items):
+            await _update_group(storage, table, user_id, payload, group, batch)
+        return
+
+    updated = {str(row.get("id")): row for row in rows}
+    batch.upserted.extend(updated.values())
+    for index, row_id in items:
+        if row_id in updated:
+            batch.ok(index, 200, updated[row_id])
+        else:
+            batch.fail(index, 404, "Not found or unauthorized")
+
+
+async def _update(storage, table: str, user_id: str, updates: list, batch: BatchResult):
+    # Operations with identical payloads (e.g. a status change across many
+    # notes) become a single UPDATE ... WHERE id IN (...)
+    groups = {}
+    for index, row_id, payload in updates:
+        key = json.dumps(payload, sort_keys=True, default=str)
+        groups.setdefault(key, (payload, []))[1].append((index, row_id))
+
+    for payload, items in groups.values():
+        await _update_group(storage, table, user_id, payload, items, batch)
+
+
+async def _delete(storage, table: str, user_id: str, deletes: list, batch: BatchResult):
+    ids = list(dict.fromkeys(row_id for _, row_id in deletes))
+    try:
+        rows = await storage.delete(table, user_id, ids)
+    except Exception as e:
+        if len(ids) == 1:
+            for index, _ in deletes:
+                batch.fail(index, 500, f"Database error: {str(e)}")
+            return
+        # As with updates: find the bad id instead of failing every item
+        for group in _by_id(deletes):
+            await _delete(storage, table, user_id, group, batch)
+        return
+
+    removed = {str(row.get("id")) for row in rows}
+    batch.deleted.extend(removed)
+    for index, row_id in deletes:
+        if row_id in removed:
+            batch.ok(index, 200, {"id": row_id})
+        else:
+            batch.fail(index, 404, "Not found or unauthorized")
+
+
+async def execute_batch(storage, table: str, user_id: str, operations: list,
+                        create_model, update_model=None, prepare=None) -> BatchResult:
+    """
+    Validate every operation, then run all creates as one insert, updates as
+    one UPDATE per distinct payload and all deletes as one DELETE, in that
+    order. Invalid or failing items are reported without stopping the rest.
+    `prepare`, if given, turns a validated create into the row to insert and
+    raises ValueError to reject it.
+    """
+    batch = BatchResult(operations)
+    creates, updates, deletes = [], [], []
+
+    for index, operation in enumerate(operations):
+        if operation.op == "create":
+            try:
+                model = create_model(**(operation.data or {}))
+            except ValidationError as e:
+                batch.fail(index, 422, _validation_error(e))
+                continue
+            row = model.dict()
+            if prepare is not None:
+                try:
+                    row = prepare(row)
+                except ValueError as e:
+                    batch.fail(index, 422, str(e))
+                    continue
+            creates.append((index, row))
+
+        elif operation.op == "update":
+            if update_model is None:
+                batch.fail(index, 400, "Update is not supported here")
+                continue
+            if not operation.id:
+                batch.fail(index, 422, "id is required")
+                continue
+            try:
+                model = update_model(**(operation.data or {}))
+            except ValidationError as e:
+                batch.fail(index, 422, _validation_error(e))
+                continue
+            payload = model.dict(exclude_unset=True)
+            if not payload:
+                batch.fail(index, 400, "No fields provided to update")
+                continue
+            updates.append((index, operation.id, payload))
+
+        else:
+            if not operation.id:
+                batch.fail(index, 422, "id is required")
+                continue
+            deletes.append((index, operation.id))
+
+    if creates:
+        await _insert(storage, table, user_id, creates, batch)
+    if updates:
+        await _update(storage, table, user_id, updates, batch)
+    if deletes:
+        await _delete(storage, table, user_id, deletes, batch)
+
+    return batch
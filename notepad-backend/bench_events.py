@@ -0,0 +1,118 @@
+# bench_events.py
+# Run:  python bench_events.py
+# Calendar queries for accounts with thousands of events and recurring
+# series that started years ago: day/week/month windows and "next 20",
+# through the event query engine (cold and cached) against loading every
+# event and expanding each series from its first start.
+
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from event_query import EventQueryEngine, EVENT_COLUMNS, prepare_event
+from recurrence import Recurrence, parse_time
+from sqlite_storage import SQLiteStorage
+
+ACCOUNTS = [(1_000, 20), (5_000, 50), (20_000, 100)]  # (one-off events, recurring series)
+RULES = [
+    "FREQ=DAILY",
+    "FREQ=WEEKLY;BYDAY=MO,WE,FR",
+    "FREQ=WEEKLY;INTERVAL=2;BYDAY=TU",
+    "FREQ=MONTHLY",
+    "FREQ=YEARLY",
+    "FREQ=DAILY;COUNT=500",
+    "FREQ=WEEKLY;UNTIL=20300101T000000Z",
+]
+REPEAT = 50
+
+
+def make_events(n_events: int, n_series: int, now: datetime) -> list:
+    rng = random.Random(n_events)
+    events = []
+    for i in range(n_events):
+        start = now + timedelta(hours=rng.randint(-3 * 8760, 3 * 8760))
+        events.append({
+            "title": f"event {i}",
+            "start_time": start.isoformat(),
+            "end_time": (start + timedelta(hours=1)).isoformat(),
+        })
+    for i in range(n_series):
+        # Series that began up to ten years ago
+        start = (now - timedelta(days=rng.randint(0, 3650))).replace(minute=0, second=0, microsecond=0)
+        events.append(prepare_event({
+            "title": f"series {i}",
+            "start_time": start.isoformat(),
+            "end_time": (start + timedelta(minutes=30)).isoformat(),
+            "recurrence": RULES[i % len(RULES)],
+        }))
+    return events
+
+
+async def naive_window(storage, user_id: str, start: datetime, end, limit: int) -> list:
+    """Load everything, keep one-offs in range, expand every series from its first start"""
+    rows = await storage.select("events", user_id, EVENT_COLUMNS)
+    found = []
+    for row in rows:
+        if row.get("recurrence"):
+            for occurrence in Recurrence.from_row(row["start_time"], row["recurrence"]).occurrences():
+                if end is not None and occurrence >= end:
+                    break
+                if occurrence >= start:
+                    found.append((occurrence, row))
+                    if end is None and len(found) > 10 * limit:
+                        break
+        else:
+            occurrence = parse_time(row["start_time"])
+            if occurrence >= start and (end is None or occurrence < end):
+                found.append((occurrence, row))
+    found.sort(key=lambda item: item[0])
+    return found[:limit]
+
+
+async def timed(fn, repeat: int = REPEAT) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+async def main() -> None:
+    now = datetime.now(timezone.utc)
+    views = {
+        "day": (now, now + timedelta(days=1), 200),
+        "week": (now, now + timedelta(days=7), 200),
+        "month": (now, now + timedelta(days=31), 1000),
+        "next 20": (now, None, 20),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(os.path.join(tmp, "bench_events.db"))
+        await storage.open()
+        print(f"{'events':>7} {'series':>7} {'view':>8} {'found':>6} {'cold ms':>8} {'cached ms':>10} {'naive ms':>9}")
+        for n_events, n_series in ACCOUNTS:
+            user_id = f"user-{n_events}"
+            await storage.insert("events", user_id, make_events(n_events, n_series, now))
+            for view, (start, end, limit) in views.items():
+                engine = EventQueryEngine()
+
+                async def query():
+                    if end is None:
+                        return await engine.upcoming(storage, user_id, limit, now=start)
+                    return await engine.window(storage, user_id, start, end, limit)
+
+                async def cold():
+                    engine.invalidate(user_id)
+                    await query()
+
+                found = len((await query())["occurrences"])
+                cold_ms = await timed(cold)
+                cached_ms = await timed(query)
+                naive_ms = await timed(lambda: naive_window(storage, user_id, start, end, limit), repeat=5)
+                print(f"{n_events:>7} {n_series:>7} {view:>8} {found:>6} {cold_ms:>8.2f} {cached_ms:>10.3f} {naive_ms:>9.1f}")
+        await storage.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
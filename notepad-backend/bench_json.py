@@ -0,0 +1,93 @@
+# bench_json.py
+# Run:  python bench_json.py
+# Cost of turning a page of notes into a response body: the old path
+# (jsonable_encoder + json.dumps, then a second json.dumps for the ETag),
+# FastAPI's validated response_model path, and the one-pass dumps() used
+# by the list endpoints now. Then the payload size with each encoding.
+
+import hashlib
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from compression import brotli, compress
+from http_cache import compute_etag
+from main import Note
+from responses import dumps, orjson
+
+SIZES = [1_000, 10_000]
+REPEAT = 5
+WORDS = "meeting call report budget plan review client draft follow up invoice agenda notes".split()
+
+
+def make_notes(n: int) -> list:
+    rng = random.Random(n)
+    return [
+        {
+            "id": i,
+            "title": f"Note {i}: " + " ".join(rng.choices(WORDS, k=4)),
+            "content": " ".join(rng.choices(WORDS, k=rng.randint(20, 300))),
+            "status": rng.choice(["Pending", "In Progress", "Done"]),
+            "created_at": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T09:30:00+00:00",
+            "updated_at": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T09:30:00+00:00",
+            "user_id": "5f0c7a52-6f0b-4a53-9a5e-2a1b1c8e4d10",
+        }
+        for i in range(n)
+    ]
+
+
+def before(rows: list) -> bytes:
+    body = json.dumps(jsonable_encoder(rows), ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+    etag_source = json.dumps([rows, None], sort_keys=True, separators=(",", ":"), default=str)
+    hashlib.sha256(etag_source.encode()).hexdigest()
+    return body
+
+
+def typed(adapter: TypeAdapter, rows: list) -> bytes:
+    return adapter.dump_json(adapter.validate_python(rows), exclude_unset=True)
+
+
+def after(rows: list) -> bytes:
+    body = dumps(rows)
+    compute_etag(body, b"")
+    return body
+
+
+def timed(fn, *args) -> tuple:
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        result = fn(*args)
+    return (time.perf_counter() - start) / REPEAT * 1000, result
+
+
+def main() -> None:
+    adapter = TypeAdapter(list[Note])
+    print(f"JSON encoder: {'orjson' if orjson is not None else 'json (install orjson for the fast path)'}")
+    print(f"{'notes':>7} {'before ms':>10} {'typed ms':>9} {'after ms':>9} {'speedup':>8}")
+    for n in SIZES:
+        rows = make_notes(n)
+        before_ms, _ = timed(before, rows)
+        typed_ms, _ = timed(typed, adapter, rows)
+        after_ms, _ = timed(after, rows)
+        print(f"{n:>7} {before_ms:>10.1f} {typed_ms:>9.1f} {after_ms:>9.1f} {before_ms / after_ms:>7.1f}x")
+
+    encodings = ["gzip"] + (["br"] if brotli is not None else [])
+    print()
+    print(f"{'notes':>7} {'identity KB':>12} " + " ".join(f"{e + ' KB':>9} {e + ' ms':>8}" for e in encodings))
+    for n in SIZES:
+        body = dumps(make_notes(n))
+        cells = []
+        for encoding in encodings:
+            ms, compressed = timed(compress, body, encoding)
+            cells.append(f"{len(compressed) / 1024:>9.1f} {ms:>8.1f}")
+        print(f"{n:>7} {len(body) / 1024:>12.1f} " + " ".join(cells))
+    if brotli is None:
+        print("(brotli not installed; pip install brotli to compare)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,554 @@
+# bench_load.py
+# Run:  python bench_load.py [--mix mixed] [--concurrency 1,8,32] [--duration 10]
+# Load and latency benchmark for the whole API. Starts local stand-ins for
+# Supabase (PostgREST + auth) and Pollinations with configurable latency and
+# error injection, runs the app against them with uvicorn, drives a traffic
+# mix at fixed concurrency levels and reports per-endpoint p50/p95/p99,
+# throughput and upstream calls. Results are saved as JSON; pass
+# --compare <old.json> to diff against an earlier run (e.g. another commit).
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import uvicorn
+from jose import jwt
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+_VALUE = r'("(?:[^"\\]|\\.)*"|[^,()]*)'
+KEYSET_FILTER = re.compile(rf"^\(?(\w+)\.(gt|lt)\.{_VALUE},and\(\w+\.eq\.{_VALUE},id\.(?:gt|lt)\.{_VALUE}\)\)?$")
+ID_FILTER = re.compile(rf"^\(?id\.(gt|lt)\.{_VALUE}\)?$")
+JWT_SECRET = "bench-jwt-secret"
+
+# Relative weights per operation
+MIXES = {
+    "crud": {
+        "GET /notes": 40, "POST /notes": 12, "PUT /notes/{id}": 10, "DELETE /notes/{id}": 4,
+        "GET /events": 20, "POST /events": 8, "GET /sync": 6,
+    },
+    "chat": {"POST /chat": 1},
+    "mixed": {
+        "GET /notes": 30, "POST /notes": 8, "PUT /notes/{id}": 6, "DELETE /notes/{id}": 3,
+        "GET /events": 15, "POST /events": 5, "GET /sync": 5, "POST /chat": 28,
+    },
+}
+
+CHAT_MESSAGES = [
+    "what do I have tomorrow?", "summarize my notes", "any meetings this week?",
+    "remind me what the groceries note says", "what's on friday", "list my pending tasks",
+    "when is the dentist?", "what did I write about the project?", "hello", "plan my afternoon",
+]
+
+
+def percentile(sorted_values: list, q: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_revision() -> dict:
+    def run(*cmd):
+        try:
+            return subprocess.run(cmd, cwd=HERE, capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": run("git", "rev-parse", "--short", "HEAD") or None,
+            "dirty": bool(run("git", "status", "--porcelain", "--untracked-files=no"))}
+
+
+def make_token(user_id: str) -> str:
+    return jwt.encode(
+        {"sub": user_id, "aud": "authenticated", "role": "authenticated", "email": f"{user_id}@bench.local",
+         "exp": int(time.time()) + 24 * 3600},
+        JWT_SECRET, algorithm="HS256",
+    )
+
+
+# -----------------------
+# Fake upstreams
+# -----------------------
+
+class FakeUpstreams:
+    """
+    Just enough PostgREST, GoTrue and Pollinations for the app's queries:
+    eq/in/gte/lt/lte/gt filters, the keyset or=() filter from
+    pagination.keyset_filter, order, limit and column selection.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.rows = {}  # table -> user_id -> [row]
+        self.next_id = 1
+        self.calls = {}  # "supabase GET notes" -> count
+        self.rng = random.Random(args.seed)
+        self.app = Starlette(routes=[
+            Route("/auth/v1/health", self.health, methods=["GET"]),
+            Route("/auth/v1/user", self.user, methods=["GET"]),
+            Route("/rest/v1/{table}", self.rest, methods=["GET", "POST", "PATCH", "DELETE"]),
+            Route("/ai", self.ai, methods=["POST"]),
+        ])
+
+    def reset_calls(self):
+        self.calls = {}
+
+    async def _inject(self, kind: str, label: str):
+        """Sleep for the configured latency; returns an error response if this call should fail"""
+        self.calls[label] = self.calls.get(label, 0) + 1
+        latency = self.args.ai_latency if kind == "ai" else self.args.supabase_latency
+        if latency > 0:
+            jitter = self.args.jitter
+            await asyncio.sleep(latency / 1000 * self.rng.uniform(1 - jitter, 1 + jitter))
+        error_rate = self.args.ai_errors if kind == "ai" else self.args.supabase_errors
+        if error_rate > 0 and self.rng.random() < error_rate:
+            return JSONResponse({"message": "injected failure"}, status_code=self.args.error_status)
+        return None
+
+    async def health(self, request: Request):
+        return JSONResponse({"name": "GoTrue"})
+
+    async def user(self, request: Request):
+        failure = await self._inject("supabase", "auth GET user")
+        if failure:
+            return failure
+        token = request.headers.get("authorization", "")[7:]
+        try:
+            claims = jwt.get_unverified_claims(token)
+        except Exception:
+            return JSONResponse({"message": "invalid token"}, status_code=401)
+        return JSONResponse({"id": claims["sub"], "email": claims.get("email")})
+
+    async def ai(self, request: Request):
+        failure = await self._inject("ai", "ai POST")
+        if failure:
+            return failure
+        prompt = (await request.body()).decode()
+        if self.rng.random() < self.args.ai_action_rate:
+            return PlainTextResponse(f"[ACTION:NOTE|Bench note|Saved from chat {self.next_id}]")
+        return PlainTextResponse(f"Here is a helpful answer about your {len(prompt) % 7 + 1} items.")
+
+    def _user_rows(self, table: str, user_id: str) -> list:
+        return self.rows.setdefault(table, {}).setdefault(user_id, [])
+
+    async def rest(self, request: Request):
+        table = request.path_params["table"]
+        failure = await self._inject("supabase", f"supabase {request.method} {table}")
+        if failure:
+            return failure
+
+        params = list(request.query_params.multi_items())
+        user_id = None
+        filters = []
+        for key, value in params:
+            if key in ("select", "order", "limit", "offset", "columns"):
+                continue
+            if key == "or":
+                filters.append(self._keyset(value))
+                continue
+            op, _, operand = value.partition(".")
+            if key == "user_id" and op == "eq":
+                user_id = operand
+            else:
+                filters.append((key, op, operand))
+        now = datetime.now(timezone.utc).isoformat()
+
+        if request.method == "POST":
+            body = json.loads(await request.body())
+            created = []
+            for row in body if isinstance(body, list) else [body]:
+                stored = {"id": self.next_id, "created_at": now, "updated_at": now, **row}
+                if table == "notes":
+                    stored.setdefault("status", "Pending")
+                self.next_id += 1
+                self._user_rows(table, row["user_id"]).append(stored)
+                created.append(stored)
+            return JSONResponse(created, status_code=201)
+
+        rows = self._user_rows(table, user_id) if user_id else []
+        matched = [row for row in rows if all(f(row) if callable(f) else self._match(row, *f) for f in filters)]
+
+        if request.method == "GET":
+            query = dict(params)
+            for part in reversed((query.get("order") or "").split(",")):
+                if part:
+                    column, _, direction = part.partition(".")
+                    matched.sort(key=lambda row: self._sort_value(row.get(column)), reverse=direction.startswith("desc"))
+            matched = matched[int(query.get("offset", 0)):]
+            if "limit" in query:
+                matched = matched[:int(query["limit"])]
+            columns = query.get("select", "*")
+            if columns != "*":
+                names = columns.split(",")
+                matched = [{c: row.get(c) for c in names} for row in matched]
+            return JSONResponse(matched)
+
+        if request.method == "PATCH":
+            values = json.loads(await request.body())
+            for row in matched:
+                row.update(values, updated_at=now)
+            return JSONResponse(matched)
+
+        # DELETE: the real database writes tombstones from a trigger
+        gone = {id(row) for row in matched}
+        rows[:] = [row for row in rows if id(row) not in gone]
+        for row in matched:
+            self._user_rows("deleted_records", user_id).append({
+                "id": self.next_id, "table_name": table, "row_id": str(row["id"]),
+                "user_id": user_id, "deleted_at": now,
+            })
+            self.next_id += 1
+        return JSONResponse(matched)
+
+    @staticmethod
+    def _sort_value(value):
+        return (0, value, "") if isinstance(value, int) else (1, 0, "" if value is None else str(value))
+
+    @staticmethod
+    def _unquote(value: str) -> str:
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            return value[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+        return value
+
+    def _keyset(self, expression: str):
+        """Row predicate for `col > v OR (col = v AND id > i)` (or the descending form)"""
+        match = KEYSET_FILTER.match(expression)
+        if match:
+            column, op, value, _, row_id = match.groups()
+            value, row_id = self._unquote(value), self._unquote(row_id)
+        else:
+            match = ID_FILTER.match(expression)
+            if not match:
+                raise ValueError(f"Unsupported or= filter: {expression}")
+            column, (op, row_id), value = None, match.groups(), None
+            row_id = self._unquote(row_id)
+        sign = 1 if op == "gt" else -1
+
+        def after(row):
+            if column is not None:
+                current = str(row.get(column) or "")
+                if current != value:
+                    return (current > value) == (sign > 0)
+            current_id = row["id"]
+            target = int(row_id) if isinstance(current_id, int) and row_id.lstrip("-").isdigit() else row_id
+            if current_id == target:
+                return False
+            return (current_id > target) == (sign > 0)
+        return after
+
+    @staticmethod
+    def _match(row: dict, column: str, op: str, operand: str) -> bool:
+        value = row.get(column)
+        if op == "in":
+            return str(value) in {v.strip('"') for v in operand.strip("()").split(",")}
+        if op == "eq":
+            return str(value) == operand
+        if value is None:
+            return False
+        value = str(value)
+        if op == "gte":
+            return value >= operand
+        if op == "gt":
+            return value > operand
+        if op == "lt":
+            return value < operand
+        if op == "lte":
+            return value <= operand
+        return True
+
+
+# -----------------------
+# App under test
+# -----------------------
+
+def start_app(args, upstream_url: str, port: int, state_dir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "ENV_FILE": os.devnull,  # never pick up real credentials from .env
+        # Local state starts empty every run and stays out of the source tree
+        "SEARCH_INDEX_PATH": os.path.join(state_dir, "notes_search.db"),
+        "CHAT_JOBS_PATH": os.path.join(state_dir, "chat_jobs.db"),
+        "CONVERSATION_PATH": os.path.join(state_dir, "conversations.db"),
+        "SQLITE_PATH": os.path.join(state_dir, "notes.db"),
+        "SUPABASE_URL": upstream_url,
+        "SUPABASE_KEY": jwt.encode({"role": "anon"}, "bench-anon", algorithm="HS256"),
+        "SUPABASE_JWT_SECRET": JWT_SECRET,
+        "AUTH_MODE": args.auth,
+        "POLLINATIONS_API_URL": upstream_url + "/ai",
+        "AI_PROVIDERS": "pollinations",
+        "LOG_LEVEL": "WARNING",
+        # Bench users send far more than a person would; measure latency, not 429s
+        "RATE_LIMIT_CHAT": "off",
+        "RATE_LIMIT_WRITE": "off",
+    }
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=HERE, env=env,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, proc: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"App exited during startup (code {proc.returncode})")
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("App did not become ready in time")
+
+
+# -----------------------
+# Load driver
+# -----------------------
+
+class Workload:
+    """Per-user tokens and known row ids, so updates and deletes hit real rows"""
+
+    def __init__(self, users: int, seed: int):
+        self.rng = random.Random(seed)
+        self.users = [f"bench-user-{i}" for i in range(users)]
+        self.headers = {u: {"Authorization": f"Bearer {make_token(u)}"} for u in self.users}
+        self.note_ids = {u: [] for u in self.users}
+        self.sync_cursors = {}
+
+    def event_times(self):
+        start = datetime.now(timezone.utc) + timedelta(hours=self.rng.randint(1, 24 * 14))
+        return start.isoformat(), (start + timedelta(hours=1)).isoformat()
+
+    async def run(self, client: httpx.AsyncClient, op: str, user: str) -> int:
+        headers = self.headers[user]
+        ids = self.note_ids[user]
+        if op == "GET /notes":
+            r = await client.get("/notes", params={"limit": 50}, headers=headers)
+        elif op == "POST /notes" or (op in ("PUT /notes/{id}", "DELETE /notes/{id}") and not ids):
+            r = await client.post("/notes", json={"title": "Bench", "content": f"note {self.rng.random():.6f}"},
+                                  headers=headers)
+            if r.status_code == 201:
+                ids.append(r.json()["id"])
+        elif op == "PUT /notes/{id}":
+            r = await client.put(f"/notes/{self.rng.choice(ids)}", json={"content": "edited"}, headers=headers)
+        elif op == "DELETE /notes/{id}":
+            r = await client.delete(f"/notes/{ids.pop(self.rng.randrange(len(ids)))}", headers=headers)
+        elif op == "GET /events":
+            r = await client.get("/events", headers=headers)
+        elif op == "POST /events":
+            start, end = self.event_times()
+            r = await client.post("/events", data={"title": "Bench event", "start_time": start, "end_time": end},
+                                  headers=headers)
+        elif op == "GET /sync":
+            since = self.sync_cursors.get(user)
+            r = await client.get("/sync", params={"since": since} if since else None, headers=headers)
+            if r.status_code == 200:
+                self.sync_cursors[user] = r.json()["cursor"]
+        elif op == "POST /chat":
+            r = await client.post("/chat", data={"message": self.rng.choice(CHAT_MESSAGES)}, headers=headers)
+        else:
+            raise ValueError(f"Unknown operation '{op}'")
+        return r.status_code
+
+    async def seed(self, client: httpx.AsyncClient, notes: int, events: int):
+        for user in self.users:
+            for _ in range(notes):
+                await self.run(client, "POST /notes", user)
+            for _ in range(events):
+                await self.run(client, "POST /events", user)
+
+
+async def run_level(client, workload: Workload, mix: dict, concurrency: int, duration: float, warmup: float) -> dict:
+    ops, weights = list(mix), list(mix.values())
+    samples = {op: [] for op in ops}  # op -> [(latency_s, ok)]
+    failures = {op: 0 for op in ops}  # transport errors, timeouts
+    record_from = time.monotonic() + warmup
+    stop_at = record_from + duration
+
+    async def worker():
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                return
+            op = workload.rng.choices(ops, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = await workload.run(client, op, workload.rng.choice(workload.users))
+                ok = status < 400
+            except httpx.HTTPError:
+                status, ok = None, False
+            if now >= record_from:
+                samples[op].append((time.perf_counter() - start, ok))
+                if status is None:
+                    failures[op] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    endpoints = {}
+    for op in ops:
+        latencies = sorted(s[0] for s in samples[op])
+        if not latencies:
+            continue
+        endpoints[op] = {
+            "requests": len(latencies),
+            "errors": sum(1 for s in samples[op] if not s[1]),
+            "transport_errors": failures[op],
+            "rps": round(len(latencies) / duration, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "rps": round(total / duration, 2),
+        "endpoints": endpoints,
+    }
+
+
+def print_level(level: dict):
+    print(f"\nconcurrency={level['concurrency']}  requests={level['requests']}  "
+          f"rps={level['rps']}  errors={level['errors']}")
+    print(f"  {'endpoint':<22}{'reqs':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for op, e in level["endpoints"].items():
+        print(f"  {op:<22}{e['requests']:>7}{e['rps']:>9}{e['p50_ms']:>10}{e['p95_ms']:>10}{e['p99_ms']:>10}"
+              f"{e['errors']:>8}")
+    per_request = level["upstream_calls_per_request"]
+    print("  upstream calls: " + ", ".join(
+        f"{label}={count} ({per_request[label]}/req)" for label, count in sorted(level["upstream_calls"].items())))
+
+
+def print_comparison(old: dict, new: dict):
+    print(f"\nvs {old.get('git', {}).get('commit')} ({old.get('started_at')}):")
+    old_levels = {level["concurrency"]: level for level in old.get("levels", [])}
+    if not any(level["concurrency"] in old_levels for level in new["levels"]):
+        print("  no concurrency levels in common")
+    for level in new["levels"]:
+        before = old_levels.get(level["concurrency"])
+        if before is None:
+            continue
+        print(f"  concurrency={level['concurrency']}  rps {before['rps']} -> {level['rps']}")
+        for op, e in level["endpoints"].items():
+            prev = before["endpoints"].get(op)
+            if prev:
+                change = (e["p95_ms"] - prev["p95_ms"]) / prev["p95_ms"] * 100 if prev["p95_ms"] else 0.0
+                print(f"    {op:<22} p95 {prev['p95_ms']:>9} -> {e['p95_ms']:>9} ms ({change:+.1f}%)")
+
+
+async def main(args):
+    mix = MIXES[args.mix]
+    levels = [int(c) for c in args.concurrency.split(",")]
+    upstreams = FakeUpstreams(args)
+    upstream_port, app_port = free_port(), free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+
+    server = uvicorn.Server(uvicorn.Config(upstreams.app, host="127.0.0.1", port=upstream_port,
+                                           log_level="warning", access_log=False))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    state_dir = tempfile.TemporaryDirectory(prefix="bench_load_")
+    proc = start_app(args, upstream_url, app_port, state_dir.name)
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    results = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "levels": [],
+    }
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", limits=limits, timeout=60) as client:
+            await wait_ready(client, proc)
+            workload = Workload(args.users, args.seed)
+            await workload.seed(client, args.seed_notes, args.seed_events)
+            print(f"mix={args.mix}  users={args.users}  supabase={args.supabase_latency}ms  "
+                  f"ai={args.ai_latency}ms  auth={args.auth}  git={results['git']['commit']}")
+
+            for concurrency in levels:
+                upstreams.reset_calls()
+                level = await run_level(client, workload, mix, concurrency, args.duration, args.warmup)
+                # Counted over warm-up + measured window, so scale to the measured share
+                scale = args.duration / (args.duration + args.warmup)
+                calls = {label: round(count * scale) for label, count in upstreams.calls.items()}
+                level["upstream_calls"] = calls
+                level["upstream_calls_per_request"] = {
+                    label: round(count / level["requests"], 3) if level["requests"] else 0.0
+                    for label, count in calls.items()
+                }
+                results["levels"].append(level)
+                print_level(level)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        server.should_exit = True
+        await server_task
+        state_dir.cleanup()
+
+    out = args.out or os.path.join(
+        HERE, "bench_results",
+        f"load-{args.mix}-{results['git']['commit'] or 'nogit'}-{datetime.now():%Y%m%d-%H%M%S}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load and latency benchmark against local fake upstreams")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before each level")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seed-notes", type=int, default=30, help="notes created per user before the run")
+    parser.add_argument("--seed-events", type=int, default=10, help="events created per user before the run")
+    parser.add_argument("--supabase-latency", type=float, default=15.0, help="ms per PostgREST/auth call")
+    parser.add_argument("--ai-latency", type=float, default=400.0, help="ms per AI call")
+    parser.add_argument("--jitter", type=float, default=0.3, help="latency varies uniformly by +/- this fraction")
+    parser.add_argument("--supabase-errors", type=float, default=0.0, help="fraction of Supabase calls that 503")
+    parser.add_argument("--ai-errors", type=float, default=0.0, help="fraction of AI calls that 503")
+    parser.add_argument("--error-status", type=int, default=503,
+                        help="status for injected failures (postgrest retries GETs on 503/520)")
+    parser.add_argument("--ai-action-rate", type=float, default=0.1, help="fraction of AI replies that are NOTE actions")
+    parser.add_argument("--auth", choices=("local", "remote"), default="local", help="app AUTH_MODE")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. STORAGE_BACKEND=sqlite")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="results file (default bench_results/load-<mix>-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    asyncio.run(main(parser.parse_args()))
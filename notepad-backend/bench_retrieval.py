@@ -0,0 +1,84 @@
+# bench_retrieval.py
+# Run:  python bench_retrieval.py
+# Measures chat-context retrieval cost for large accounts: building the
+# per-user index, incremental note writes, and per-request retrieval.
+
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from context_cache import UserContext
+from prompt_builder import PromptBuilder
+from retrieval import retrieve
+
+VOCABULARY = [f"word{i}" for i in range(20000)]
+QUERIES = [
+    "what did I write about word42",
+    "remind me about word1234 and word77",
+    "when is my next meeting",
+    "summarize word9 word19 word99 word999",
+]
+
+
+def make_account(n_notes: int, n_events: int):
+    rng = random.Random(n_notes)
+    now = datetime.now(timezone.utc)
+    notes = [
+        {
+            "id": i,
+            "title": " ".join(rng.choices(VOCABULARY, k=4)),
+            "content": " ".join(rng.choices(VOCABULARY, k=80)),
+        }
+        for i in range(n_notes)
+    ]
+    events = [
+        {
+            "id": i,
+            "title": " ".join(rng.choices(VOCABULARY, k=3)),
+            "start_time": (now + timedelta(hours=rng.randint(-5000, 5000))).isoformat(),
+        }
+        for i in range(n_events)
+    ]
+    return notes, events
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    print(f"{'notes':>8} {'events':>7} {'build ms':>9} {'write ms':>9} {'retrieve ms':>12}")
+    for n_notes, n_events in [(1_000, 200), (10_000, 1_000), (50_000, 5_000)]:
+        notes, events = make_account(n_notes, n_events)
+
+        start = time.perf_counter()
+        ctx = UserContext(notes, events)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        rng = random.Random(0)
+        write_ms = timed(
+            lambda: ctx.put_note({
+                "id": rng.randrange(n_notes),
+                "title": " ".join(rng.choices(VOCABULARY, k=4)),
+                "content": " ".join(rng.choices(VOCABULARY, k=80)),
+            }),
+            repeat=500,
+        )
+
+        builder = PromptBuilder()
+        queries = iter(QUERIES * 100)
+
+        def one_request():
+            query = next(queries)
+            builder.build(query, *retrieve(ctx, query))
+
+        retrieve_ms = timed(one_request, repeat=200)
+
+        print(f"{n_notes:>8} {n_events:>7} {build_ms:>9.1f} {write_ms:>9.3f} {retrieve_ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# bench_time_parse.py
+# Run:  python bench_time_parse.py
+# Per-parse cost of the phrases the AI hands to the EVENT action:
+# cold dateparser (import + first parse), steady-state dateparser, and
+# time_parser (fast path + memo + restricted dateparser fallback).
+
+import time
+
+PHRASES = [
+    "tomorrow at 5pm", "next Friday 2pm", "in 2 hours", "5pm", "noon tomorrow",
+    "monday at 9:30 am", "march 3rd 10:30", "the day after tomorrow", "next week",
+    "2026-11-02 14:00",
+]
+REPEAT = 200
+
+
+def per_parse_us(parse, repeat: int = REPEAT) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for phrase in PHRASES:
+            parse(phrase)
+    return (time.perf_counter() - start) / (repeat * len(PHRASES)) * 1_000_000
+
+
+def main() -> None:
+    start = time.perf_counter()
+    import dateparser
+    dateparser.parse(PHRASES[0])
+    print(f"{'dateparser cold (import + first parse)':<42} {(time.perf_counter() - start) * 1000:>10.1f} ms")
+
+    print(f"{'dateparser.parse, all languages':<42} {per_parse_us(dateparser.parse, repeat=20):>10.1f} us/parse")
+
+    from time_parser import TimeParser
+    parser = TimeParser()
+    start = time.perf_counter()
+    parser.warm_up()
+    print(f"{'time_parser warm-up':<42} {(time.perf_counter() - start) * 1000:>10.1f} ms")
+
+    print(f"{'time_parser.parse (fast path + memo)':<42} {per_parse_us(parser.parse):>10.1f} us/parse")
+    print(f"{'  fast path hits / fallback parses':<42} {parser.fast_hits:>6} / {parser.fallback_parses}")
+
+    fresh = TimeParser()
+    print(f"{'time_parser.parse, empty memo':<42} {per_parse_us(fresh.parse, repeat=1):>10.1f} us/parse")
+
+
+if __name__ == "__main__":
+    main()
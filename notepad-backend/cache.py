@@ -0,0 +1,113 @@
+"""
+In-Process Caches
+Thread-safe LRU cache with per-entry TTL and hit/miss counters
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache where every entry also carries its own expiry.
+    Expired entries are dropped lazily on lookup or when making room.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """Lookup that doesn't touch LRU order or the hit/miss counters"""
+        with self._lock:
+            item = self._data.get(key)
+        if item is None or item[0] <= time.monotonic():
+            return default
+        return item[1]
+
+    def set(self, key, value, ttl: float = None):
+        """Store a value. `ttl` overrides the default but is never negative."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class UserScopedCache(TTLCache):
+    """
+    TTLCache whose entries belong to a user, so everything cached for one
+    user can be dropped at once when their data changes.
+    Invalidation scans at most `maxsize` entries, so it stays cheap.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        item = super().get(key)
+        return default if item is None else item[1]
+
+    def set_for_user(self, user_id: str, key, value, ttl: float = None):
+        self.set(key, (user_id, value), ttl=ttl)
+
+    def invalidate_user(self, user_id: str):
+        with self._lock:
+            stale = [k for k, (_, item) in self._data.items() if item[0] == user_id]
+            for key in stale:
+                del self._data[key]
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {**super().stats(), "invalidations": self.invalidations}
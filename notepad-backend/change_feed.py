@@ -0,0 +1,183 @@
+"""
+Change Feed
+In-process fan-out of note and event mutations to each user's open connections
+"""
+
+import asyncio
+import itertools
+import os
+import uuid
+from collections import OrderedDict, deque
+
+from metrics import Counter, Gauge, registry
+
+# Feed Configuration
+FEED_BUFFER_SIZE = int(os.getenv("FEED_BUFFER_SIZE", "256"))  # undelivered changes per connection
+FEED_REPLAY_SIZE = int(os.getenv("FEED_REPLAY_SIZE", "100"))  # recent changes per user, for resume
+FEED_REPLAY_USERS = int(os.getenv("FEED_REPLAY_USERS", "2000"))  # users with a replay log (LRU)
+FEED_HEARTBEAT_S = float(os.getenv("FEED_HEARTBEAT_S", "15"))
+
+connections = registry.register(Gauge("feed_connections", "Open change-feed connections"))
+published = registry.register(Counter("feed_changes_total", "Changes published to the feed", ("table",)))
+dropped = registry.register(Counter("feed_slow_consumers_total", "Connections closed for falling behind"))
+
+
+class _Subscription:
+    def __init__(self, size: int):
+        self.queue = asyncio.Queue(size)
+        self.overflowed = False
+
+    def offer(self, change: dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(change)
+        except asyncio.QueueFull:
+            # Stop buffering; the client resumes from its last cursor and
+            # gets the rest from the replay log
+            self.overflowed = True
+            dropped.inc()
+
+
+class _UserLog:
+    def __init__(self, size: int):
+        self.changes = deque(maxlen=size)
+        self.evicted_through = 0  # seq of the newest change no longer in the log
+
+
+class ChangeHub:
+    """
+    publish() is called from the write paths after a successful write and
+    never blocks: each connection has a bounded buffer, and a connection
+    whose buffer fills up is closed instead of slowing the writer down.
+
+    Cursors are "<process epoch>-<seq>". Resuming replays whatever the user
+    missed from a short per-user log; a cursor from another process (a
+    restart, another worker) or older than the log gets a "reset", meaning
+    the client should refetch its lists once.
+    """
+
+    def __init__(self, buffer_size: int = FEED_BUFFER_SIZE, replay_size: int = FEED_REPLAY_SIZE,
+                 replay_users: int = FEED_REPLAY_USERS, heartbeat: float = FEED_HEARTBEAT_S):
+        self.buffer_size = buffer_size
+        self.replay_size = replay_size
+        self.replay_users = replay_users
+        self.heartbeat = heartbeat
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = itertools.count(1)
+        self._last_seq = 0
+        self._subscribers = {}  # user_id -> set of _Subscription
+        self._logs = OrderedDict()  # user_id -> _UserLog, least recently written first
+        self._forgotten_through = 0  # newest seq in any log dropped to make room
+        self.published = 0
+
+    def cursor(self, seq: int = None) -> str:
+        return f"{self.epoch}-{self._last_seq if seq is None else seq}"
+
+    def _parse_cursor(self, cursor: str):
+        """seq for a cursor issued by this process, else None"""
+        epoch, _, seq = (cursor or "").partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish(self, user_id: str, table: str, upserted: list = (), deleted: list = ()):
+        if not upserted and not deleted:
+            return
+        seq = next(self._seq)
+        self._last_seq = seq
+        change = {
+            "cursor": self.cursor(seq),
+            "seq": seq,
+            "table": table,
+            "upserted": list(upserted),
+            "deleted": [str(row_id) for row_id in deleted],
+        }
+        log = self._logs.get(user_id)
+        if log is None:
+            log = self._logs[user_id] = _UserLog(self.replay_size)
+            if len(self._logs) > self.replay_users:
+                _, oldest = self._logs.popitem(last=False)
+                self._forgotten_through = max(self._forgotten_through, oldest.changes[-1]["seq"])
+        else:
+            self._logs.move_to_end(user_id)
+        if len(log.changes) == log.changes.maxlen:
+            log.evicted_through = log.changes[0]["seq"]
+        log.changes.append(change)
+
+        for subscription in self._subscribers.get(user_id, ()):
+            subscription.offer(change)
+        self.published += 1
+        published.inc(table)
+
+    def _replay(self, user_id: str, after_seq: int):
+        """Changes after `after_seq`, or None if some of them are gone"""
+        log = self._logs.get(user_id)
+        if log is None:
+            # No changes for this user, unless their log was dropped after the cursor
+            return [] if after_seq >= self._forgotten_through else None
+        if after_seq < log.evicted_through:
+            return None
+        return [change for change in log.changes if change["seq"] > after_seq]
+
+    async def stream(self, user_id: str, cursor: str = None):
+        """
+        Yields (kind, payload): ("ready", cursor) first, or ("reset", cursor)
+        when `cursor` can't be resumed; then ("change", change) for each
+        missed change and each new one,
+        ("heartbeat", None) when idle, and a final ("overflow", None) if
+        this connection fell too far behind.
+        """
+        subscription = _Subscription(self.buffer_size)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        connections.inc()
+        try:
+            # Subscribed first, so nothing published during the replay is lost
+            last_seq = self._last_seq
+            backlog = []
+            if cursor:
+                after = self._parse_cursor(cursor)
+                backlog = self._replay(user_id, after) if after is not None else None
+            if backlog is None:
+                yield "reset", self.cursor(last_seq)
+                backlog = []
+            else:
+                # With a backlog to replay, the last replayed change sets the position
+                yield "ready", None if backlog else self.cursor(last_seq)
+            for change in backlog:
+                if change["seq"] <= last_seq:
+                    yield "change", change
+
+            while True:
+                try:
+                    change = await asyncio.wait_for(subscription.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    if subscription.overflowed:
+                        yield "overflow", None
+                        return
+                    yield "heartbeat", None
+                    continue
+                if change["seq"] > last_seq:
+                    yield "change", change
+                if subscription.overflowed and subscription.queue.empty():
+                    yield "overflow", None
+                    return
+        finally:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[user_id]
+            connections.dec()
+
+    def stats(self) -> dict:
+        return {
+            "connections": sum(len(s) for s in self._subscribers.values()),
+            "users_connected": len(self._subscribers),
+            "published": self.published,
+            "cursor": self.cursor(),
+            "replay_logs": len(self._logs),
+        }
+
+
+change_hub = ChangeHub()
@@ -0,0 +1,361 @@
+"""
+Chat Job Queue
+Persistent queue and bounded worker pool for asynchronous /chat requests
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+from fastapi.concurrency import run_in_threadpool
+from metrics import Counter, Gauge, Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+# Queue Configuration
+CHAT_JOBS_PATH = os.getenv(
+    "CHAT_JOBS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_jobs.db"),
+)
+CHAT_JOB_WORKERS = int(os.getenv("CHAT_JOB_WORKERS", "4"))
+CHAT_JOB_QUEUE_MAX = int(os.getenv("CHAT_JOB_QUEUE_MAX", "500"))  # queued jobs, all users
+CHAT_JOB_USER_MAX = int(os.getenv("CHAT_JOB_USER_MAX", "5"))  # queued + running jobs per user
+CHAT_JOB_MAX_ATTEMPTS = int(os.getenv("CHAT_JOB_MAX_ATTEMPTS", "3"))  # starts, counting restarts mid-job
+CHAT_JOB_RETENTION_S = float(os.getenv("CHAT_JOB_RETENTION_S", "3600"))  # finished jobs stay readable this long
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL,
+    reply TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS chat_jobs_status_idx ON chat_jobs (status, created_at);
+"""
+
+_COLUMNS = ("id", "user_id", "message", "status", "reply", "error", "attempts", "created_at", "started_at", "finished_at")
+
+queue_depth = registry.register(Gauge("chat_jobs_queued", "Chat jobs waiting for a worker"))
+jobs_running = registry.register(Gauge("chat_jobs_running", "Chat jobs being processed"))
+jobs_total = registry.register(Counter("chat_jobs_total", "Chat jobs by outcome", ("outcome",)))
+wait_seconds = registry.register(Histogram("chat_job_wait_seconds", "Time from enqueue to a worker picking the job up"))
+run_seconds = registry.register(Histogram("chat_job_run_seconds", "Time a worker spent on a job"))
+
+
+class QueueFull(Exception):
+    """Raised by enqueue(); per_user tells a user's own backlog apart from a full queue"""
+
+    def __init__(self, message: str, retry_after: int, per_user: bool):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.per_user = per_user
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+
+class JobStore:
+    """One SQLite connection guarded by a lock; every call is a short single-row statement"""
+
+    def __init__(self, path: str = CHAT_JOBS_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        if self._conn is not None:
+            return
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def insert(self, job: dict):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO chat_jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                [job[c] for c in _COLUMNS],
+            )
+
+    def update(self, job_id: str, **values):
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE chat_jobs SET {', '.join(f'{c} = ?' for c in values)} WHERE id = ?",
+                [*values.values(), job_id],
+            )
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM chat_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def recover(self, max_attempts: int) -> list:
+        """
+        Jobs left over from the last run, oldest first. Jobs that were
+        mid-flight go back to queued unless they've used up their attempts.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE chat_jobs SET status = 'failed', error = 'Gave up after repeated restarts', "
+                    "finished_at = ? WHERE status = 'running' AND attempts >= ?",
+                    (time.time(), max_attempts),
+                )
+                self._conn.execute("UPDATE chat_jobs SET status = 'queued' WHERE status = 'running'")
+                rows = self._conn.execute(
+                    f"SELECT {', '.join(_COLUMNS)} FROM chat_jobs WHERE status = 'queued' ORDER BY created_at"
+                ).fetchall()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def prune(self, finished_before: float) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM chat_jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (finished_before,),
+            ).rowcount
+
+
+class ChatJobQueue:
+    """
+    Jobs are written to SQLite before enqueue() returns, so a restart picks
+    them back up. Workers take jobs round-robin across users: one user with
+    a long backlog waits behind their own jobs, not in front of everyone
+    else's. Backpressure is a cap on the whole queue plus a cap per user,
+    both rejected up front with a Retry-After estimate.
+    """
+
+    def __init__(self, store: JobStore = None, workers: int = CHAT_JOB_WORKERS,
+                 queue_max: int = CHAT_JOB_QUEUE_MAX, user_max: int = CHAT_JOB_USER_MAX):
+        self.store = store or JobStore()
+        self.workers = workers
+        self.queue_max = queue_max
+        self.user_max = user_max
+        self._runner = None
+        self._tasks = []
+        self._pending = OrderedDict()  # user_id -> deque of job ids, in round-robin order
+        self._jobs = {}  # job id -> job dict, while queued or running
+        self._per_user = {}  # user_id -> queued + running count
+        self._finished = {}  # job id -> asyncio.Event
+        self._cond = None
+        self._queued = 0
+        self._reserved = 0  # enqueues past the limit checks, still being persisted
+        self._running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._avg_run = None  # seconds, moving average for Retry-After
+        registry.add_collector(self._collect)
+
+    def _collect(self):
+        queue_depth.set(value=self._queued)
+        jobs_running.set(value=self._running)
+
+    async def start(self, runner):
+        """runner(user_id, message) -> reply text; called once per job"""
+        if self._tasks:
+            return
+        self._runner = runner
+        self._cond = asyncio.Condition()
+        await run_in_threadpool(self.store.open)
+        pruned = await run_in_threadpool(self.store.prune, time.time() - CHAT_JOB_RETENTION_S)
+        for job in await run_in_threadpool(self.store.recover, CHAT_JOB_MAX_ATTEMPTS):
+            self._push(job)
+        if self._queued or pruned:
+            logger.info("Chat jobs: %s recovered, %s expired", self._queued, pruned)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Jobs still running stay 'running' on disk and are retried at the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._pending.clear()
+        self._jobs.clear()
+        self._per_user.clear()
+        self._queued = self._running = 0
+        await run_in_threadpool(self.store.close)
+
+    def _push(self, job: dict, reserved: bool = False):
+        """`reserved`: enqueue() already counted the job against its user's cap"""
+        self._jobs[job["id"]] = job
+        self._pending.setdefault(job["user_id"], deque()).append(job["id"])
+        if not reserved:
+            self._per_user[job["user_id"]] = self._per_user.get(job["user_id"], 0) + 1
+        self._finished[job["id"]] = asyncio.Event()
+        self._queued += 1
+
+    def _release(self, user_id: str):
+        count = self._per_user.get(user_id, 0) - 1
+        if count > 0:
+            self._per_user[user_id] = count
+        else:
+            self._per_user.pop(user_id, None)
+
+    def _pop_fair(self) -> dict:
+        user_id, ids = next(iter(self._pending.items()))
+        job_id = ids.popleft()
+        if ids:
+            self._pending.move_to_end(user_id)
+        else:
+            del self._pending[user_id]
+        self._queued -= 1
+        return self._jobs[job_id]
+
+    def _retry_after(self) -> int:
+        per_job = self._avg_run or 5.0
+        return max(1, min(60, round(per_job * (self._queued + 1) / max(1, self.workers))))
+
+    async def enqueue(self, user_id: str, message: str) -> dict:
+        if self._cond is None:
+            raise RuntimeError("Chat job queue is not started; is the app started?")
+        if self._per_user.get(user_id, 0) >= self.user_max:
+            self.rejected += 1
+            jobs_total.inc("rejected")
+            raise QueueFull(f"You already have {self.user_max} chats in progress", self._retry_after(), True)
+        if self._queued + self._reserved >= self.queue_max:
+            self.rejected += 1
+            jobs_total.inc("rejected")
+            raise QueueFull("Chat queue is full", self._retry_after(), False)
+
+        # Take the slots before the insert awaits, so a burst can't overshoot the caps
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        self._reserved += 1
+
+        job = {
+            "id": uuid.uuid4().hex, "user_id": user_id, "message": message, "status": "queued",
+            "reply": None, "error": None, "attempts": 0, "created_at": time.time(),
+            "started_at": None, "finished_at": None,
+        }
+        try:
+            await run_in_threadpool(self.store.insert, job)
+        except BaseException:
+            self._release(user_id)
+            raise
+        finally:
+            self._reserved -= 1
+        async with self._cond:
+            self._push(job, reserved=True)
+            self._cond.notify()
+        return self.public(job)
+
+    async def get(self, job_id: str, user_id: str):
+        """The job as the API shows it, or None if it doesn't exist or isn't this user's"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = await run_in_threadpool(self.store.get, job_id)
+        if job is None or job["user_id"] != user_id:
+            return None
+        return self.public(job)
+
+    async def wait(self, job_id: str, timeout: float) -> bool:
+        """Wait until the job finishes; False on timeout. Finished or unknown jobs return at once."""
+        event = self._finished.get(job_id)
+        if event is None:
+            return True
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    @staticmethod
+    def public(job: dict) -> dict:
+        return {
+            "id": job["id"],
+            "status": job["status"],
+            "reply": job["reply"],
+            "error": job["error"],
+            "created_at": _iso(job["created_at"]),
+            "started_at": _iso(job["started_at"]),
+            "finished_at": _iso(job["finished_at"]),
+        }
+
+    async def _work(self):
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: self._pending)
+                job = self._pop_fair()
+            await self._run(job)
+
+    async def _persist(self, job_id: str, **values):
+        # The in-memory state is what callers see first; a failed write only
+        # risks re-running the job after a restart
+        try:
+            await run_in_threadpool(self.store.update, job_id, **values)
+        except sqlite3.Error as e:
+            logger.warning("Could not save chat job %s: %s", job_id, e)
+
+    async def _run(self, job: dict):
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        job["attempts"] += 1
+        wait_seconds.observe(max(0.0, job["started_at"] - job["created_at"]))
+        await self._persist(job["id"], status="running", started_at=job["started_at"], attempts=job["attempts"])
+
+        self._running += 1
+        try:
+            job["reply"] = await self._runner(job["user_id"], job["message"])
+            job["status"] = "done"
+            self.completed += 1
+        except Exception as e:
+            logger.exception("Chat job %s failed: %s", job["id"], e)
+            job["status"] = "failed"
+            job["error"] = "Something went wrong while answering; please try again."
+            self.failed += 1
+        finally:
+            self._running -= 1
+
+        job["finished_at"] = time.time()
+        elapsed = job["finished_at"] - job["started_at"]
+        run_seconds.observe(elapsed)
+        self._avg_run = elapsed if self._avg_run is None else 0.8 * self._avg_run + 0.2 * elapsed
+        jobs_total.inc(job["status"])
+        await self._persist(job["id"], status=job["status"], reply=job["reply"], error=job["error"],
+                            finished_at=job["finished_at"])
+
+        self._jobs.pop(job["id"], None)
+        self._release(job["user_id"])
+        self._finished.pop(job["id"]).set()
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queued,
+            "running": self._running,
+            "users_waiting": len(self._pending),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_run_ms": round(self._avg_run * 1000, 1) if self._avg_run is not None else None,
+        }
+
+
+chat_jobs = ChatJobQueue()
@@ -0,0 +1,136 @@
+"""
+Response Compression
+Negotiated brotli/gzip for response bodies above a size threshold
+"""
+
+import gzip
+import os
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from metrics import Counter, registry
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+# Compression Configuration
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # bytes; smaller bodies go out as-is
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_OFFLOAD_SIZE = int(os.getenv("COMPRESSION_OFFLOAD_SIZE", "262144"))  # compress in a thread from here
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv", "application/javascript")
+
+compressed_responses = registry.register(Counter("http_compressed_responses_total", "Compressed responses by encoding", ("encoding",)))
+bytes_saved = registry.register(Counter("http_compression_saved_bytes_total", "Bytes saved by compression", ("encoding",)))
+
+
+def negotiate(accept_encoding: str, supported: tuple) -> str:
+    """
+    The supported encoding the client ranks highest in Accept-Encoding,
+    earlier entries of `supported` winning ties; None if it accepts none
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            weights[name] = q
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = COMPRESSION_GZIP_LEVEL,
+             brotli_quality: int = COMPRESSION_BROTLI_QUALITY) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    Plain ASGI middleware. Only complete bodies are compressed: streaming
+    responses (SSE, chat streams) pass through untouched so each chunk
+    still reaches the client as soon as it is sent. A compressed response
+    gets a weak ETag, since its bytes differ from the identity encoding.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE,
+                 offload_size: int = COMPRESSION_OFFLOAD_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message  # held until the body shows whether it can be compressed
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            passthrough = True
+            headers = MutableHeaders(raw=list(start.get("headers", [])))
+            start["headers"] = headers.raw
+            if "content-encoding" in headers:
+                await send(start)
+                await send(message)
+                return
+            media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+            if media_type in COMPRESSIBLE_TYPES:
+                headers.add_vary_header("Accept-Encoding")
+
+            body = message.get("body", b"")
+            if (encoding is None or message.get("more_body") or media_type not in COMPRESSIBLE_TYPES
+                    or len(body) < self.minimum_size):
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) >= self.offload_size:
+                compressed = await run_in_threadpool(compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+            if len(compressed) >= len(body):
+                await send(start)
+                await send(message)
+                return
+
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            compressed_responses.inc(encoding)
+            bytes_saved.inc(encoding, amount=len(body) - len(compressed))
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,56 @@
+"""
+Configuration
+Loads the .env file exactly once and sets up logging; modules read their
+settings with os.getenv
+"""
+
+import json
+import logging
+import os
+from dotenv import find_dotenv, load_dotenv
+
+# Nearest .env from this directory upwards, unless ENV_FILE points elsewhere.
+# Real environment variables win over the file.
+ENV_FILE = os.getenv("ENV_FILE") or find_dotenv()
+load_dotenv(ENV_FILE, override=False)
+
+# Logging Configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # text or json
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed with extra={...} become keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RESERVED})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Idempotent; uvicorn keeps its own handlers for access logs"""
+    root = logging.getLogger()
+    if getattr(root, "_notepad_configured", False):
+        return
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(level)
+    root._notepad_configured = True
+
+
+configure_logging()
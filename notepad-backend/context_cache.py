@@ -0,0 +1,140 @@
+"""
+Chat Context Cache
+Per-user notes/events snapshot for /chat, kept current by the CRUD endpoints
+"""
+
+import os
+import threading
+from cache import TTLCache
+from retrieval import BM25Index, EventIndex
+
+# Columns /chat needs; ids are kept so writes can patch rows in place
+NOTE_COLUMNS = "id,title,content"
+EVENT_COLUMNS = "id,title,start_time,recurrence"
+
+
+class UserContext:
+    """
+    One user's notes and events, keyed by row id (insertion ordered),
+    plus retrieval indexes that are kept in step with them
+    """
+
+    def __init__(self, notes: list, events: list):
+        self.notes = {}
+        self.events = {}
+        self.note_index = BM25Index()
+        self.event_index = EventIndex()
+        for note in notes:
+            self.put_note(note)
+        for event in events:
+            self.put_event(event)
+
+    def put_note(self, note: dict):
+        key = str(note.get("id"))
+        # Re-inserting moves the note to the end, so order tracks recency
+        self.notes.pop(key, None)
+        self.notes[key] = note
+        self.note_index.add(key, note.get("title"), note.get("content"))
+
+    def drop_note(self, note_id):
+        key = str(note_id)
+        self.notes.pop(key, None)
+        self.note_index.remove(key)
+
+    def put_event(self, event: dict):
+        key = str(event.get("id"))
+        self.events[key] = event
+        self.event_index.add(key, event)
+
+    def drop_event(self, event_id):
+        key = str(event_id)
+        self.events.pop(key, None)
+        self.event_index.remove(key)
+
+
+def _project(row: dict, columns: str) -> dict:
+    return {c: row.get(c) for c in columns.split(",")}
+
+
+class ContextCache:
+    """
+    LRU over users. Writes update a cached user in place (or drop it when
+    the change can't be applied); users that aren't cached are ignored.
+    The TTL only guards against writes made outside this process.
+
+    Every write bumps the user's generation. A fetch reads it before
+    querying and passes it to put(); if a write landed in between, the
+    fetched snapshot may predate it and is returned without being cached.
+    """
+
+    def __init__(self, max_users: int = 1000, ttl: float = 300.0):
+        self._cache = TTLCache(maxsize=max_users, ttl=ttl)
+        self._generations = {}  # user id -> writes seen
+        self._lock = threading.Lock()  # put() runs in a worker thread
+        self.stale_puts = 0
+
+    def get(self, user_id: str):
+        return self._cache.get(user_id)
+
+    def generation(self, user_id: str) -> int:
+        return self._generations.get(user_id, 0)
+
+    def written(self, user_id: str):
+        """Call on every write to the user's notes or events"""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def put(self, user_id: str, notes: list, events: list, generation: int = None) -> UserContext:
+        ctx = UserContext(notes, events)
+        with self._lock:
+            if generation is not None and generation != self.generation(user_id):
+                self.stale_puts += 1
+                return ctx
+            self._cache.set(user_id, ctx)
+        return ctx
+
+    def invalidate(self, user_id: str):
+        self._cache.pop(user_id)
+
+    def notes_upserted(self, user_id: str, rows: list):
+        ctx = self._cache.peek(user_id)
+        if ctx is None:
+            return
+        for row in rows:
+            if row.get("id") is None:
+                self.invalidate(user_id)
+                return
+            merged = {**ctx.notes.get(str(row["id"]), {}), **row}
+            ctx.put_note(_project(merged, NOTE_COLUMNS))
+
+    def notes_deleted(self, user_id: str, note_ids: list):
+        ctx = self._cache.peek(user_id)
+        if ctx is not None:
+            for note_id in note_ids:
+                ctx.drop_note(note_id)
+
+    def events_upserted(self, user_id: str, rows: list):
+        ctx = self._cache.peek(user_id)
+        if ctx is None:
+            return
+        for row in rows:
+            if row.get("id") is None:
+                self.invalidate(user_id)
+                return
+            merged = {**ctx.events.get(str(row["id"]), {}), **row}
+            ctx.put_event(_project(merged, EVENT_COLUMNS))
+
+    def events_deleted(self, user_id: str, event_ids: list):
+        ctx = self._cache.peek(user_id)
+        if ctx is not None:
+            for event_id in event_ids:
+                ctx.drop_event(event_id)
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "stale_puts": self.stale_puts}
+
+
+context_cache = ContextCache(
+    max_users=int(os.getenv("CONTEXT_CACHE_USERS", "1000")),
+    ttl=float(os.getenv("CONTEXT_CACHE_TTL", "300")),
+)
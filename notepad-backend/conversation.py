@@ -0,0 +1,389 @@
+"""
+Conversation Memory
+Per-user ring buffer of recent chat turns plus a rolling summary, in memory or SQLite
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+from fastapi.concurrency import run_in_threadpool
+from cache import TTLCache
+from metrics import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+# Conversation Configuration
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "memory").lower()  # memory or sqlite
+CONVERSATION_PATH = os.getenv(
+    "CONVERSATION_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversations.db"),
+)
+CONVERSATION_WINDOW_TURNS = int(os.getenv("CONVERSATION_WINDOW_TURNS", "6"))  # recent turns sent verbatim
+CONVERSATION_SUMMARY_BATCH = int(os.getenv("CONVERSATION_SUMMARY_BATCH", "4"))  # older turns folded per summary
+CONVERSATION_TURN_MAX_CHARS = int(os.getenv("CONVERSATION_TURN_MAX_CHARS", "1000"))  # per message, as stored
+CONVERSATION_SUMMARY_MAX_CHARS = int(os.getenv("CONVERSATION_SUMMARY_MAX_CHARS", "1500"))
+CONVERSATION_MAX_USERS = int(os.getenv("CONVERSATION_MAX_USERS", "10000"))  # memory backend (LRU)
+CONVERSATION_IDLE_TTL_S = float(os.getenv("CONVERSATION_IDLE_TTL_S", "86400"))  # forget idle conversations
+
+ELLIPSIS = "…"
+
+summaries_total = registry.register(Counter("conversation_summaries_total", "Rolling summaries by outcome", ("outcome",)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    user_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    summarized_through INTEGER NOT NULL,
+    next_seq INTEGER NOT NULL,
+    turns TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    epoch TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS conversations_updated_idx ON conversations (updated_at);
+"""
+
+
+def _clip(text: str, limit: int) -> str:
+    text = (text or "").strip()
+    if len(text) <= limit:
+        return text
+    return text[:max(limit - len(ELLIPSIS), 0)].rstrip() + ELLIPSIS
+
+
+class Conversation:
+    """
+    One user's memory. `turns` holds (seq, user message, reply) with a fixed
+    capacity; turns with seq <= summarized_through are already folded into
+    `summary`, so dropping them from the buffer loses nothing. `epoch` is
+    new for every conversation, so one started after clear() is never
+    mistaken for the one before it.
+    """
+
+    def __init__(self, capacity: int, summary: str = "", summarized_through: int = 0,
+                 next_seq: int = 1, turns=(), epoch: str = None):
+        self.epoch = epoch or uuid.uuid4().hex
+        self.summary = summary
+        self.summarized_through = summarized_through
+        self.next_seq = next_seq
+        self.turns = deque(turns, maxlen=capacity)
+        self.updated_at = time.time()
+
+    def pending(self, window: int) -> list:
+        """Turns that have left the window but aren't in the summary yet, oldest first"""
+        older = list(self.turns)[:-window] if window else list(self.turns)
+        return [turn for turn in older if turn[0] > self.summarized_through]
+
+    def to_row(self) -> tuple:
+        return (self.summary, self.summarized_through, self.next_seq,
+                json.dumps([list(turn) for turn in self.turns]), self.updated_at, self.epoch)
+
+    @classmethod
+    def from_row(cls, capacity: int, row) -> "Conversation":
+        summary, summarized_through, next_seq, turns, updated_at, epoch = row
+        conversation = cls(capacity, summary, summarized_through, next_seq,
+                           (tuple(t) for t in json.loads(turns)), epoch or None)
+        conversation.updated_at = updated_at
+        return conversation
+
+
+class ConversationStore:
+    """Load and save whole conversations; each is a fixed-size record"""
+
+    name = "base"
+    blocking = False  # True when calls do I/O and belong in the threadpool
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def load(self, user_id: str, capacity: int):
+        raise NotImplementedError
+
+    def save(self, user_id: str, conversation: Conversation):
+        raise NotImplementedError
+
+    def clear(self, user_id: str):
+        raise NotImplementedError
+
+    def prune(self, idle_before: float) -> int:
+        return 0
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class MemoryConversationStore(ConversationStore):
+    """Conversations live in an LRU over users; idle ones expire"""
+
+    name = "memory"
+
+    def __init__(self, max_users: int = CONVERSATION_MAX_USERS, ttl: float = CONVERSATION_IDLE_TTL_S):
+        self._cache = TTLCache(maxsize=max_users, ttl=ttl)
+
+    def load(self, user_id, capacity):
+        return self._cache.get(user_id)
+
+    def save(self, user_id, conversation):
+        self._cache.set(user_id, conversation)
+
+    def clear(self, user_id):
+        self._cache.pop(user_id)
+
+    def stats(self) -> dict:
+        return {**super().stats(), **self._cache.stats()}
+
+
+class SQLiteConversationStore(ConversationStore):
+    """One row per user, rewritten whole on every turn; survives restarts"""
+
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str = CONVERSATION_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        if self._conn is not None:
+            return
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(conversations)")}
+        if "epoch" not in columns:
+            # Files from before epochs; an empty epoch gets a fresh one on load
+            conn.execute("ALTER TABLE conversations ADD COLUMN epoch TEXT NOT NULL DEFAULT ''")
+        self._conn = conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def load(self, user_id, capacity):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, summarized_through, next_seq, turns, updated_at, epoch "
+                "FROM conversations WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+        return Conversation.from_row(capacity, row) if row else None
+
+    def save(self, user_id, conversation):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversations "
+                "(user_id, summary, summarized_through, next_seq, turns, updated_at, epoch) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, *conversation.to_row()),
+            )
+
+    def clear(self, user_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM conversations WHERE user_id = ?", (user_id,))
+
+    def prune(self, idle_before):
+        with self._lock:
+            return self._conn.execute("DELETE FROM conversations WHERE updated_at < ?", (idle_before,)).rowcount
+
+    def stats(self) -> dict:
+        return {**super().stats(), "path": self.path}
+
+
+class History:
+    """What the prompt builder gets: the rolling summary and the recent turns, oldest first"""
+
+    def __init__(self, summary: str = "", turns: list = ()):
+        self.summary = summary
+        self.turns = list(turns)  # (user message, reply)
+
+    def __bool__(self):
+        return bool(self.summary or self.turns)
+
+
+def summary_prompt(summary: str, turns: list, max_chars: int = CONVERSATION_SUMMARY_MAX_CHARS) -> str:
+    lines = "\n".join(f"User: {user}\nAssistant: {reply}" for _, user, reply in turns)
+    return (
+        "System: Update the running summary of a conversation between a user and their "
+        f"notes-and-calendar assistant. Reply with the new summary only, at most {max_chars} characters. "
+        "Keep names, dates, times, note and event titles, decisions and open requests; drop small talk.\n"
+        f"Current summary: {summary or '(none)'}\n"
+        f"New turns:\n{lines}\n"
+        "New summary:"
+    )
+
+
+def extractive_summary(summary: str, turns: list, max_chars: int = CONVERSATION_SUMMARY_MAX_CHARS) -> str:
+    """Fallback with no AI call: the user's side of each turn, newest kept when space runs out"""
+    lines = [line for line in summary.split("\n") if line] if summary else []
+    lines += [f"- {_clip(user, 200)}" for _, user, _ in turns]
+    kept, used = [], 0
+    for line in reversed(lines):
+        if used + len(line) + 1 > max_chars:
+            break
+        kept.append(line)
+        used += len(line) + 1
+    return "\n".join(reversed(kept))
+
+
+class ConversationMemory:
+    """
+    The prompt always gets the same shape: a summary of at most
+    CONVERSATION_SUMMARY_MAX_CHARS plus the last CONVERSATION_WINDOW_TURNS
+    turns (and any not summarized yet), each capped at
+    CONVERSATION_TURN_MAX_CHARS. Turns leaving the
+    window are folded into the summary in the background, a batch at a time,
+    so answering never waits for it. The buffer has room for two batches
+    beyond the window; if summaries fall further behind than that, the
+    oldest turn is folded extractively on the spot instead of being lost.
+    """
+
+    def __init__(self, store: ConversationStore = None, window: int = CONVERSATION_WINDOW_TURNS,
+                 batch: int = CONVERSATION_SUMMARY_BATCH, turn_max_chars: int = CONVERSATION_TURN_MAX_CHARS,
+                 summary_max_chars: int = CONVERSATION_SUMMARY_MAX_CHARS):
+        self.store = store or (SQLiteConversationStore() if CONVERSATION_BACKEND == "sqlite"
+                               else MemoryConversationStore())
+        self.window = window
+        self.batch = max(1, batch)
+        self.capacity = window + 2 * self.batch
+        self.turn_max_chars = turn_max_chars
+        self.summary_max_chars = summary_max_chars
+        self._summarizer = None
+        self._locks = [asyncio.Lock() for _ in range(64)]  # striped by user
+        self._summarizing = set()  # user ids with a summary in flight
+        self._tasks = set()
+        self.recorded = 0
+        self.summaries = 0
+        self.summary_failures = 0
+        self.forced_folds = 0
+
+    def _lock(self, user_id: str) -> asyncio.Lock:
+        return self._locks[hash(user_id) % len(self._locks)]
+
+    async def _call(self, fn, *args):
+        if self.store.blocking:
+            return await run_in_threadpool(fn, *args)
+        return fn(*args)
+
+    async def start(self, summarizer=None):
+        """summarizer(prompt) -> summary text; None always uses the extractive fallback"""
+        self._summarizer = summarizer
+        await self._call(self.store.open)
+        pruned = await self._call(self.store.prune, time.time() - CONVERSATION_IDLE_TTL_S)
+        if pruned:
+            logger.info("Conversations: %s idle ones expired", pruned)
+
+    async def stop(self):
+        """Turns whose summary was in flight stay pending and are folded after the next turn"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._summarizing.clear()
+        await self._call(self.store.close)
+
+    async def _load(self, user_id: str) -> Conversation:
+        conversation = await self._call(self.store.load, user_id, self.capacity)
+        return conversation if conversation is not None else Conversation(self.capacity)
+
+    async def history(self, user_id: str) -> History:
+        conversation = await self._call(self.store.load, user_id, self.capacity)
+        if conversation is None:
+            return History()
+        # Turns waiting for their summary stay visible until it lands
+        recent = [turn for turn in conversation.turns if turn[0] > conversation.summarized_through]
+        return History(conversation.summary, [(user, reply) for _, user, reply in recent])
+
+    async def record(self, user_id: str, message: str, reply: str):
+        """Add one exchange; schedules a background summary once a batch has left the window"""
+        async with self._lock(user_id):
+            conversation = await self._load(user_id)
+            if len(conversation.turns) == conversation.turns.maxlen:
+                oldest = conversation.turns[0]
+                if oldest[0] > conversation.summarized_through:
+                    conversation.summary = extractive_summary(conversation.summary, [oldest], self.summary_max_chars)
+                    conversation.summarized_through = oldest[0]
+                    self.forced_folds += 1
+            seq = conversation.next_seq
+            conversation.turns.append((seq, _clip(message, self.turn_max_chars), _clip(reply, self.turn_max_chars)))
+            conversation.next_seq = seq + 1
+            conversation.updated_at = time.time()
+            await self._call(self.store.save, user_id, conversation)
+            self.recorded += 1
+            due = len(conversation.pending(self.window)) >= self.batch
+
+        if due and user_id not in self._summarizing:
+            self._summarizing.add(user_id)
+            task = asyncio.create_task(self._summarize(user_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, user_id: str):
+        try:
+            conversation = await self._load(user_id)
+            pending = conversation.pending(self.window)
+            if not pending:
+                return
+            base_summary, base_through = conversation.summary, conversation.summarized_through
+            epoch = conversation.epoch
+            summary = None
+            if self._summarizer is not None:
+                try:
+                    summary = _clip(
+                        await self._summarizer(summary_prompt(base_summary, pending, self.summary_max_chars)),
+                        self.summary_max_chars,
+                    )
+                except Exception as e:
+                    logger.warning("Conversation summary failed, using the extractive fallback: %s", e)
+                    self.summary_failures += 1
+                    summaries_total.inc("fallback")
+            if not summary:
+                summary = extractive_summary(base_summary, pending, self.summary_max_chars)
+
+            async with self._lock(user_id):
+                # Re-read: more turns may have arrived (or the history was cleared) meanwhile
+                latest = await self._call(self.store.load, user_id, self.capacity)
+                if latest is None or latest.epoch != epoch or latest.summarized_through != base_through:
+                    return  # cleared (maybe restarted), or folded on the spot meanwhile; the next turn tries again
+                latest.summary = summary
+                latest.summarized_through = pending[-1][0]
+                await self._call(self.store.save, user_id, latest)
+            self.summaries += 1
+            summaries_total.inc("ok")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Conversation summary for %s failed: %s", user_id, e)
+        finally:
+            self._summarizing.discard(user_id)
+
+    async def clear(self, user_id: str):
+        async with self._lock(user_id):
+            await self._call(self.store.clear, user_id)
+
+    def stats(self) -> dict:
+        return {
+            "store": self.store.stats(),
+            "window_turns": self.window,
+            "summary_batch": self.batch,
+            "recorded": self.recorded,
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+            "forced_folds": self.forced_folds,
+            "summarizing": len(self._summarizing),
+        }
+
+
+conversation_memory = ConversationMemory()
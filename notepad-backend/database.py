@@ -3,15 +3,43 @@ Database Configuration
 Supabase Integration for Notes and Events
 """
 
-from supabase import create_client, Client
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
+import httpx
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+import config  # loads .env
 
 # Supabase Configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-# Initialize Supabase Client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Async Supabase Client, created once at app startup
+_supabase: AsyncClient = None
+
+
+async def init_supabase(http_client: httpx.AsyncClient) -> AsyncClient:
+    """Build the client on top of the shared keep-alive pool"""
+    global _supabase
+    if _supabase is None:
+        _supabase = await acreate_client(
+            SUPABASE_URL,
+            SUPABASE_KEY,
+            options=AsyncClientOptions(httpx_client=http_client),
+        )
+    return _supabase
+
+
+async def warm_up_supabase(http_client: httpx.AsyncClient):
+    """Open a keep-alive connection (DNS, TCP, TLS) to the project before real traffic needs one"""
+    await http_client.get(f"{SUPABASE_URL}/auth/v1/health", headers={"apikey": SUPABASE_KEY}, timeout=5)
+
+
+def close_supabase():
+    # The pool itself is owned and closed by http_pool
+    global _supabase
+    _supabase = None
+
+
+def get_supabase() -> AsyncClient:
+    if _supabase is None:
+        raise RuntimeError("Supabase client is not initialized; is the app started?")
+    return _supabase
@@ -0,0 +1,189 @@
+"""
+Event Query Engine
+Window and "next N" queries over one-off and recurring events, with a per-user occurrence cache
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+from datetime import datetime, timezone
+
+from cache import UserScopedCache
+from metrics import span
+from recurrence import Recurrence, RecurrenceError, parse_time, series_fields
+
+# Event Query Configuration
+EVENT_QUERY_MAX_LIMIT = int(os.getenv("EVENT_QUERY_MAX_LIMIT", "1000"))
+EVENT_QUERY_DEFAULT_LIMIT = int(os.getenv("EVENT_QUERY_DEFAULT_LIMIT", "200"))
+OCCURRENCE_CACHE_SIZE = int(os.getenv("OCCURRENCE_CACHE_SIZE", "2000"))
+OCCURRENCE_CACHE_TTL = float(os.getenv("OCCURRENCE_CACHE_TTL", "300"))
+
+EVENT_COLUMNS = "id,title,description,start_time,end_time,recurrence"
+
+
+def prepare_event(row: dict) -> dict:
+    """
+    Validate and normalize an event before insert. A recurring event gets
+    its canonical rule and recurrence_end; a one-off event carries neither
+    column. Raises RecurrenceError (a ValueError) on a bad rule or time.
+    """
+    row = dict(row)
+    recurrence = (row.pop("recurrence", None) or "").strip()
+    if recurrence:
+        row.update(series_fields(row.get("start_time"), recurrence))
+    return row
+
+
+def _occurrence(row: dict, start: datetime, duration) -> dict:
+    """One occurrence of a series, shaped like an event row"""
+    return {
+        **row,
+        "start_time": start.isoformat(),
+        "end_time": (start + duration).isoformat(),
+    }
+
+
+class _Series:
+    """A recurring event row and its parsed rule"""
+
+    def __init__(self, row: dict):
+        self.row = row
+        self.recurrence = Recurrence.from_row(row["start_time"], row["recurrence"])
+        self.duration = parse_time(row["end_time"]) - self.recurrence.dtstart
+
+    def expand(self, start: datetime, end: datetime = None):
+        for occurrence in self.recurrence.occurrences(start, end):
+            yield occurrence, True, _occurrence(self.row, occurrence, self.duration)
+
+
+class EventQueryEngine:
+    """
+    One-off events come from an indexed range scan on (user_id, start_time).
+    Recurring events are stored once, as a rule, and found by a second scan
+    on recurrence_end (the start of their last occurrence); each is then
+    expanded only inside the requested window. Both streams are merged
+    lazily and cut at the limit.
+
+    Results are cached per user and dropped by invalidate() on every event
+    write. A query that was running when invalidate() came in may have read
+    the events before the write, so its result is returned but not cached.
+    Occurrences are matched by start time, like GET /events?from=&to=.
+    """
+
+    def __init__(self, cache_size: int = OCCURRENCE_CACHE_SIZE, ttl: float = OCCURRENCE_CACHE_TTL):
+        self._cache = UserScopedCache(maxsize=cache_size, ttl=ttl)
+        self._running = {}  # user id -> [queries in flight, writes seen meanwhile]; only while busy
+        self.queries = 0
+        self.series_expanded = 0
+        self.bad_rules = 0
+        self.stale_results = 0
+
+    def invalidate(self, user_id: str):
+        self._cache.invalidate_user(user_id)
+        running = self._running.get(user_id)
+        if running is not None:
+            running[1] += 1
+
+    async def _guarded_query(self, storage, user_id: str, start: datetime, end, limit: int):
+        """(result, whether it may be cached)"""
+        running = self._running.setdefault(user_id, [0, 0])
+        running[0] += 1
+        generation = running[1]
+        try:
+            result = await self._query(storage, user_id, start, end, limit)
+        finally:
+            running[0] -= 1
+            if not running[0]:
+                self._running.pop(user_id, None)
+        if running[1] != generation:
+            self.stale_results += 1
+            return result, False
+        return result, True
+
+    def _series(self, rows: list) -> list:
+        series = []
+        for row in rows:
+            try:
+                series.append(_Series(row))
+            except (RecurrenceError, KeyError, TypeError):
+                # Written outside the API; skip it rather than fail the whole view
+                self.bad_rules += 1
+        self.series_expanded += len(series)
+        return series
+
+    async def _fetch(self, storage, user_id: str, start: datetime, end, limit: int):
+        """(one-off rows, where they were cut off by the limit or None, recurring rows)"""
+        before_end = {"start_time": end.isoformat()} if end is not None else None
+        rows, recurring = await asyncio.gather(
+            storage.select(
+                "events", user_id, EVENT_COLUMNS,
+                gte={"start_time": start.isoformat()}, lt=before_end,
+                order="start_time", limit=limit + 1,
+            ),
+            storage.select(
+                "events", user_id, EVENT_COLUMNS,
+                gte={"recurrence_end": start.isoformat()}, lt=before_end,
+            ),
+        )
+        cutoff = parse_time(rows[limit]["start_time"]) if len(rows) > limit else None
+        # A series whose first start is in range comes back from both scans
+        return [row for row in rows if not row.get("recurrence")], cutoff, recurring
+
+    async def _query(self, storage, user_id: str, start: datetime, end, limit: int) -> dict:
+        self.queries += 1
+        one_offs, cutoff, recurring = await self._fetch(storage, user_id, start, end, limit)
+        with span("events.expand"):
+            streams = [((parse_time(row["start_time"]), False, row) for row in one_offs)]
+            for series in self._series(recurring):
+                streams.append(series.expand(start, end))
+            merged = heapq.merge(*streams, key=lambda item: item[0])
+            if cutoff is not None:
+                # One-off events from the cutoff on weren't all fetched, so
+                # only what is known to come before them can be returned
+                merged = itertools.takewhile(lambda item: item[0] <= cutoff, merged)
+                merged = (item for item in merged if item[0] < cutoff or not item[1])
+            occurrences = list(itertools.islice(merged, limit + 1))
+
+        return {
+            "occurrences": [row for _, _, row in occurrences[:limit]],
+            "truncated": cutoff is not None or len(occurrences) > limit,
+        }
+
+    async def window(self, storage, user_id: str, start: datetime, end: datetime,
+                     limit: int = EVENT_QUERY_DEFAULT_LIMIT) -> dict:
+        """Occurrences starting in [start, end), soonest first"""
+        key = ("window", user_id, start.isoformat(), end.isoformat(), limit)
+        result = self._cache.get(key)
+        if result is None:
+            result, fresh = await self._guarded_query(storage, user_id, start, end, limit)
+            if fresh:
+                self._cache.set_for_user(user_id, key, result)
+        return result
+
+    async def upcoming(self, storage, user_id: str, limit: int, now: datetime = None) -> dict:
+        """The next `limit` occurrences starting at or after `now`"""
+        now = now or datetime.now(timezone.utc)
+        key = ("upcoming", user_id, limit)
+        cached = self._cache.get(key)
+        # Still exact until the first listed occurrence starts
+        if cached is not None and now <= cached[0]:
+            return cached[1]
+        result, fresh = await self._guarded_query(storage, user_id, now, None, limit)
+        if fresh:
+            first = result["occurrences"][0]["start_time"] if result["occurrences"] else None
+            valid_until = parse_time(first) if first else datetime.max.replace(tzinfo=timezone.utc)
+            self._cache.set_for_user(user_id, key, (valid_until, result))
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "cache": self._cache.stats(),
+            "queries": self.queries,
+            "series_expanded": self.series_expanded,
+            "bad_rules": self.bad_rules,
+            "stale_results": self.stale_results,
+        }
+
+
+event_query = EventQueryEngine()
@@ -0,0 +1,32 @@
+"""
+HTTP Caching Helpers
+Strong ETags over response payloads and If-None-Match handling
+"""
+
+import hashlib
+from fastapi import Response
+
+# Clients may keep the body but must revalidate it on every use
+LIST_CACHE_CONTROL = "private, no-cache"
+
+
+def compute_etag(*parts: bytes) -> str:
+    """Hash of the response bytes themselves, so the body is serialized only once"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return '"' + digest.hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": LIST_CACHE_CONTROL})
@@ -0,0 +1,43 @@
+"""
+Shared HTTP Connection Pools
+One keep-alive httpx.AsyncClient per upstream, opened at startup, closed at shutdown
+"""
+
+import os
+import httpx
+
+# Pool Configuration
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+
+# name -> timeout in seconds
+UPSTREAMS = {
+    "supabase": 10.0,  # PostgREST queries and /auth/v1/user
+    "ai": 30.0,        # Text generation
+}
+
+_clients = {}
+
+
+async def open_clients():
+    """Create every pool once; safe to call twice"""
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+    )
+    for name, timeout in UPSTREAMS.items():
+        if name not in _clients:
+            _clients[name] = httpx.AsyncClient(timeout=timeout, limits=limits)
+
+
+async def close_clients():
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    client = _clients.get(name)
+    if client is None:
+        raise RuntimeError(f"HTTP pool '{name}' is not open; is the app started?")
+    return client
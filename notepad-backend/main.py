@@ -1,26 +1,118 @@
 """
 Properties Dashboard - FastAPI Backend with AI Integration
-Supabase + Hugging Face Microsoft Phi-3.5-mini-instruct AI Chat
+Supabase + pluggable AI chat (Pollinations.ai, OpenAI-compatible/Ollama)
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Form
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import config  # loads .env and sets up logging before any module reads its settings
+from contextlib import asynccontextmanager
+from datetime import datetime
+from fastapi import FastAPI, HTTPException, Depends, Form, Header, Query, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Union
 from enum import Enum
-from database import supabase
-from auth import get_current_user
-import requests
+from storage import open_storage, close_storage, get_storage
+from auth import get_current_user, get_current_user_or_query, authenticate, get_auth_cache_stats, warm_up as warm_up_auth
+from startup import startup_state
+from http_pool import open_clients, close_clients
+from cache import UserScopedCache
+from singleflight import SingleFlight
+from context_cache import context_cache, UserContext, NOTE_COLUMNS, EVENT_COLUMNS
+from retrieval import retrieve
+from prompt_builder import prompt_builder, BuiltPrompt
+from pagination import (
+    NEXT_CURSOR_HEADER, encode_cursor, page_limit, parse_fields, project,
+    encode_sync_cursor, decode_sync_cursor
+)
+from batch import BATCH_MAX_OPERATIONS, BatchRequest, execute_batch
+from search_index import search_index
+from http_cache import LIST_CACHE_CONTROL, compute_etag, etag_matches, not_modified
+from responses import FastJSONResponse, dumps, json_body
+from compression import CompressionMiddleware
+from ai_providers import ai_router, ProviderError
+from event_query import event_query, prepare_event, EVENT_QUERY_DEFAULT_LIMIT, EVENT_QUERY_MAX_LIMIT
+from recurrence import RecurrenceError, parse_time as parse_event_time
+from conversation import conversation_memory
+from actions import ACTION_PREFIX, parse_actions, execute_actions, strip_actions
+from time_parser import time_parser
+from chat_jobs import chat_jobs, QueueFull
+from change_feed import change_hub
+from rate_limit import rate_limiter, ai_admission, Overloaded, too_many_requests
+from metrics import MetricsMiddleware, registry as metrics_registry, span
+import httpx
+
+logger = logging.getLogger(__name__)
 
 # ===== AI CONFIGURATION =====
-# Using Pollinations.ai (Free, reliable, no token needed)
-POLLINATIONS_API_URL = "https://text.pollinations.ai/"
+# Providers are picked with AI_PROVIDERS (see ai_providers.py); the default
+# is Pollinations.ai (free, no token needed)
+
+# ===== AI REPLY CACHE =====
+# Plain replies keyed by user + normalized prompt; dropped whenever the
+# user's notes or events change. Action replies are never cached.
+reply_cache = UserScopedCache(
+    maxsize=int(os.getenv("AI_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("AI_CACHE_TTL", "600")),
+)
+
+# ===== LIFESPAN (shared clients + warm-up) =====
+async def _warm_up():
+    """Pay the cold costs up front so the first requests run at steady-state speed"""
+
+    async def dateparser_phase():
+        # dateparser's import and language data take hundreds of ms
+        with startup_state.phase("dateparser", critical=False):
+            await run_in_threadpool(time_parser.warm_up)
+
+    async def jwt_phase():
+        with startup_state.phase("jwt_verifier", critical=False):
+            await run_in_threadpool(warm_up_auth)
+
+    async def storage_phase():
+        with startup_state.phase("storage_connection", critical=False):
+            await get_storage().warm_up()
+
+    await asyncio.gather(dateparser_phase(), jwt_phase(), storage_phase())
+    startup_state.mark_ready()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the keep-alive pools once per process, warm up in the background, close on shutdown"""
+    startup_state.reset()
+    with startup_state.phase("http_pools"):
+        await open_clients()
+    with startup_state.phase("storage"):
+        await open_storage()
+    with startup_state.phase("search_index"):
+        search_index.open()
+    with startup_state.phase("conversations"):
+        await conversation_memory.start(_summarize_conversation)
+    with startup_state.phase("chat_jobs"):
+        await chat_jobs.start(_chat_job_reply)
+    warm_up_task = asyncio.create_task(_warm_up())
+    yield
+    warm_up_task.cancel()
+    await chat_jobs.stop()
+    await conversation_memory.stop()
+    search_index.close()
+    await close_storage()
+    await close_clients()
 
 # ===== FASTAPI SETUP =====
 app = FastAPI(
     title="Properties Dashboard API with AI",
     version="1.0.0",
-    description="Supabase + Pollinations.ai Backend"
+    description="Supabase + Pollinations.ai Backend",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 # ===== CORS MIDDLEWARE =====
@@ -30,8 +122,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", "Server-Timing"],
 )
 
+# ===== COMPRESSION MIDDLEWARE (br/gzip, see compression.py) =====
+app.add_middleware(CompressionMiddleware)
+
+# ===== METRICS MIDDLEWARE (outermost, so it times everything) =====
+app.add_middleware(MetricsMiddleware)
+
+# ===== RATE LIMITS (per user, see rate_limit.py) =====
+write_limit = Depends(rate_limiter.dependency("write"))
+chat_limit = Depends(rate_limiter.dependency("chat"))
+
 # -----------------------
 # Pydantic Models
 # -----------------------
@@ -51,31 +154,125 @@ class NoteUpdate(BaseModel):
     content: Optional[str] = None
     status: Optional[NoteStatus] = None
 
+class Note(BaseModel):
+    """A note as listed; with ?fields= only the requested columns are present"""
+    id: Optional[Union[int, str]] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
+    status: Optional[NoteStatus] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    user_id: Optional[str] = None
+
+def _list_response(rows: list, next_cursor: Optional[str], if_none_match: Optional[str]) -> Response:
+    """
+    Serialize a list page once, straight to bytes, and hash those bytes for
+    the ETag; answer 304 instead if the client's copy is current. The
+    response models on list routes document the rows, they don't re-encode them.
+    """
+    with span("list.serialize"):
+        body = dumps(rows)
+        etag = compute_etag(body, (next_cursor or "").encode())
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    headers = {"ETag": etag, "Cache-Control": LIST_CACHE_CONTROL}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    return json_body(body, headers)
+
+class EventCreate(BaseModel):
+    title: str
+    description: str = ""
+    start_time: str
+    end_time: str
+    recurrence: Optional[str] = None  # e.g. FREQ=WEEKLY;BYDAY=MO,WE;COUNT=10
+
+class Event(BaseModel):
+    """An event as listed; with ?fields= only the requested columns are present"""
+    id: Optional[Union[int, str]] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    recurrence: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    user_id: Optional[str] = None
+
+# Columns clients may request through ?fields=
+NOTE_FIELDS = ("id", "title", "content", "status", "created_at", "updated_at", "user_id")
+EVENT_FIELDS = ("id", "title", "description", "start_time", "end_time", "recurrence", "created_at", "updated_at", "user_id")
+
+def _parse_time(value: Optional[str], name: str) -> Optional[str]:
+    """Validate an ISO-8601 query parameter"""
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"'{name}' must be an ISO-8601 datetime")
+
 # -----------------------
 # Health Check Endpoints
 # -----------------------
 
 @app.get("/")
-def root():
+async def root():
     """API health check"""
     return {
         "status": "Backend running successfully",
         "service": "Properties Dashboard API with AI",
         "version": "1.0.0",
-        "ai_model": "Phi-3.5-mini-instruct (Microsoft via Hugging Face)"
+        "ai_providers": ai_router.names
     }
 
 @app.get("/health")
-def health_check():
+async def health_check():
     """Simple health check for monitoring"""
     return {"status": "ok"}
 
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """
+    Readiness for load balancers: 503 until startup warm-up has finished.
+    /health only says the process is alive.
+    """
+    state = startup_state.snapshot()
+    if not state["ready"]:
+        response.status_code = 503
+    return {"status": "ready" if state["ready"] else "starting", **state}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Latency histograms, counters and in-flight gauges in Prometheus text format"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def cache_stats():
+    """Hit/miss counters for the in-process caches"""
+    return {
+        "auth_cache": get_auth_cache_stats(),
+        "ai_reply_cache": reply_cache.stats(),
+        "context_cache": context_cache.stats(),
+        "context_fetch": context_flight.stats(),
+        "storage": get_storage().stats(),
+        "prompt_budget": prompt_builder.stats(),
+        "ai_providers": ai_router.stats(),
+        "time_parser": time_parser.stats(),
+        "chat_jobs": chat_jobs.stats(),
+        "rate_limits": rate_limiter.stats(),
+        "ai_admission": ai_admission.stats(),
+        "change_feed": change_hub.stats(),
+        "event_query": event_query.stats(),
+        "conversations": conversation_memory.stats(),
+    }
+
 # =============================================
-# NOTES ENDPOINTS (CRUD with Supabase)
+# NOTES ENDPOINTS (CRUD via storage)
 # =============================================
 
-@app.post("/notes", status_code=201)
-def create_note(note: NoteCreate, user: dict = Depends(get_current_user)):
+@app.post("/notes", status_code=201, dependencies=[write_limit])
+async def create_note(note: NoteCreate, user: dict = Depends(get_current_user)):
     """Create a new note for authenticated user"""
     
     user_id = user.get("id")
@@ -83,43 +280,107 @@ def create_note(note: NoteCreate, user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=401, detail="Invalid user")
     
     try:
-        response = supabase.table("notes").insert({
+        rows = await get_storage().insert("notes", user_id, [{
             "title": note.title,
             "content": note.content,
             "status": note.status.value,
-            "user_id": user_id,
-        }).execute()
+        }])
 
-        if not response.data:
+        if not rows:
             raise HTTPException(status_code=500, detail="Failed to create note")
         
-        return response.data[0] if response.data else {"message": "Created"}
+        await _notes_changed(user_id, upserted=rows)
+        return rows[0]
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-@app.get("/notes")
-def get_notes(user: dict = Depends(get_current_user)):
-    """Get all notes for authenticated user"""
+@app.get("/notes", response_model=list[Note], response_model_exclude_unset=True)
+async def get_notes(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    status: Optional[NoteStatus] = None,
+    if_none_match: Optional[str] = Header(None),
+    user: dict = Depends(get_current_user)
+):
+    """
+    Get one page of notes for authenticated user, newest first.
+    The next page's cursor is returned in the X-Next-Cursor header.
+    """
     
     user_id = user.get("id")
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid user")
-    
+
+    limit = page_limit(limit)
+    select, requested = parse_fields(fields, NOTE_FIELDS, ("id", "created_at"))
+
     try:
-        response = (
-            supabase.table("notes")
-            .select("*")
-            .eq("user_id", user_id)
-            .execute()
+        rows = await get_storage().select(
+            "notes", user_id, select,
+            eq={"status": status.value} if status is not None else None,
+            cursor=cursor,
+            order="created_at",
+            descending=True,
+            limit=limit + 1,
         )
-        return response.data if response.data else []
-    
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-@app.put("/notes/{note_id}")
-def update_note(note_id: str, note: NoteUpdate, user: dict = Depends(get_current_user)):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], "created_at")
+    return _list_response(project(rows, requested), next_cursor, if_none_match)
+
+@app.get("/notes/search")
+async def search_notes(
+    q: str,
+    limit: int = 20,
+    offset: int = 0,
+    user: dict = Depends(get_current_user)
+):
+    """
+    Full-text search over the user's note titles and content.
+    Results are ranked best first and carry a highlighted snippet.
+    """
+
+    user_id = user.get("id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    limit = min(page_limit(limit), 100)
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="offset cannot be negative")
+
+    try:
+        # First search for this user: index everything they already have
+        if not await run_in_threadpool(search_index.is_indexed, user_id):
+            # Notes written while the snapshot is read are already indexed newer
+            touched = search_index.begin_backfill(user_id)
+            try:
+                rows = await get_storage().select("notes", user_id, "id,title,content")
+                await run_in_threadpool(search_index.rebuild_user, user_id, rows, touched)
+            finally:
+                search_index.end_backfill(user_id, touched)
+
+        with span("search.query"):
+            hits = await run_in_threadpool(search_index.search, user_id, q, limit + 1, offset)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
+
+    return {
+        "results": hits[:limit],
+        "next_offset": offset + limit if len(hits) > limit else None,
+    }
+
+@app.put("/notes/{note_id}", dependencies=[write_limit])
+async def update_note(note_id: str, note: NoteUpdate, user: dict = Depends(get_current_user)):
     """Update a note"""
     
     user_id = user.get("id")
@@ -131,24 +392,19 @@ def update_note(note_id: str, note: NoteUpdate, user: dict = Depends(get_current
         raise HTTPException(status_code=400, detail="No fields provided to update")
 
     try:
-        response = (
-            supabase.table("notes")
-            .update(update_data)
-            .eq("id", note_id)
-            .eq("user_id", user_id)
-            .execute()
-        )
+        rows = await get_storage().update("notes", user_id, [note_id], update_data)
 
-        if not response.data:
+        if not rows:
             raise HTTPException(status_code=404, detail="Note not found or unauthorized")
         
-        return response.data[0] if response.data else {"message": "Updated"}
+        await _notes_changed(user_id, upserted=rows)
+        return rows[0]
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-@app.delete("/notes/{note_id}")
-def delete_note(note_id: str, user: dict = Depends(get_current_user)):
+@app.delete("/notes/{note_id}", dependencies=[write_limit])
+async def delete_note(note_id: str, user: dict = Depends(get_current_user)):
     """Delete a note"""
     
     user_id = user.get("id")
@@ -156,80 +412,186 @@ def delete_note(note_id: str, user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=401, detail="Invalid user")
     
     try:
-        response = (
-            supabase.table("notes")
-            .delete()
-            .eq("id", note_id)
-            .eq("user_id", user_id)
-            .execute()
-        )
+        rows = await get_storage().delete("notes", user_id, [note_id])
 
-        if not response.data:
+        if not rows:
             raise HTTPException(status_code=404, detail="Note not found or unauthorized")
         
+        await _notes_changed(user_id, deleted=[note_id])
         return {"message": "Note deleted successfully"}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+@app.post("/notes/batch", dependencies=[write_limit])
+async def batch_notes(batch: BatchRequest, user: dict = Depends(get_current_user)):
+    """
+    Create, update and delete many notes in one request.
+    Each operation is {"op": "create"|"update"|"delete", "id": ..., "data": {...}};
+    results come back per operation, in request order.
+    """
+
+    user_id = user.get("id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    _check_batch_size(batch)
+    result = await execute_batch(
+        get_storage(), "notes", user_id, batch.operations, NoteCreate, NoteUpdate
+    )
+    if result.upserted or result.deleted:
+        await _notes_changed(user_id, upserted=result.upserted, deleted=result.deleted)
+    return result.to_response()
+
+def _check_batch_size(batch: BatchRequest):
+    if not batch.operations:
+        raise HTTPException(status_code=400, detail="No operations provided")
+    if len(batch.operations) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_OPERATIONS} operations per batch")
+
 # =============================================
-# EVENTS ENDPOINTS (CRUD with Supabase)
+# EVENTS ENDPOINTS (CRUD via storage)
 # =============================================
 
-@app.post("/events", status_code=201)
-def create_event(
+@app.post("/events", status_code=201, dependencies=[write_limit])
+async def create_event(
     title: str = Form(...),
     description: str = Form(default=""),
     start_time: str = Form(...),
     end_time: str = Form(...),
+    recurrence: Optional[str] = Form(default=None),
     user: dict = Depends(get_current_user)
 ):
-    """Create a new event for authenticated user"""
+    """
+    Create a new event for authenticated user.
+    `recurrence` makes it repeat, e.g. FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20270101T000000Z
+    (FREQ DAILY/WEEKLY/MONTHLY/YEARLY, INTERVAL, COUNT or UNTIL, BYDAY for weekly).
+    """
     
     user_id = user.get("id")
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid user")
-    
+
     try:
-        response = supabase.table("events").insert({
+        event = prepare_event({
             "title": title,
             "description": description,
             "start_time": start_time,
             "end_time": end_time,
-            "user_id": user_id,
-        }).execute()
+            "recurrence": recurrence,
+        })
+    except RecurrenceError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        rows = await get_storage().insert("events", user_id, [event])
 
-        if not response.data:
+        if not rows:
             raise HTTPException(status_code=500, detail="Failed to create event")
         
-        return response.data[0] if response.data else {"message": "Created"}
+        await _events_changed(user_id, upserted=rows)
+        return rows[0]
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-@app.get("/events")
-def get_events(user: dict = Depends(get_current_user)):
-    """Get all events for authenticated user, ordered by start time"""
+@app.get("/events", response_model=list[Event], response_model_exclude_unset=True)
+async def get_events(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    from_time: Optional[str] = Query(None, alias="from"),
+    to_time: Optional[str] = Query(None, alias="to"),
+    if_none_match: Optional[str] = Header(None),
+    user: dict = Depends(get_current_user)
+):
+    """
+    Get one page of events for authenticated user, ordered by start time.
+    `from`/`to` restrict start_time to [from, to).
+    The next page's cursor is returned in the X-Next-Cursor header.
+    """
     
     user_id = user.get("id")
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid user")
-    
+
+    limit = page_limit(limit)
+    select, requested = parse_fields(fields, EVENT_FIELDS, ("id", "start_time"))
+    from_time = _parse_time(from_time, "from")
+    to_time = _parse_time(to_time, "to")
+
     try:
-        response = (
-            supabase.table("events")
-            .select("*")
-            .eq("user_id", user_id)
-            .order("start_time", desc=False)
-            .execute()
+        rows = await get_storage().select(
+            "events", user_id, select,
+            gte={"start_time": from_time} if from_time else None,
+            lt={"start_time": to_time} if to_time else None,
+            cursor=cursor,
+            order="start_time",
+            limit=limit + 1,
         )
-        return response.data if response.data else []
-    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], "start_time")
+    return _list_response(project(rows, requested), next_cursor, if_none_match)
+
+def _occurrence_limit(limit: Optional[int]) -> int:
+    if limit is None:
+        return EVENT_QUERY_DEFAULT_LIMIT
+    if limit < 1 or limit > EVENT_QUERY_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {EVENT_QUERY_MAX_LIMIT}")
+    return limit
+
+@app.get("/events/occurrences")
+async def get_event_occurrences(
+    from_time: str = Query(..., alias="from"),
+    to_time: str = Query(..., alias="to"),
+    limit: Optional[int] = None,
+    user: dict = Depends(get_current_user)
+):
+    """
+    Calendar view: every occurrence starting in [from, to), recurring events
+    expanded, soonest first. `truncated` is true when `limit` cut the list.
+    """
+
+    user_id = user.get("id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    limit = _occurrence_limit(limit)
+    try:
+        start, end = parse_event_time(from_time), parse_event_time(to_time)
+    except RecurrenceError:
+        raise HTTPException(status_code=400, detail="'from' and 'to' must be ISO-8601 datetimes")
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+
+    try:
+        return await event_query.window(get_storage(), user_id, start, end, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-@app.delete("/events/{event_id}")
-def delete_event(event_id: str, user: dict = Depends(get_current_user)):
+@app.get("/events/upcoming")
+async def get_upcoming_events(limit: Optional[int] = None, user: dict = Depends(get_current_user)):
+    """The next `limit` occurrences from now, recurring events expanded"""
+
+    user_id = user.get("id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    limit = _occurrence_limit(limit)
+    try:
+        return await event_query.upcoming(get_storage(), user_id, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+@app.delete("/events/{event_id}", dependencies=[write_limit])
+async def delete_event(event_id: str, user: dict = Depends(get_current_user)):
     """Delete an event"""
     
     user_id = user.get("id")
@@ -237,34 +599,295 @@ def delete_event(event_id: str, user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=401, detail="Invalid user")
     
     try:
-        response = (
-            supabase.table("events")
-            .delete()
-            .eq("id", event_id)
-            .eq("user_id", user_id)
-            .execute()
-        )
+        rows = await get_storage().delete("events", user_id, [event_id])
 
-        if not response.data:
+        if not rows:
             raise HTTPException(status_code=404, detail="Event not found or unauthorized")
         
+        await _events_changed(user_id, deleted=[event_id])
         return {"message": "Event deleted successfully"}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+@app.post("/events/batch", dependencies=[write_limit])
+async def batch_events(batch: BatchRequest, user: dict = Depends(get_current_user)):
+    """
+    Create and delete many events in one request.
+    Each operation is {"op": "create"|"delete", "id": ..., "data": {...}};
+    results come back per operation, in request order.
+    """
+
+    user_id = user.get("id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    _check_batch_size(batch)
+    result = await execute_batch(
+        get_storage(), "events", user_id, batch.operations, EventCreate, prepare=prepare_event
+    )
+    if result.upserted or result.deleted:
+        await _events_changed(user_id, upserted=result.upserted, deleted=result.deleted)
+    return result.to_response()
+
+# =============================================
+# DELTA SYNC ENDPOINT
+# =============================================
+
+# key in the response/cursor -> (table, change timestamp column)
+SYNC_SOURCES = {
+    "notes": ("notes", "updated_at"),
+    "events": ("events", "updated_at"),
+    "deleted": ("deleted_records", "deleted_at"),
+}
+
+@app.get("/sync")
+async def sync(
+    since: Optional[str] = None,
+    limit: Optional[int] = None,
+    user: dict = Depends(get_current_user)
+):
+    """
+    Rows inserted or updated since `since`, plus tombstones for deleted rows.
+    Omit `since` for a full initial sync. Pass the returned `cursor` next
+    time; keep calling while `has_more` is true.
+    """
+
+    user_id = user.get("id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    limit = page_limit(limit)
+    cursors = decode_sync_cursor(since)
+
+    storage = get_storage()
+    queries = [
+        storage.select(table, user_id, cursor=cursors.get(key), order=changed_column, limit=limit + 1)
+        for key, (table, changed_column) in SYNC_SOURCES.items()
+    ]
+
+    try:
+        results = await asyncio.gather(*queries)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    changes = {}
+    has_more = False
+    for (key, (_, changed_column)), rows in zip(SYNC_SOURCES.items(), results):
+        if len(rows) > limit:
+            rows = rows[:limit]
+            has_more = True
+        if rows:
+            cursors[key] = encode_cursor(rows[-1], changed_column)
+        changes[key] = rows
+
+    return {
+        "notes": changes["notes"],
+        "events": changes["events"],
+        "deleted": [
+            {"table": row.get("table_name"), "id": row.get("row_id"), "deleted_at": row.get("deleted_at")}
+            for row in changes["deleted"]
+        ],
+        "cursor": encode_sync_cursor(cursors),
+        "has_more": has_more,
+    }
+
 # ========================================
 # 🤖 AI CHAT ENDPOINT (NEW!)
 # ========================================
 
-@app.post("/chat")
-def chat(
+context_flight = SingleFlight("context")
+
+async def _load_user_context(user_id: str) -> UserContext:
+    """Return the user's context from the cache, querying storage on a miss"""
+    ctx = context_cache.get(user_id)
+    if ctx is not None:
+        return ctx
+
+    # Concurrent chats from one user build the context once
+    return await context_flight.do(user_id, lambda: _fetch_user_context(user_id))
+
+async def _fetch_user_context(user_id: str) -> UserContext:
+    # A write after this point makes the snapshot too old to cache
+    generation = context_cache.generation(user_id)
+    # Both queries run in parallel
+    storage = get_storage()
+    try:
+        notes, events = await asyncio.gather(
+            storage.select("notes", user_id, NOTE_COLUMNS),
+            storage.select("events", user_id, EVENT_COLUMNS),
+        )
+    except Exception as e:
+        logger.warning("Error fetching context: %s", e)
+        return UserContext([], [])
+
+    # Indexing a large account is CPU work; keep it off the event loop
+    return await run_in_threadpool(
+        context_cache.put, user_id, notes, events, generation
+    )
+
+async def _build_chat_prompt(user_id: str, message: str) -> BuiltPrompt:
+    """
+    Pick the notes and events most relevant to the message and fit them,
+    with the conversation so far, into the prompt budget
+    """
+    with span("chat.context"):
+        ctx, history = await asyncio.gather(
+            _load_user_context(user_id),
+            conversation_memory.history(user_id),
+        )
+    with span("chat.retrieve"):
+        notes, events = retrieve(ctx, message)
+        prompt = prompt_builder.build(message, notes, events, history)
+    logger.debug("Prompt budget", extra={"prompt_usage": prompt.usage})
+    return prompt
+
+def _reply_cache_key(user_id: str, message: str, prompt: BuiltPrompt) -> str:
+    """
+    Same user, same question, same retrieved context and same conversation
+    window: follow-ups ("and the next one?") mean different things in
+    different conversations, so a reply is only reused where the prompt
+    would have been the same.
+    """
+    # Case and whitespace differences in the question shouldn't cause a miss
+    normalized = " ".join(message.split()).casefold()
+    context_version = hashlib.sha256(prompt.context.encode()).hexdigest()
+    history_version = hashlib.sha256(prompt.history.encode()).hexdigest()
+    return hashlib.sha256(f"{user_id}\0{normalized}\0{context_version}\0{history_version}".encode()).hexdigest()
+
+async def _remember(user_id: str, message: str, reply_text: str):
+    """Add the exchange to the user's conversation; memory is best effort"""
+    try:
+        await conversation_memory.record(user_id, message, reply_text)
+    except Exception as e:
+        logger.warning("Could not save conversation turn: %s", e)
+
+async def _summarize_conversation(prompt: str) -> str:
+    """Rolling conversation summaries run in the background, so they wait for an AI slot"""
+    async with await ai_admission.acquire(bounded=False):
+        return (await ai_router.generate(prompt)).strip()
+
+def _cache_reply(user_id: str, cache_key: str, reply_text: str):
+    if reply_text and ACTION_PREFIX not in reply_text:
+        reply_cache.set_for_user(user_id, cache_key, reply_text)
+
+async def _notes_changed(user_id: str, upserted: list = (), deleted: list = ()):
+    """Call after any write to the user's notes"""
+    reply_cache.invalidate_user(user_id)
+    context_cache.written(user_id)
+    context_flight.forget(lambda key: key == user_id)
+    if upserted:
+        context_cache.notes_upserted(user_id, upserted)
+    if deleted:
+        context_cache.notes_deleted(user_id, deleted)
+    change_hub.publish(user_id, "notes", upserted, deleted)
+    try:
+        with span("search.apply"):
+            await run_in_threadpool(search_index.apply, user_id, upserted, deleted)
+    except Exception as e:
+        # The write itself succeeded; a stale index entry is not worth a 500
+        logger.warning("Search index update failed: %s", e)
+
+async def _events_changed(user_id: str, upserted: list = (), deleted: list = ()):
+    """Call after any write to the user's events"""
+    reply_cache.invalidate_user(user_id)
+    event_query.invalidate(user_id)
+    context_cache.written(user_id)
+    context_flight.forget(lambda key: key == user_id)
+    if upserted:
+        context_cache.events_upserted(user_id, upserted)
+    if deleted:
+        context_cache.events_deleted(user_id, deleted)
+    change_hub.publish(user_id, "events", upserted, deleted)
+
+async def _execute_actions(reply_text: str, user_id: str) -> Optional[dict]:
+    """
+    Runs every [ACTION:...] directive in the reply as one batched write and
+    returns {"reply", "actions"} for the user, or None if there are none.
+    """
+    actions = parse_actions(reply_text)
+    if not actions:
+        return None
+    with span("chat.action"):
+        result = await execute_actions(get_storage(), user_id, actions)
+    if result.notes:
+        await _notes_changed(user_id, upserted=result.notes)
+    if result.events:
+        await _events_changed(user_id, upserted=result.events)
+
+    # Keep whatever the model said around the directives
+    prose = strip_actions(reply_text, actions)
+    summary = result.summary()
+    return {"reply": f"{prose}\n\n{summary}" if prose else summary, "actions": result.results}
+
+async def _chat_reply(user_id: str, message: str, bounded_wait: bool = True) -> dict:
+    """
+    The whole chat pipeline for one message: {"reply"}, plus "actions" when
+    the reply created notes or events. Provider failures come back as a
+    friendly reply. Raises Overloaded when every AI slot is taken and the
+    wait queue is full (bounded_wait=False waits instead).
+    """
+
+    # 1️⃣ FETCH USER CONTEXT + 2️⃣ RANK IT + 3️⃣ BUILD PROMPT WITHIN BUDGET
+    prompt = await _build_chat_prompt(user_id, message)
+
+    # Same question over unchanged context: skip the upstream call
+    cache_key = _reply_cache_key(user_id, message, prompt)
+    cached_reply = reply_cache.get(cache_key)
+    if cached_reply is not None:
+        await _remember(user_id, message, cached_reply)
+        return {"reply": cached_reply}
+
+    # 4️⃣ CALL THE AI PROVIDER (hedged, with failover)
+    try:
+        logger.debug("Calling AI (%s): %s chars", ", ".join(ai_router.names), prompt.usage["used_chars"])
+        async with await ai_admission.acquire(bounded=bounded_wait):
+            reply_text = (await ai_router.generate(prompt.text)).strip()
+
+        # 5️⃣ CHECK FOR ACTIONS
+
+        action_reply = await _execute_actions(reply_text, user_id)
+        if action_reply is not None:
+            await _remember(user_id, message, action_reply["reply"])
+            return action_reply
+
+        _cache_reply(user_id, cache_key, reply_text)
+        await _remember(user_id, message, reply_text)
+        return {"reply": reply_text}
+
+    except Overloaded:
+        raise
+
+    except ProviderError as e:
+        logger.warning("AI provider error: %s", e)
+        return {"reply": f"⚠️ AI Error ({e.status_code}). Please try again."}
+
+    except httpx.TimeoutException:
+        return {"reply": "⏱️ AI request timed out. Please try again."}
+    
+    except Exception as e:
+        logger.exception("Chat error: %s", e)
+        return {"reply": f"❌ Error: {str(e)}"}
+
+async def _chat_job_reply(user_id: str, message: str) -> str:
+    """Runs one queued chat; workers wait for an AI slot instead of being turned away"""
+    return (await _chat_reply(user_id, message, bounded_wait=False))["reply"]
+
+@app.post("/chat", dependencies=[chat_limit])
+async def chat(
+    response: Response,
     message: str = Form(...),
+    mode: str = Form(default="sync"),
     user: dict = Depends(get_current_user)
 ):
     """
-    AI Chat endpoint using Phi-3.5-mini-instruct via Hugging Face
+    AI Chat endpoint using the configured AI providers
     Considers user's notes and events as context
+
+    mode=async queues the message and answers 202 with a job id right away;
+    follow it with GET /chat/jobs/{id} or its /events stream.
     """
     
     user_id = user.get("id")
@@ -274,134 +897,261 @@ def chat(
     if not message.strip():
         raise HTTPException(status_code=400, detail="Message cannot be empty")
 
-    # 1️⃣ FETCH USER CONTEXT (from Supabase)
+    if mode == "sync":
+        try:
+            return await _chat_reply(user_id, message)
+        except Overloaded as e:
+            raise too_many_requests(e)
+    if mode != "async":
+        raise HTTPException(status_code=400, detail="mode must be 'sync' or 'async'")
+
     try:
-        notes_response = (
-            supabase.table("notes")
-            .select("title,content")
-            .eq("user_id", user_id)
-            .execute()
+        job = await chat_jobs.enqueue(user_id, message)
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=429 if e.per_user else 503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
         )
-        notes = notes_response.data or []
+    response.status_code = 202
+    return {"job_id": job["id"], "status": job["status"], "status_url": f"/chat/jobs/{job['id']}"}
 
-        events_response = (
-            supabase.table("events")
-            .select("title,start_time")
-            .eq("user_id", user_id)
-            .execute()
-        )
-        events = events_response.data or []
-    except Exception as e:
-        print(f"[DEBUG] Error fetching context: {str(e)}")
-        notes = []
-        events = []
-
-    # 2️⃣ BUILD CONTEXT STRING
-    context_str = ""
-    if notes:
-        context_str += "User Notes:\n"
-        for note in notes[:3]:  # Limit to 3 notes
-            note_title = note.get("title", "Untitled")
-            note_content = note.get("content", "")
-            context_str += f"- {note_title}: {note_content}\n"
-    
-    if events:
-        context_str += "\nUpcoming Events:\n"
-        for event in events[:3]:  # Limit to 3 events
-            event_title = event.get("title", "Untitled")
-            event_time = event.get("start_time", "Unknown time")
-            context_str += f"- {event_title} at {event_time}\n"
-
-    # 3️⃣ BUILD PROMPT
-    # Minimal prompt to keep URL length safe
-    # We add instructions for ACTIONS
-    system_instruction = (
-        "System: You are a helpful assistant. "
-        "To create a note, start reply with: [ACTION:NOTE|Title|Content]. "
-        "To create an event, start reply with: [ACTION:EVENT|Title|Time Description]. "
-        "Otherwise, just reply normally."
+@app.get("/chat/history")
+async def get_chat_history(user: dict = Depends(get_current_user)):
+    """What the assistant remembers: the rolling summary and the most recent turns"""
+    user_id = user.get("id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    history = await conversation_memory.history(user_id)
+    return {
+        "summary": history.summary,
+        "turns": [{"message": message, "reply": reply} for message, reply in history.turns],
+    }
+
+@app.delete("/chat/history")
+async def clear_chat_history(user: dict = Depends(get_current_user)):
+    """Start a fresh conversation"""
+    user_id = user.get("id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    await conversation_memory.clear(user_id)
+    return {"message": "Conversation cleared"}
+
+@app.get("/chat/jobs/{job_id}")
+async def get_chat_job(
+    job_id: str,
+    wait: float = Query(default=0, ge=0, le=30, description="Seconds to wait for the job to finish"),
+    user: dict = Depends(get_current_user)
+):
+    """Status of an async chat; `reply` is set once status is done"""
+    job = await chat_jobs.get(job_id, user.get("id"))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if wait and job["status"] in ("queued", "running") and await chat_jobs.wait(job_id, wait):
+        job = await chat_jobs.get(job_id, user.get("id"))
+    return job
+
+@app.get("/chat/jobs/{job_id}/events")
+async def chat_job_events(job_id: str, user: dict = Depends(get_current_user)):
+    """
+    Push channel for an async chat over Server-Sent Events: a "status"
+    event now, then the same "reply" and "done" events /chat/stream sends.
+    """
+    user_id = user.get("id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user")
+    job = await chat_jobs.get(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        current = job
+        yield _sse({"status": current["status"]}, "status")
+        while current["status"] in ("queued", "running"):
+            # Comment lines keep proxies from closing an idle stream
+            if not await chat_jobs.wait(job_id, 15):
+                yield ": keep-alive\n\n"
+            current = await chat_jobs.get(job_id, user_id)
+            if current is None:
+                break
+        if current is not None:
+            yield _sse({"reply": current["reply"] or current["error"], "status": current["status"]}, "reply")
+        yield _sse({}, "done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    
-    full_prompt = f"{system_instruction}\nContext:\n{context_str}\nUser: {message}\nAssistant:"
-    
-    # 4️⃣ CALL POLLINATIONS.AI (GET REQUEST)
-    import urllib.parse
-    import dateparser # pip install dateparser
-    
-    encoded_prompt = urllib.parse.quote(full_prompt)
-    url = f"{POLLINATIONS_API_URL}{encoded_prompt}"
 
-    try:
-        print(f"[DEBUG] Calling Pollinations: {url[:50]}...") # Log partial URL
-        response = requests.get(url, timeout=30)
+def _sse(data: dict, event: str = None, event_id: str = None) -> str:
+    """Format one Server-Sent Event; data is JSON so newlines are safe"""
+    prefix = f"event: {event}\n" if event else ""
+    if event_id:
+        prefix = f"id: {event_id}\n" + prefix
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
-        print(f"[DEBUG] Response status: {response.status_code}")
+@app.post("/chat/stream", dependencies=[chat_limit])
+async def chat_stream(
+    message: str = Form(...),
+    user: dict = Depends(get_current_user)
+):
+    """
+    Streaming variant of /chat over Server-Sent Events.
+    Plain replies are forwarded chunk by chunk as they arrive ("delta" events).
+    Replies starting with [ACTION:...] are buffered; any directives in the
+    reply are executed at the end and the result sent as one "reply".
+    The stream always ends with a "done" event.
+    """
 
-        if response.status_code != 200:
-             return {"reply": f"⚠️ AI Error ({response.status_code}). Please try again."}
+    user_id = user.get("id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user")
 
-        # 5️⃣ EXTRACT RESPONSE AND CHECK FOR ACTIONS
-        reply_text = response.text.strip()
+    if not message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
 
-        
-        # --- ACTION HANDLER ---
-        if reply_text.startswith("[ACTION:"):
-            try:
-                # Expected format: [ACTION:NOTE|Title|Content]
-                # Remove brackets
-                clean_cmd = reply_text[1:-1] # ACTION:NOTE|Title|Content
-                parts = clean_cmd.split("|")
-                
-                action_type = parts[0].split(":")[1] # NOTE or EVENT
-                
-                if action_type == "NOTE" and len(parts) >= 3:
-                     title = parts[1]
-                     content = parts[2]
-                     supabase.table("notes").insert({
-                        "title": title,
-                        "content": content,
-                        "status": "Pending",
-                        "user_id": user["id"]
-                     }).execute()
-                     return {"reply": f"✅ I've created the note: '{title}'."}
-                     
-                elif action_type == "EVENT" and len(parts) >= 3:
-                     title = parts[1]
-                     time_str = parts[2]
-                     
-                     # Magic time parsing
-                     dt = dateparser.parse(time_str)
-                     
-                     if dt:
-                         # Default duration 1 hour
-                         from datetime import timedelta
-                         end_dt = dt + timedelta(hours=1)
-                         
-                         supabase.table("events").insert({
-                            "title": title,
-                            "description": f"Scheduled via AI: {time_str}",
-                            "start_time": dt.isoformat(),
-                            "end_time": end_dt.isoformat(),
-                            "user_id": user["id"]
-                         }).execute()
-                         return {"reply": f"✅ Scheduled '{title}' for {dt.strftime('%b %d at %I:%M %p')}."}
-                     else:
-                         return {"reply": f"⚠️ I understood you wanted an event, but I couldn't understand the time '{time_str}'."}
-                         
-            except Exception as e:
-                print(f"[DEBUG] Action failed: {e}")
-                return {"reply": "⚠️ I tried to perform that action but something went wrong."}
-        
-        # --- END ACTION HANDLER ---
+    prompt = await _build_chat_prompt(user_id, message)
+    cache_key = _reply_cache_key(user_id, message, prompt)
+    cached_reply = reply_cache.get(cache_key)
 
-        return {"reply": reply_text}
+    # Take the AI slot before answering, so an overloaded server can still say 429
+    slot = None
+    if cached_reply is None:
+        try:
+            slot = await ai_admission.acquire()
+        except Overloaded as e:
+            raise too_many_requests(e)
 
-    except requests.exceptions.Timeout:
-        return {"reply": "⏱️ AI request timed out. Please try again."}
-    
-    except Exception as e:
-        print(f"[DEBUG] Chat error: {str(e)}")
-        return {"reply": f"❌ Error: {str(e)}"}
+    async def event_stream():
+        if cached_reply is not None:
+            yield _sse({"reply": cached_reply}, "reply")
+            await _remember(user_id, message, cached_reply)
+            yield _sse({}, "done")
+            return
+
+        try:
+            chunks = []
+            buffered = ""
+            is_action = None  # undecided until we've seen enough leading text
+            async for chunk in ai_router.stream(prompt.text):
+                chunks.append(chunk)
+                if is_action is False:
+                    yield _sse({"delta": chunk}, "delta")
+                    continue
+
+                buffered += chunk
+                head = buffered.lstrip()
+                if is_action is None:
+                    if len(head) >= len(ACTION_PREFIX):
+                        is_action = head.startswith(ACTION_PREFIX)
+                    elif not ACTION_PREFIX.startswith(head):
+                        is_action = False
+
+                if is_action is False:
+                    yield _sse({"delta": head}, "delta")
+
+            slot.release()
+            reply_text = "".join(chunks).strip()
+            # Directives can also follow some prose; the "reply" replaces the deltas
+            action_reply = await _execute_actions(reply_text, user_id)
+            if action_reply is not None:
+                yield _sse(action_reply, "reply")
+                await _remember(user_id, message, action_reply["reply"])
+            else:
+                if is_action is not False:
+                    # Short replies never left the buffer
+                    yield _sse({"reply": reply_text}, "reply")
+                _cache_reply(user_id, cache_key, reply_text)
+                await _remember(user_id, message, reply_text)
+
+        except ProviderError as e:
+            logger.warning("AI provider error: %s", e)
+            yield _sse({"reply": f"⚠️ AI Error ({e.status_code}). Please try again."}, "reply")
+        except httpx.TimeoutException:
+            yield _sse({"reply": "⏱️ AI request timed out. Please try again."}, "reply")
+        except Exception as e:
+            logger.exception("Chat stream error: %s", e)
+            yield _sse({"reply": f"❌ Error: {str(e)}"}, "reply")
+        finally:
+            slot.release()
+
+        yield _sse({}, "done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also runs if the client leaves before the stream starts
+        background=BackgroundTask(slot.release) if slot else None,
+    )
+
+
+# ========================================
+# 🔔 CHANGE FEED (push instead of refetch)
+# ========================================
+
+@app.get("/changes")
+async def change_stream(
+    cursor: Optional[str] = None,
+    last_event_id: Optional[str] = Header(default=None),
+    user: dict = Depends(get_current_user_or_query)
+):
+    """
+    Server-Sent Events with every change to the user's notes and events:
+    "change" events ({table, upserted rows, deleted ids}), "ready" or
+    "reset" first, ": heartbeat" comments while idle. Each change's id is
+    its cursor, so EventSource resumes by itself after a reconnect; on
+    "reset", refetch the lists once. "overflow" means this connection fell
+    behind and is being closed; reconnect to resume.
+    """
+    user_id = user.get("id")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user")
+
+    async def event_stream():
+        yield "retry: 2000\n\n"
+        async for kind, payload in change_hub.stream(user_id, last_event_id or cursor):
+            if kind == "change":
+                yield _sse(payload, "change", payload["cursor"])
+            elif kind == "heartbeat":
+                yield ": heartbeat\n\n"
+            else:
+                yield _sse({"cursor": payload}, kind, payload)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/changes/ws")
+async def change_socket(websocket: WebSocket, cursor: Optional[str] = None, access_token: Optional[str] = None):
+    """
+    Same feed over a WebSocket: JSON messages {"type": "ready"|"reset"|
+    "change"|"heartbeat"|"overflow", ...}. Reconnect with ?cursor=<last
+    change cursor> to resume.
+    """
+    try:
+        user = await authenticate(access_token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+
+    try:
+        async for kind, payload in change_hub.stream(user["id"], cursor):
+            if kind == "change":
+                await websocket.send_json({"type": "change", **payload})
+            elif kind == "heartbeat":
+                await websocket.send_json({"type": "heartbeat"})
+            else:
+                await websocket.send_json({"type": kind, "cursor": payload})
+        await websocket.close(code=1013)  # overflow: try again
+    except WebSocketDisconnect:
+        pass
 
 
 # -----------------------
@@ -0,0 +1,103 @@
+"""
+Keyset Pagination Helpers
+Opaque cursors, PostgREST keyset filters and column projection for list endpoints
+"""
+
+import base64
+import json
+import os
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+# Response header carrying the cursor for the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(row: dict, sort_column: str) -> str:
+    """Cursor pointing just past `row` in (sort_column, id) order"""
+    raw = json.dumps([row.get(sort_column), row.get("id")]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Returns (sort_value, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return sort_value, row_id
+
+
+def _quote(value) -> str:
+    # Timestamps contain '.' and ':' which PostgREST reserves inside or=()
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def keyset_filter(cursor: str, sort_column: str, descending: bool) -> str:
+    """PostgREST or=() body selecting rows strictly after the cursor"""
+    sort_value, row_id = decode_cursor(cursor)
+    op = "lt" if descending else "gt"
+    if sort_value is None:
+        return f"id.{op}.{_quote(row_id)}"
+    return (
+        f"{sort_column}.{op}.{_quote(sort_value)},"
+        f"and({sort_column}.eq.{_quote(sort_value)},id.{op}.{_quote(row_id)})"
+    )
+
+
+def parse_fields(fields: str, allowed: tuple, keyset_columns: tuple):
+    """
+    Validate a `fields=a,b` projection.
+    Returns (select string for the query, requested columns or None for all).
+    Keyset columns are always selected so the next cursor can be built.
+    """
+    if not fields:
+        return "*", None
+
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown) or '(empty)'}. Allowed: {', '.join(allowed)}",
+        )
+
+    selected = list(dict.fromkeys(requested + list(keyset_columns)))
+    return ",".join(selected), requested
+
+
+def page_limit(limit: int) -> int:
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def project(rows: list, requested) -> list:
+    if requested is None:
+        return rows
+    return [{c: row.get(c) for c in requested} for row in rows]
+
+
+def encode_sync_cursor(cursors: dict) -> str:
+    """One opaque cursor holding a keyset cursor per synced table"""
+    raw = json.dumps(cursors).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_sync_cursor(cursor: str) -> dict:
+    if not cursor:
+        return {}
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursors = json.loads(base64.urlsafe_b64decode(padded))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+    if not isinstance(cursors, dict):
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+    return cursors
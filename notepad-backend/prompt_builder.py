@@ -0,0 +1,181 @@
+"""
+Prompt Builder
+Assembles the chat prompt inside a fixed character budget and reports usage
+"""
+
+import os
+import threading
+
+# Budget Configuration
+PROMPT_BUDGET_CHARS = int(os.getenv("PROMPT_BUDGET_CHARS", "12000"))
+PROMPT_MESSAGE_SHARE = float(os.getenv("PROMPT_MESSAGE_SHARE", "0.25"))
+PROMPT_ITEM_MAX_CHARS = int(os.getenv("PROMPT_ITEM_MAX_CHARS", "800"))
+PROMPT_HISTORY_SHARE = float(os.getenv("PROMPT_HISTORY_SHARE", "0.25"))  # conversation summary + recent turns
+CHARS_PER_TOKEN = 4  # rough estimate for English text
+
+ELLIPSIS = "…"
+
+SYSTEM_INSTRUCTION = (
+    "System: You are a helpful assistant. "
+    "To create a note, reply with: [ACTION:NOTE|Title|Content]. "
+    "To create an event, reply with: [ACTION:EVENT|Title|Time Description]. "
+    "For several notes or events, put each action on its own line. "
+    "Inside an action write \\| for a literal | and \\] for a literal ]. "
+    "Otherwise, just reply normally."
+)
+
+
+def truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    if limit <= len(ELLIPSIS):
+        return ""
+    return text[:limit - len(ELLIPSIS)].rstrip() + ELLIPSIS
+
+
+def _note_line(note: dict) -> str:
+    return f"- {note.get('title', 'Untitled')}: {note.get('content', '')}"
+
+
+def _event_line(event: dict) -> str:
+    line = f"- {event.get('title', 'Untitled')} at {event.get('start_time', 'Unknown time')}"
+    if event.get("recurrence"):
+        line += f" (repeats: {event['recurrence']})"
+    return line
+
+
+def _turn_block(user: str, reply: str, limit: int) -> str:
+    half = max(limit // 2 - len("User: \nAssistant: "), 0)
+    return f"User: {truncate(user, half)}\nAssistant: {truncate(reply, half)}"
+
+
+class BuiltPrompt:
+    def __init__(self, text: str, usage: dict, context: str = "", history: str = ""):
+        self.text = text
+        self.usage = usage
+        self.context = context  # the notes/events block
+        self.history = history  # the conversation block, as it went into the prompt
+
+
+class PromptBuilder:
+    """
+    Budget split: the system instruction is always sent whole, the user
+    message may take up to PROMPT_MESSAGE_SHARE of the budget, conversation
+    history up to PROMPT_HISTORY_SHARE, and context items fill what is left
+    in rank order. Each item is capped at PROMPT_ITEM_MAX_CHARS, and the
+    last item that doesn't fit whole is cut to the space remaining.
+    """
+
+    def __init__(self, budget: int = PROMPT_BUDGET_CHARS, message_share: float = PROMPT_MESSAGE_SHARE,
+                 item_max_chars: int = PROMPT_ITEM_MAX_CHARS, system_instruction: str = SYSTEM_INSTRUCTION,
+                 history_share: float = PROMPT_HISTORY_SHARE):
+        self.budget = budget
+        self.message_share = message_share
+        self.history_share = history_share
+        self.item_max_chars = item_max_chars
+        self.system_instruction = system_instruction
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.total_used = 0
+        self.max_used = 0
+        self.truncated_items = 0
+        self.dropped_items = 0
+
+    def _fit_lines(self, lines: list, room: int):
+        """Returns (kept lines, chars used incl. newlines, truncated count, dropped count)"""
+        kept, used, truncated = [], 0, 0
+        for i, line in enumerate(lines):
+            space = room - used - 1  # newline
+            if space <= len(ELLIPSIS) + 2:
+                return kept, used, truncated, len(lines) - i
+            cut = truncate(line, min(self.item_max_chars, space))
+            truncated += len(cut) < len(line)
+            kept.append(cut)
+            used += len(cut) + 1
+        return kept, used, truncated, 0
+
+    def _fit_history(self, history, room: int) -> str:
+        """
+        Recent turns first, newest kept when space runs out, then the summary
+        in what they leave (at least a third of the room if it needs it)
+        """
+        if not history or room <= 0:
+            return ""
+        header, summary_label = "\nConversation so far:\n", "Summary: "
+        room -= len(header)
+        summary = f"{summary_label}{history.summary}" if history.summary else ""
+        summary_floor = min(len(summary) + 1, room // 3)
+        blocks = [_turn_block(user, reply, self.item_max_chars) for user, reply in reversed(history.turns)]
+        kept, used, _, _ = self._fit_lines(blocks, room - summary_floor)
+        summary = truncate(summary, room - used - 1) if summary else ""
+        if len(summary) <= len(summary_label) + len(ELLIPSIS):
+            summary = ""
+        lines = ([summary] if summary else []) + kept[::-1]
+        return header + "\n".join(lines) + "\n" if lines else ""
+
+    def build(self, message: str, notes: list = (), events: list = (), history=None) -> BuiltPrompt:
+        """`history` is a conversation.History: a rolling summary and the recent turns"""
+        message = message.strip()
+        message_text = truncate(message, int(self.budget * self.message_share))
+
+        notes_header, events_header = "User Notes:\n", "\nUpcoming Events:\n"
+        frame = f"{self.system_instruction}\nContext:\n\nUser: {message_text}\nAssistant:"
+        remaining = max(self.budget - len(frame) - len(notes_header) - len(events_header), 0)
+        history_str = self._fit_history(history, min(int(self.budget * self.history_share), remaining))
+        remaining -= len(history_str)
+
+        # Notes and events split the context budget in proportion to how many
+        # of each were retrieved; room one side leaves unused goes to the other
+        note_lines = [_note_line(n) for n in notes]
+        event_lines = [_event_line(e) for e in events]
+        total = len(note_lines) + len(event_lines)
+        note_room = remaining * len(note_lines) // total if total else 0
+
+        notes_fit = self._fit_lines(note_lines, note_room)
+        events_fit = self._fit_lines(event_lines, remaining - notes_fit[1])
+        if (notes_fit[2] or notes_fit[3]) and events_fit[1] < remaining - note_room:
+            notes_fit = self._fit_lines(note_lines, remaining - events_fit[1])
+
+        parts = []
+        if notes_fit[0]:
+            parts.append(notes_header + "\n".join(notes_fit[0]) + "\n")
+        if events_fit[0]:
+            parts.append(events_header + "\n".join(events_fit[0]) + "\n")
+        context_str = "".join(parts)
+        text = f"{self.system_instruction}\nContext:\n{context_str}{history_str}\nUser: {message_text}\nAssistant:"
+
+        truncated = notes_fit[2] + events_fit[2] + (len(message_text) < len(message))
+        dropped = notes_fit[3] + events_fit[3]
+        usage = {
+            "budget_chars": self.budget,
+            "used_chars": len(text),
+            "used_ratio": round(len(text) / self.budget, 4) if self.budget else 0.0,
+            "est_tokens": len(text) // CHARS_PER_TOKEN,
+            "system_chars": len(self.system_instruction),
+            "message_chars": len(message_text),
+            "context_chars": len(context_str),
+            "history_chars": len(history_str),
+            "items_included": len(notes_fit[0]) + len(events_fit[0]),
+            "items_truncated": truncated,
+            "items_dropped": dropped,
+        }
+        with self._lock:
+            self.builds += 1
+            self.total_used += len(text)
+            self.max_used = max(self.max_used, len(text))
+            self.truncated_items += truncated
+            self.dropped_items += dropped
+        return BuiltPrompt(text, usage, context_str, history_str)
+
+    def stats(self) -> dict:
+        return {
+            "budget_chars": self.budget,
+            "builds": self.builds,
+            "avg_used_chars": round(self.total_used / self.builds, 1) if self.builds else 0.0,
+            "max_used_chars": self.max_used,
+            "items_truncated": self.truncated_items,
+            "items_dropped": self.dropped_items,
+        }
+
+
+prompt_builder = PromptBuilder()
@@ -0,0 +1,208 @@
+"""
+Admission Control
+Per-user token-bucket rate limits and a global cap on concurrent AI calls
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, HTTPException
+from auth import get_current_user
+from metrics import Counter, Gauge, registry
+
+# Rate Limit Configuration
+# RATE_LIMIT_<NAME>="<requests>/<seconds>", e.g. RATE_LIMIT_CHAT="20/60";
+# "off" disables that limit. The burst size is the request count.
+DEFAULT_RATE_LIMITS = {
+    "chat": "20/60",    # /chat, /chat/stream
+    "write": "120/60",  # note/event creates, updates, deletes and batches
+}
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))  # buckets kept in memory
+
+# AI Concurrency Configuration
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "16"))  # AI calls in flight, all users
+AI_MAX_WAITING = int(os.getenv("AI_MAX_WAITING", "32"))  # requests allowed to queue for a slot
+AI_QUEUE_TIMEOUT_S = float(os.getenv("AI_QUEUE_TIMEOUT_S", "5"))
+
+rejections = registry.register(Counter("admission_rejected_total", "Requests turned away with 429", ("limit",)))
+ai_slots_in_use = registry.register(Gauge("ai_slots_in_use", "AI calls holding a concurrency slot"))
+ai_slots_waiting = registry.register(Gauge("ai_slots_waiting", "Requests queued for an AI concurrency slot"))
+
+
+class Overloaded(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def too_many_requests(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def parse_rate(spec: str):
+    """'20/60' -> (capacity 20, refill 20/60 tokens per second); 'off' -> None"""
+    spec = spec.strip().lower()
+    if spec in ("", "off", "0", "none"):
+        return None
+    count, _, seconds = spec.partition("/")
+    capacity, period = float(count), float(seconds or 1)
+    if capacity <= 0 or period <= 0:
+        raise ValueError(f"Invalid rate limit '{spec}' (expected <requests>/<seconds>)")
+    return capacity, capacity / period
+
+
+class TokenBucketLimiter:
+    """
+    One bucket per (limit name, user id), refilled continuously. Buckets
+    live in an LRU capped at max_keys; an evicted bucket had been idle the
+    longest, so it would have been full (or nearly) anyway.
+    Only touched from the event loop, so no lock is needed.
+    """
+
+    def __init__(self, limits: dict, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.limits = {name: parse_rate(spec) for name, spec in limits.items()}
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # (name, user_id) -> [tokens, last refill]
+        self.allowed = 0
+        self.rejected = 0
+
+    def check(self, name: str, user_id: str):
+        """Take one token or raise Overloaded with the seconds until the next one"""
+        limit = self.limits.get(name)
+        if limit is None:
+            return
+        capacity, rate = limit
+        now = time.monotonic()
+        key = (name, user_id)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [capacity, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed += 1
+            return
+        self.rejected += 1
+        rejections.inc(name)
+        raise Overloaded("Too many requests; slow down", math.ceil((1 - bucket[0]) / rate))
+
+    def dependency(self, name: str):
+        """FastAPI dependency enforcing `name` for the authenticated user"""
+        async def enforce(user: dict = Depends(get_current_user)):
+            try:
+                self.check(name, user.get("id"))
+            except Overloaded as e:
+                raise too_many_requests(e)
+        return enforce
+
+    def stats(self) -> dict:
+        return {
+            "limits": {
+                name: None if limit is None else {"burst": limit[0], "per_second": round(limit[1], 4)}
+                for name, limit in self.limits.items()
+            },
+            "tracked_buckets": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+
+class AISlot:
+    """A held concurrency slot; release() is idempotent so every exit path can call it"""
+
+    def __init__(self, limiter: "ConcurrencyLimiter"):
+        self._limiter = limiter
+        self._held = True
+
+    def release(self):
+        if self._held:
+            self._held = False
+            self._limiter._release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class ConcurrencyLimiter:
+    """
+    At most `limit` AI calls in flight across all users. Up to `max_waiting`
+    more may queue for `timeout` seconds; anything beyond that is turned
+    away at once instead of piling onto a slow upstream.
+    """
+
+    def __init__(self, limit: int = AI_MAX_CONCURRENCY, max_waiting: int = AI_MAX_WAITING,
+                 timeout: float = AI_QUEUE_TIMEOUT_S):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._semaphore = None  # created lazily so it binds to the running loop
+        self.in_use = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+        registry.add_collector(self._collect)
+
+    def _collect(self):
+        ai_slots_in_use.set(value=self.in_use)
+        ai_slots_waiting.set(value=self.waiting)
+
+    def _reject(self, message: str):
+        rejections.inc("ai_concurrency")
+        raise Overloaded(message, max(1, math.ceil(self.timeout)))
+
+    async def acquire(self, bounded: bool = True) -> AISlot:
+        """
+        bounded=False (background workers) waits as long as it takes and is
+        never rejected; the worker pool size already bounds them.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if bounded and self._semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                self._reject("The assistant is busy; please try again shortly")
+        self.waiting += 1
+        try:
+            if bounded:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            self._reject("The assistant is busy; please try again shortly")
+        finally:
+            self.waiting -= 1
+        self.in_use += 1
+        return AISlot(self)
+
+    def _release(self):
+        self.in_use -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+rate_limiter = TokenBucketLimiter({
+    name: os.getenv(f"RATE_LIMIT_{name.upper()}", spec) for name, spec in DEFAULT_RATE_LIMITS.items()
+})
+ai_admission = ConcurrencyLimiter()
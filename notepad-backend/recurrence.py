@@ -0,0 +1,250 @@
+"""
+Recurrence Rules
+A small RRULE subset (FREQ, INTERVAL, COUNT, UNTIL, BYDAY) expanded lazily, CPU only
+"""
+
+import itertools
+import math
+import os
+from datetime import datetime, timedelta, timezone
+
+# Recurrence Configuration
+RECURRENCE_MAX_COUNT = int(os.getenv("RECURRENCE_MAX_COUNT", "10000"))
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+# recurrence_end of a series that never ends; sorts after any real timestamp
+OPEN_ENDED = "9999-12-31T00:00:00+00:00"
+
+
+class RecurrenceError(ValueError):
+    pass
+
+
+def parse_time(value) -> datetime:
+    """ISO-8601 (or RFC 5545 basic form, 20270101T090000Z) as an aware UTC datetime"""
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        text = str(value or "").strip()
+        try:
+            dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            dt = None
+            for fmt in ("%Y%m%dT%H%M%SZ", "%Y%m%dT%H%M%S", "%Y%m%d"):
+                try:
+                    dt = datetime.strptime(text, fmt)
+                    break
+                except ValueError:
+                    pass
+            if dt is None:
+                raise RecurrenceError(f"'{value}' is not an ISO-8601 datetime")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+class Rule:
+    """One parsed rule, e.g. FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;COUNT=10"""
+
+    def __init__(self, freq: str, interval: int = 1, count: int = None, until: datetime = None,
+                 by_day: tuple = ()):
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.by_day = by_day  # sorted weekday numbers, Monday = 0
+
+    @classmethod
+    def parse(cls, text: str) -> "Rule":
+        text = (text or "").strip()
+        if text.upper().startswith("RRULE:"):
+            text = text[len("RRULE:"):]
+        parts = {}
+        for part in filter(None, text.split(";")):
+            key, sep, value = part.partition("=")
+            if not sep or not value.strip():
+                raise RecurrenceError(f"Malformed rule part '{part}'")
+            parts[key.strip().upper()] = value.strip()
+
+        freq = parts.pop("FREQ", "").upper()
+        if freq not in FREQUENCIES:
+            raise RecurrenceError(f"FREQ must be one of {', '.join(FREQUENCIES)}")
+        try:
+            interval = int(parts.pop("INTERVAL", "1"))
+            count = int(parts.pop("COUNT")) if "COUNT" in parts else None
+        except ValueError:
+            raise RecurrenceError("INTERVAL and COUNT must be whole numbers")
+        if interval < 1:
+            raise RecurrenceError("INTERVAL must be at least 1")
+        if count is not None and not 1 <= count <= RECURRENCE_MAX_COUNT:
+            raise RecurrenceError(f"COUNT must be between 1 and {RECURRENCE_MAX_COUNT}")
+        until = parse_time(parts.pop("UNTIL")) if "UNTIL" in parts else None
+        if count is not None and until is not None:
+            raise RecurrenceError("Use COUNT or UNTIL, not both")
+
+        by_day = ()
+        if "BYDAY" in parts:
+            if freq != "WEEKLY":
+                raise RecurrenceError("BYDAY is only supported with FREQ=WEEKLY")
+            days = [d.strip().upper() for d in parts.pop("BYDAY").split(",")]
+            unknown = [d for d in days if d not in WEEKDAYS]
+            if unknown:
+                raise RecurrenceError(f"Unknown BYDAY value(s): {', '.join(unknown)}")
+            by_day = tuple(sorted({WEEKDAYS.index(d) for d in days}))
+
+        if parts:
+            raise RecurrenceError(f"Unsupported rule part(s): {', '.join(parts)}")
+        return cls(freq, interval, count, until, by_day)
+
+    def __str__(self) -> str:
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.by_day:
+            parts.append("BYDAY=" + ",".join(WEEKDAYS[d] for d in self.by_day))
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        if self.until is not None:
+            parts.append("UNTIL=" + self.until.strftime("%Y%m%dT%H%M%SZ"))
+        return ";".join(parts)
+
+
+def _add_months(dt: datetime, months: int):
+    """Same day and time `months` later, or None when that month is too short (RFC 5545 skips it)"""
+    month = dt.month - 1 + months
+    try:
+        return dt.replace(year=dt.year + month // 12, month=month % 12 + 1)
+    except ValueError:
+        return None
+
+
+class Recurrence:
+    """
+    A rule anchored at the series' first start. Occurrences are produced
+    on demand: a window query jumps straight to the first period that can
+    reach the window instead of walking from the first start, so a daily
+    series that began ten years ago costs the same as one that began today.
+    All arithmetic is in UTC.
+    """
+
+    def __init__(self, rule: Rule, dtstart: datetime):
+        self.rule = rule
+        self.dtstart = dtstart
+        if rule.freq == "WEEKLY" and rule.by_day:
+            self._week_start = dtstart - timedelta(days=dtstart.weekday())
+            self._first_week = sum(1 for d in rule.by_day if d >= dtstart.weekday())
+        # Monthly/yearly periods can be skipped (31st, Feb 29), so COUNT
+        # bookkeeping has to walk them; every other period holds a fixed number
+        self._sparse = (
+            (rule.freq == "MONTHLY" and dtstart.day > 28)
+            or (rule.freq == "YEARLY" and dtstart.month == 2 and dtstart.day == 29)
+        )
+
+    @classmethod
+    def from_row(cls, start_time, recurrence: str) -> "Recurrence":
+        return cls(Rule.parse(recurrence), parse_time(start_time))
+
+    def _period(self, k: int) -> list:
+        """Occurrence candidates of period k (k = 0 holds dtstart), in order"""
+        rule, step = self.rule, k * self.rule.interval
+        if rule.freq == "DAILY":
+            return [self.dtstart + timedelta(days=step)]
+        if rule.freq == "WEEKLY":
+            if not rule.by_day:
+                return [self.dtstart + timedelta(weeks=step)]
+            week = self._week_start + timedelta(weeks=step)
+            days = rule.by_day if k else [d for d in rule.by_day if d >= self.dtstart.weekday()]
+            return [week + timedelta(days=d) for d in days]
+        found = _add_months(self.dtstart, step * (12 if rule.freq == "YEARLY" else 1))
+        return [found] if found is not None else []
+
+    def _first_period(self, start: datetime) -> int:
+        """A period at or just before the first one that can hold `start`"""
+        if start <= self.dtstart:
+            return 0
+        rule = self.rule
+        if rule.freq in ("DAILY", "WEEKLY"):
+            anchor = self._week_start if rule.by_day else self.dtstart
+            length = timedelta(days=rule.interval * (7 if rule.freq == "WEEKLY" else 1))
+            return max(0, math.floor((start - anchor) / length))
+        months = (start.year - self.dtstart.year) * 12 + start.month - self.dtstart.month
+        per_period = rule.interval * (12 if rule.freq == "YEARLY" else 1)
+        return max(0, months // per_period - 1)
+
+    def _occurrences_before(self, k: int) -> int:
+        """How many occurrences the periods before k hold"""
+        if k == 0:
+            return 0
+        if self.rule.freq == "WEEKLY" and self.rule.by_day:
+            return self._first_week + (k - 1) * len(self.rule.by_day)
+        if self._sparse:
+            return sum(len(self._period(i)) for i in range(k))
+        return k
+
+    def occurrences(self, start: datetime = None, end: datetime = None):
+        """Occurrence starts in [start, end), soonest first; `end` None means no upper bound"""
+        rule = self.rule
+        k = self._first_period(start) if start is not None else 0
+        if rule.count is not None:
+            number = self._occurrences_before(k)
+            if number >= rule.count:
+                return
+        for k in itertools.count(k):
+            for occurrence in self._period(k):
+                if rule.until is not None and occurrence > rule.until:
+                    return
+                if end is not None and occurrence >= end:
+                    return
+                if rule.count is not None:
+                    if number >= rule.count:
+                        return
+                    number += 1
+                if start is None or occurrence >= start:
+                    yield occurrence
+
+    def next_after(self, moment: datetime):
+        """First occurrence starting at or after `moment`, or None"""
+        return next(self.occurrences(moment), None)
+
+    def last(self):
+        """Start of the final occurrence; None for a series that never ends"""
+        rule = self.rule
+        if rule.count is not None:
+            k = 0
+            number = 0
+            while True:
+                for occurrence in self._period(k):
+                    number += 1
+                    if number == rule.count:
+                        return occurrence
+                k += 1
+        if rule.until is not None:
+            # Walk back from UNTIL; the longest gap between occurrences is
+            # eight years (Feb 29 skipping a century year), so look that far
+            lookback = {
+                "DAILY": timedelta(days=rule.interval),
+                "WEEKLY": timedelta(weeks=rule.interval),
+                "MONTHLY": timedelta(days=93 * rule.interval),
+                "YEARLY": timedelta(days=366 * 8 * rule.interval),
+            }[rule.freq]
+            last = None
+            for occurrence in self.occurrences(max(self.dtstart, rule.until - lookback)):
+                last = occurrence
+            return last if last is not None else self.dtstart
+        return None
+
+
+def series_fields(start_time, recurrence: str) -> dict:
+    """
+    Columns stored with a recurring event: the normalized rule and
+    recurrence_end, the start of its last occurrence (OPEN_ENDED if none),
+    which is what window queries range-scan on
+    """
+    recurrence_ = Recurrence.from_row(start_time, recurrence)
+    last = recurrence_.last()
+    return {
+        "recurrence": str(recurrence_.rule),
+        "recurrence_end": OPEN_ENDED if last is None else last.isoformat(),
+    }
@@ -0,0 +1,42 @@
+"""
+JSON Responses
+One-pass JSON rendering, using orjson when it is installed
+"""
+
+import json
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library is a slower fallback
+    orjson = None
+
+
+def _default(value):
+    # Dates and times as ISO-8601, like jsonable_encoder; anything else as str()
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def dumps(content) -> bytes:
+    """Compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    The app's default response class. FastAPI still runs jsonable_encoder
+    on what an endpoint returns; only the final dumps is replaced. Large
+    lists skip both by building their body with dumps() directly.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def json_body(body: bytes, headers: dict = None) -> Response:
+    """A response for a body that is already serialized, so FastAPI doesn't encode it again"""
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,235 @@
+"""
+Chat Context Retrieval
+Per-user BM25 index over notes and proximity ranking for events, CPU only
+"""
+
+import bisect
+import heapq
+import math
+import os
+import re
+from collections import Counter
+from datetime import datetime, timezone
+
+from recurrence import Recurrence, RecurrenceError
+
+# Retrieval Configuration
+CONTEXT_TOP_NOTES = int(os.getenv("CONTEXT_TOP_NOTES", "8"))
+CONTEXT_TOP_EVENTS = int(os.getenv("CONTEXT_TOP_EVENTS", "8"))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_BOOST = 2  # title terms count this many times
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by do for from has have how i in is it me my of on or "
+    "so that the this to was what when where which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> list:
+    return [w for w in _WORD.findall((text or "").lower()) if len(w) > 1 and w not in _STOPWORDS]
+
+
+class BM25Index:
+    """
+    Inverted index updated in place on every note write.
+    A query only touches the postings of its own terms, so cost grows with
+    how many notes share the query's words, not with account size.
+    """
+
+    def __init__(self):
+        self.postings = {}   # term -> {doc_id: term frequency}
+        self.doc_terms = {}  # doc_id -> {term: term frequency}
+        self.doc_len = {}    # doc_id -> length in tokens
+        self.total_len = 0
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, doc_id: str, title: str, content: str):
+        if doc_id in self.doc_len:
+            self.remove(doc_id)
+        terms = Counter(tokenize(content))
+        for term in tokenize(title):
+            terms[term] += TITLE_BOOST
+        length = sum(terms.values())
+        postings = self.postings
+        for term, tf in terms.items():
+            docs = postings.get(term)
+            if docs is None:
+                postings[term] = {doc_id: tf}
+            else:
+                docs[doc_id] = tf
+        self.doc_terms[doc_id] = terms
+        self.doc_len[doc_id] = length
+        self.total_len += length
+
+    def remove(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_len -= self.doc_len.pop(doc_id)
+
+    def search(self, query: str, k: int) -> list:
+        """Top-k (doc_id, score), best first"""
+        n_docs = len(self.doc_len)
+        if not n_docs:
+            return []
+        avg_len = self.total_len / n_docs or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            df = len(docs)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in docs.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        if not scores:
+            return []
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def _parse_start(value):
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _parse_recurrence(event: dict, start: datetime):
+    if not event.get("recurrence"):
+        return None
+    try:
+        return Recurrence.from_row(start, event["recurrence"])
+    except RecurrenceError:
+        return None
+
+
+class EventIndex:
+    """
+    Events sorted by start time plus an inverted index over title words,
+    so "next k upcoming" is a bisect and title matches are a dict lookup.
+    Recurring events are kept apart and placed at their next occurrence.
+    """
+
+    def __init__(self):
+        self.by_start = []  # sorted (start, event_id), one-off events only
+        self.meta = {}      # event_id -> (start, title terms)
+        self.series = {}    # event_id -> Recurrence
+        self.title_postings = {}  # term -> set of event_ids
+
+    def add(self, event_id: str, event: dict):
+        self.remove(event_id)
+        start = _parse_start(event.get("start_time"))
+        if start is None:
+            return
+        terms = set(tokenize(event.get("title")))
+        self.meta[event_id] = (start, terms)
+        recurrence = _parse_recurrence(event, start)
+        if recurrence is not None:
+            self.series[event_id] = recurrence
+        else:
+            bisect.insort(self.by_start, (start, event_id))
+        for term in terms:
+            self.title_postings.setdefault(term, set()).add(event_id)
+
+    def remove(self, event_id: str):
+        found = self.meta.pop(event_id, None)
+        if found is None:
+            return
+        start, terms = found
+        if self.series.pop(event_id, None) is None:
+            i = bisect.bisect_left(self.by_start, (start, event_id))
+            if i < len(self.by_start) and self.by_start[i] == (start, event_id):
+                del self.by_start[i]
+        for term in terms:
+            ids = self.title_postings.get(term)
+            if ids is not None:
+                ids.discard(event_id)
+                if not ids:
+                    del self.title_postings[term]
+
+    def start_near(self, event_id: str, now: datetime) -> datetime:
+        """Start time to rank by: a recurring event's next occurrence, else its last one"""
+        start, _ = self.meta[event_id]
+        recurrence = self.series.get(event_id)
+        if recurrence is None:
+            return start
+        upcoming = recurrence.next_after(now)
+        return upcoming if upcoming is not None else (recurrence.last() or start)
+
+    def upcoming(self, now: datetime, k: int) -> list:
+        i = bisect.bisect_left(self.by_start, (now, ""))
+        found = self.by_start[i:i + k]
+        if self.series:
+            repeating = []
+            for event_id, recurrence in self.series.items():
+                upcoming = recurrence.next_after(now)
+                if upcoming is not None:
+                    repeating.append((upcoming, event_id))
+            found = heapq.nsmallest(k, found + repeating)
+        return [event_id for _, event_id in found]
+
+    def matching(self, query_terms: set) -> dict:
+        """event_id -> number of title words shared with the query"""
+        counts = {}
+        for term in query_terms:
+            for event_id in self.title_postings.get(term, ()):
+                counts[event_id] = counts.get(event_id, 0) + 1
+        return counts
+
+
+def rank_events(events: dict, index: EventIndex, query: str, k: int, now: datetime = None) -> list:
+    """
+    Upcoming events, soonest first. Past events only qualify when their
+    title shares words with the message, and matches always rank first.
+    """
+    now = now or datetime.now(timezone.utc)
+    matches = index.matching(set(tokenize(query)))
+    candidates = set(matches) | set(index.upcoming(now, k))
+    ranked = []
+    for event_id in candidates:
+        start = index.start_near(event_id, now)
+        upcoming = start >= now
+        distance = abs((start - now).total_seconds())
+        ranked.append((-matches.get(event_id, 0), not upcoming, distance, event_id, start))
+    ranked = heapq.nsmallest(k, ranked)
+    selected = []
+    for _, _, _, event_id, start in ranked:
+        event = events.get(event_id)
+        if event is None:
+            continue
+        if event_id in index.series:
+            # Show the occurrence that was ranked, not the series' first start
+            event = {**event, "start_time": start.isoformat()}
+        selected.append(event)
+    return selected
+
+
+def select_notes(notes: dict, index: BM25Index, query: str, k: int) -> list:
+    """Best-matching notes; falls back to the most recently written ones"""
+    hits = index.search(query, k)
+    if hits:
+        return [notes[doc_id] for doc_id, _ in hits if doc_id in notes]
+    return list(notes.values())[-k:][::-1]
+
+
+def retrieve(ctx, query: str, top_notes: int = CONTEXT_TOP_NOTES, top_events: int = CONTEXT_TOP_EVENTS):
+    """Return (notes, events) for this message, best first; the prompt builder fits them to its budget"""
+    notes = select_notes(ctx.notes, ctx.note_index, query, top_notes)
+    events = rank_events(ctx.events, ctx.event_index, query, top_events)
+    return notes, events
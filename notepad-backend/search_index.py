@@ -0,0 +1,242 @@
+"""
+Note Search Index
+SQLite FTS5 full-text index over note titles and content, maintained incrementally
+"""
+
+import hashlib
+import html
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+SEARCH_INDEX_PATH = os.getenv(
+    "SEARCH_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "notes_search.db"),
+)
+
+# bm25 column weights: title, content, owner
+TITLE_WEIGHT = 4.0
+CONTENT_WEIGHT = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_docs (
+    rowid INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    note_id TEXT NOT NULL,
+    UNIQUE (user_id, note_id)
+);
+CREATE TABLE IF NOT EXISTS search_users (
+    user_id TEXT PRIMARY KEY,
+    indexed_at TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+    title,
+    content,
+    owner,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3 4'
+);
+"""
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# highlight()/snippet() wrap matches in these private-use characters; the
+# text is HTML-escaped first and only then are they turned into <mark> tags
+_MARK_OPEN, _MARK_CLOSE = "\ue000", "\ue001"
+
+
+def _marked_html(text: str) -> str:
+    """Note text is user input: escape it, then insert the match marks"""
+    return html.escape(text or "").replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+
+
+def _owner_token(user_id: str) -> str:
+    # One alphanumeric token per user, so "owner:<token>" narrows the
+    # match to that user's rows inside the FTS index itself
+    return "u" + hashlib.sha1(str(user_id).encode()).hexdigest()
+
+
+def build_match_query(text: str, owner: str):
+    """
+    Turn free text into an FTS5 query: every word must match, the last one
+    as a prefix (search-as-you-type). Returns None when there is nothing to search.
+    """
+    words = _WORD.findall(text.lower())
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+    return f"owner:{owner} AND ({' '.join(terms)})"
+
+
+class NoteSearchIndex:
+    """One SQLite connection guarded by a lock; every call is short"""
+
+    def __init__(self, path: str = SEARCH_INDEX_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._backfills = {}  # user id -> note-id sets of the backfills in progress
+
+    def open(self):
+        if self._conn is not None:
+            return
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _require(self):
+        if self._conn is None:
+            raise RuntimeError("Search index is not open; is the app started?")
+        return self._conn
+
+    def _upsert_rows(self, conn, user_id: str, rows: list):
+        owner = _owner_token(user_id)
+        for row in rows:
+            note_id = row.get("id")
+            if note_id is None:
+                continue
+            conn.execute(
+                "INSERT OR IGNORE INTO search_docs (user_id, note_id) VALUES (?, ?)",
+                (user_id, str(note_id)),
+            )
+            (rowid,) = conn.execute(
+                "SELECT rowid FROM search_docs WHERE user_id = ? AND note_id = ?",
+                (user_id, str(note_id)),
+            ).fetchone()
+            conn.execute("DELETE FROM notes_fts WHERE rowid = ?", (rowid,))
+            conn.execute(
+                "INSERT INTO notes_fts (rowid, title, content, owner) VALUES (?, ?, ?, ?)",
+                (rowid, row.get("title") or "", row.get("content") or "", owner),
+            )
+
+    def apply(self, user_id: str, upserted: list = (), deleted: list = ()):
+        """Index written rows (which must carry id, title and content) and drop deleted ids"""
+        with self._lock:
+            for touched in self._backfills.get(user_id, ()):
+                touched.update(str(row.get("id")) for row in upserted)
+                touched.update(str(note_id) for note_id in deleted)
+            conn = self._require()
+            conn.execute("BEGIN")
+            try:
+                self._upsert_rows(conn, user_id, upserted)
+                for note_id in deleted:
+                    found = conn.execute(
+                        "SELECT rowid FROM search_docs WHERE user_id = ? AND note_id = ?",
+                        (user_id, str(note_id)),
+                    ).fetchone()
+                    if found:
+                        conn.execute("DELETE FROM notes_fts WHERE rowid = ?", found)
+                        conn.execute("DELETE FROM search_docs WHERE rowid = ?", found)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def is_indexed(self, user_id: str) -> bool:
+        with self._lock:
+            row = self._require().execute(
+                "SELECT 1 FROM search_users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row is not None
+
+    def begin_backfill(self, user_id: str) -> set:
+        """
+        Call before reading the rows for rebuild_user(). Notes written
+        through apply() from now on are recorded in the returned set, and
+        the rebuild leaves them alone: what apply() indexed is newer than
+        the snapshot being backfilled.
+        """
+        touched = set()
+        with self._lock:
+            self._backfills.setdefault(user_id, []).append(touched)
+        return touched
+
+    def end_backfill(self, user_id: str, touched: set):
+        with self._lock:
+            backfills = self._backfills.get(user_id, [])
+            if any(t is touched for t in backfills):
+                backfills[:] = [t for t in backfills if t is not touched]
+            if not backfills:
+                self._backfills.pop(user_id, None)
+
+    def rebuild_user(self, user_id: str, rows: list, touched: set = None):
+        """Replace what is indexed for the user with `rows` (initial backfill), skipping notes in `touched`"""
+        with self._lock:
+            touched = set(touched or ())
+            conn = self._require()
+            conn.execute("BEGIN")
+            try:
+                stale = [
+                    rowid for rowid, note_id in conn.execute(
+                        "SELECT rowid, note_id FROM search_docs WHERE user_id = ?", (user_id,)
+                    ).fetchall()
+                    if note_id not in touched
+                ]
+                conn.executemany("DELETE FROM notes_fts WHERE rowid = ?", [(r,) for r in stale])
+                conn.executemany("DELETE FROM search_docs WHERE rowid = ?", [(r,) for r in stale])
+                self._upsert_rows(conn, user_id, [row for row in rows if str(row.get("id")) not in touched])
+                conn.execute(
+                    "INSERT OR REPLACE INTO search_users (user_id, indexed_at) VALUES (?, ?)",
+                    (user_id, datetime.now(timezone.utc).isoformat()),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def search(self, user_id: str, text: str, limit: int = 20, offset: int = 0) -> list:
+        """Best matches first; each hit has id, title and snippet (HTML-escaped, matches in <mark>) and score"""
+        match = build_match_query(text, _owner_token(user_id))
+        if match is None:
+            return []
+        with self._lock:
+            conn = self._require()
+            # Rank first; highlight()/snippet() are costly, so only the
+            # page being returned gets them
+            ranked = conn.execute(
+                f"""
+                SELECT rowid, bm25(notes_fts, {TITLE_WEIGHT}, {CONTENT_WEIGHT}, 0.0) AS score
+                FROM notes_fts
+                WHERE notes_fts MATCH ?
+                ORDER BY score
+                LIMIT ? OFFSET ?
+                """,
+                (match, limit, offset),
+            ).fetchall()
+            if not ranked:
+                return []
+            scores = dict(ranked)
+            placeholders = ",".join("?" * len(scores))
+            details = conn.execute(
+                f"""
+                SELECT notes_fts.rowid, d.note_id,
+                       highlight(notes_fts, 0, ?, ?),
+                       snippet(notes_fts, 1, ?, ?, '…', 16)
+                FROM notes_fts
+                JOIN search_docs d ON d.rowid = notes_fts.rowid
+                WHERE notes_fts MATCH ? AND notes_fts.rowid IN ({placeholders}) AND d.user_id = ?
+                """,
+                (_MARK_OPEN, _MARK_CLOSE, _MARK_OPEN, _MARK_CLOSE, match, *scores, user_id),
+            ).fetchall()
+        rows = sorted(
+            ((note_id, title, snippet, scores[rowid]) for rowid, note_id, title, snippet in details),
+            key=lambda row: row[3],
+        )
+        return [
+            # bm25() is lower-is-better; flip it so higher means more relevant
+            {"id": note_id, "title": _marked_html(title), "snippet": _marked_html(snippet), "score": round(-score, 6)}
+            for note_id, title, snippet, score in rows
+        ]
+
+
+search_index = NoteSearchIndex()
@@ -0,0 +1,57 @@
+"""
+Request Coalescing (single-flight)
+Concurrent identical operations share one in-flight call and its result
+"""
+
+import asyncio
+
+
+class SingleFlight:
+    """
+    do(key, fn) runs fn() unless a call with the same key is already in
+    flight, in which case it waits for that call instead. The shared call
+    runs as its own task, so one caller being cancelled (e.g. a client
+    disconnecting) doesn't cancel it for the others. Results and exceptions
+    are handed to every waiter as-is; they must not be mutated.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}  # key -> asyncio.Task
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+    def forget(self, match):
+        """
+        Stop sharing in-flight calls whose key satisfies match(key); calls
+        made after a write must not join a read that started before it.
+        The forgotten calls still finish for the callers already waiting.
+        """
+        for key in [k for k in self._inflight if match(k)]:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        total = self.executions + self.coalesced
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+            "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,353 @@
+"""
+SQLite Storage Backend
+Local, network-free storage for single-node deployments, tests and load runs
+"""
+
+import os
+import queue
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from fastapi.concurrency import run_in_threadpool
+from metrics import span
+from pagination import decode_cursor
+from storage import Storage
+
+SQLITE_PATH = os.getenv(
+    "SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "notes.db"),
+)
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_STATEMENT_CACHE = 256  # prepared statements kept per connection
+
+SCHEMA_VERSION = 2
+
+TABLE_COLUMNS = {
+    "notes": ("id", "user_id", "title", "content", "status", "created_at", "updated_at"),
+    "events": ("id", "user_id", "title", "description", "start_time", "end_time", "recurrence", "recurrence_end",
+               "created_at", "updated_at"),
+    "deleted_records": ("id", "table_name", "row_id", "user_id", "deleted_at"),
+}
+# Only notes and events are written through the API; tombstones come from deletes
+WRITABLE_TABLES = ("notes", "events")
+# Stored as UTC ISO-8601 text (like timestamptz output) so text order is time order
+TIMESTAMP_COLUMNS = frozenset({"start_time", "end_time", "recurrence_end", "created_at", "updated_at", "deleted_at"})
+PROTECTED_COLUMNS = frozenset({"id", "user_id", "created_at", "updated_at"})
+
+_TABLES = """
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'Pending',
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    recurrence TEXT,
+    recurrence_end TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+_SUPPORT = """
+CREATE TABLE IF NOT EXISTS deleted_records (
+    id INTEGER PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    row_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    deleted_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_user_created_idx ON notes (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS notes_user_updated_idx ON notes (user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS events_user_start_idx ON events (user_id, start_time, id);
+CREATE INDEX IF NOT EXISTS events_user_updated_idx ON events (user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS events_user_recurrence_idx ON events (user_id, recurrence_end)
+    WHERE recurrence_end IS NOT NULL;
+CREATE INDEX IF NOT EXISTS deleted_records_user_idx ON deleted_records (user_id, deleted_at, id);
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def to_timestamp(value) -> str:
+    """Normalize to UTC ISO-8601; naive values are taken as UTC, as timestamptz does"""
+    if value is None:
+        return None
+    text = str(value).strip().replace("Z", "+00:00")
+    dt = datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat()
+
+
+def _check_columns(table: str, columns) -> None:
+    allowed = TABLE_COLUMNS.get(table)
+    if allowed is None:
+        raise ValueError(f"Unknown table '{table}'")
+    unknown = [c for c in columns if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown column(s) for {table}: {', '.join(unknown)}")
+
+
+def _db_value(column: str, value):
+    if column in TIMESTAMP_COLUMNS and value is not None:
+        return to_timestamp(value)
+    if hasattr(value, "value"):  # Enum members, e.g. NoteStatus
+        return value.value
+    return value
+
+
+def migrate(conn: sqlite3.Connection) -> None:
+    """
+    Bring the file up to SCHEMA_VERSION. Version 0 is the original
+    SQLAlchemy schema (no status/updated_at, naive DATETIME text);
+    version 2 adds recurring events.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for statement in _TABLES.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+
+        columns = {table: {row[1] for row in conn.execute(f"PRAGMA table_info({table})")} for table in WRITABLE_TABLES}
+        if "status" not in columns["notes"]:
+            conn.execute("ALTER TABLE notes ADD COLUMN status TEXT NOT NULL DEFAULT 'Pending'")
+        for table in WRITABLE_TABLES:
+            if "updated_at" not in columns[table]:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN updated_at TEXT")
+        for column in ("recurrence", "recurrence_end"):
+            if column not in columns["events"]:
+                conn.execute(f"ALTER TABLE events ADD COLUMN {column} TEXT")
+
+        # Old rows: rewrite timestamps in the canonical form and backfill updated_at
+        for table in WRITABLE_TABLES:
+            if table not in existing or version >= 1:
+                continue
+            ts_columns = [c for c in ("created_at", "start_time", "end_time") if c in TABLE_COLUMNS[table]]
+            rows = conn.execute(f"SELECT id, {', '.join(ts_columns)}, updated_at FROM {table}").fetchall()
+            for row in rows:
+                values = {c: to_timestamp(v) if v else _now() for c, v in zip(ts_columns, row[1:-1])}
+                values["updated_at"] = to_timestamp(row[-1]) if row[-1] else values["created_at"]
+                assignments = ", ".join(f"{c} = ?" for c in values)
+                conn.execute(f"UPDATE {table} SET {assignments} WHERE id = ?", (*values.values(), row[0]))
+
+        for statement in _SUPPORT.split(";"):
+            if statement.strip():
+                conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+class ConnectionPool:
+    """Fixed set of connections handed out one thread at a time"""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._all = []
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,  # explicit BEGIN/COMMIT
+            cached_statements=SQLITE_STATEMENT_CACHE,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def open(self):
+        first = self._connect()
+        first.execute("PRAGMA journal_mode = WAL")
+        migrate(first)
+        self._all.append(first)
+        self._idle.put(first)
+        for _ in range(self.size - 1):
+            conn = self._connect()
+            self._all.append(conn)
+            self._idle.put(conn)
+
+    def close(self):
+        for conn in self._all:
+            conn.close()
+        self._all.clear()
+        self._idle = queue.LifoQueue()
+
+    @contextmanager
+    def connection(self):
+        conn = self._idle.get(timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+
+class SQLiteStorage(Storage):
+    """
+    WAL mode so readers never wait for a writer, a pool of connections used
+    from the threadpool, and fixed SQL text per call shape so sqlite3's
+    per-connection statement cache reuses the prepared statements.
+    Every statement is filtered or stamped with the caller's user_id.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SQLITE_PATH, pool_size: int = SQLITE_POOL_SIZE):
+        self.pool = ConnectionPool(path, pool_size)
+
+    async def open(self):
+        await run_in_threadpool(self.pool.open)
+
+    async def close(self):
+        self.pool.close()
+
+    async def warm_up(self):
+        def touch():
+            with self.pool.connection() as conn:
+                for table in TABLE_COLUMNS:
+                    conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchall()
+        await run_in_threadpool(touch)
+
+    # -----------------------
+    # Reads
+    # -----------------------
+
+    def _select(self, table, user_id, columns, eq, gte, lt, cursor, order, descending, limit):
+        selected = [c.strip() for c in columns.split(",")] if columns != "*" else list(TABLE_COLUMNS.get(table, ()))
+        filters = {**(eq or {}), **(gte or {}), **(lt or {})}
+        _check_columns(table, selected + list(filters) + ([order] if order else []))
+
+        where, params = ["user_id = ?"], [user_id]
+        for op, conditions in (("=", eq), (">=", gte), ("<", lt)):
+            for column, value in (conditions or {}).items():
+                where.append(f"{column} {op} ?")
+                params.append(_db_value(column, value))
+        if cursor:
+            sort_value, row_id = decode_cursor(cursor)
+            op = "<" if descending else ">"
+            if sort_value is None:
+                where.append(f"id {op} ?")
+                params.append(row_id)
+            else:
+                where.append(f"({order}, id) {op} (?, ?)")
+                params.extend((_db_value(order, sort_value), row_id))
+
+        sql = f"SELECT {', '.join(selected)} FROM {table} WHERE {' AND '.join(where)}"
+        if order:
+            direction = "DESC" if descending else "ASC"
+            sql += f" ORDER BY {order} {direction}, id {direction}"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self.pool.connection() as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    async def select(self, table, user_id, columns="*", *, eq=None, gte=None, lt=None, cursor=None,
+                     order=None, descending=False, limit=None):
+        with span("sqlite.select"):
+            return await run_in_threadpool(
+                self._select, table, user_id, columns, eq, gte, lt, cursor, order, descending, limit
+            )
+
+    # -----------------------
+    # Writes
+    # -----------------------
+
+    @contextmanager
+    def _transaction(self):
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _insert(self, table, user_id, rows):
+        if table not in WRITABLE_TABLES:
+            raise ValueError(f"Table '{table}' is read-only")
+        inserted = []
+        with self._transaction() as conn:
+            # Stamped under the write lock, so commit order matches timestamp order for /sync
+            now = _now()
+            for row in rows:
+                values = {k: _db_value(k, v) for k, v in row.items() if k not in PROTECTED_COLUMNS}
+                _check_columns(table, values)
+                values.update(user_id=user_id, created_at=now, updated_at=now)
+                sql = (
+                    f"INSERT INTO {table} ({', '.join(values)}) "
+                    f"VALUES ({', '.join('?' * len(values))}) RETURNING *"
+                )
+                inserted.append(dict(conn.execute(sql, list(values.values())).fetchone()))
+        return inserted
+
+    async def insert(self, table, user_id, rows):
+        with span("sqlite.insert"):
+            return await run_in_threadpool(self._insert, table, user_id, list(rows))
+
+    def _update(self, table, user_id, ids, values):
+        if table not in WRITABLE_TABLES:
+            raise ValueError(f"Table '{table}' is read-only")
+        ids = list(ids)
+        values = {k: _db_value(k, v) for k, v in values.items() if k not in PROTECTED_COLUMNS}
+        _check_columns(table, values)
+        if not ids or not values:
+            return []
+        sql = (
+            f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in values)}, updated_at = ? "
+            f"WHERE user_id = ? AND id IN ({', '.join('?' * len(ids))}) RETURNING *"
+        )
+        with self._transaction() as conn:
+            # Stamped under the write lock, like _insert
+            return [dict(row) for row in conn.execute(sql, [*values.values(), _now(), user_id, *ids]).fetchall()]
+
+    async def update(self, table, user_id, ids, values):
+        with span("sqlite.update"):
+            return await run_in_threadpool(self._update, table, user_id, ids, values)
+
+    def _delete(self, table, user_id, ids):
+        if table not in WRITABLE_TABLES:
+            raise ValueError(f"Table '{table}' is read-only")
+        ids = list(ids)
+        if not ids:
+            return []
+        sql = f"DELETE FROM {table} WHERE user_id = ? AND id IN ({', '.join('?' * len(ids))}) RETURNING *"
+        with self._transaction() as conn:
+            deleted = [dict(row) for row in conn.execute(sql, [user_id, *ids]).fetchall()]
+            # Tombstones for /sync, like the record_deletion trigger on Supabase
+            now = _now()
+            conn.executemany(
+                "INSERT INTO deleted_records (table_name, row_id, user_id, deleted_at) VALUES (?, ?, ?, ?)",
+                [(table, str(row["id"]), user_id, now) for row in deleted],
+            )
+        return deleted
+
+    async def delete(self, table, user_id, ids):
+        with span("sqlite.delete"):
+            return await run_in_threadpool(self._delete, table, user_id, ids)
@@ -0,0 +1,59 @@
+"""
+Startup Tracking
+Phase timings for app initialization and the readiness flag behind /ready
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupState:
+    """
+    Critical phases (pools, clients) run inside the lifespan before the app
+    accepts requests; warm-up phases run right after in the background, and
+    the app reports ready once they have all finished. A failed warm-up
+    phase is recorded but doesn't block readiness, since it only makes the
+    first request slower.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.phases = {}  # name -> duration in ms, in run order
+        self.errors = {}  # name -> error message
+        self.ready = False
+        self.ready_after_ms = None
+
+    def reset(self):
+        self.__init__()
+
+    @contextmanager
+    def phase(self, name: str, critical: bool = True):
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self.errors[name] = str(e)
+            logger.warning("Startup phase '%s' failed: %s", name, e)
+            if critical:
+                raise
+        finally:
+            self.phases[name] = round((time.monotonic() - start) * 1000, 2)
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_after_ms = round((time.monotonic() - self.started_at) * 1000, 2)
+        logger.info("Ready after %s ms", self.ready_after_ms, extra={"phases_ms": self.phases})
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready,
+            "ready_after_ms": self.ready_after_ms,
+            "phases_ms": dict(self.phases),
+            "errors": dict(self.errors),
+        }
+
+
+startup_state = StartupState()
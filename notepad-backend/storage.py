@@ -0,0 +1,226 @@
+"""
+Storage Layer
+One interface for notes, events and tombstones; Supabase or local SQLite behind it
+"""
+
+import os
+
+import config  # loads .env
+from database import init_supabase, close_supabase, get_supabase, warm_up_supabase
+from http_pool import get_client
+from pagination import keyset_filter
+from singleflight import SingleFlight
+from metrics import span
+
+# supabase (default) or sqlite
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+# Share one in-flight query between concurrent identical reads
+STORAGE_COALESCE_READS = os.getenv("STORAGE_COALESCE_READS", "true").lower() == "true"
+
+
+class Storage:
+    """
+    Every call is scoped to one user: reads only see that user's rows and
+    writes can only create or touch rows owned by them, the same guarantee
+    the RLS policies give on Supabase.
+
+    select() ordering is always (order, id), and `cursor` (from
+    pagination.encode_cursor) continues strictly after the row it points at.
+    """
+
+    name = "base"
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def warm_up(self):
+        pass
+
+    async def select(self, table: str, user_id: str, columns: str = "*", *, eq: dict = None,
+                     gte: dict = None, lt: dict = None, cursor: str = None, order: str = None,
+                     descending: bool = False, limit: int = None) -> list:
+        raise NotImplementedError
+
+    async def insert(self, table: str, user_id: str, rows: list) -> list:
+        """Insert all rows or none; returns them as stored"""
+        raise NotImplementedError
+
+    async def update(self, table: str, user_id: str, ids: list, values: dict) -> list:
+        """Apply the same values to every listed row; returns the rows that changed"""
+        raise NotImplementedError
+
+    async def delete(self, table: str, user_id: str, ids: list) -> list:
+        """Returns the rows that were deleted"""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class SupabaseStorage(Storage):
+    """PostgREST through the async Supabase client; RLS enforces ownership server-side too"""
+
+    name = "supabase"
+
+    async def open(self):
+        await init_supabase(get_client("supabase"))
+
+    async def close(self):
+        close_supabase()
+
+    async def warm_up(self):
+        await warm_up_supabase(get_client("supabase"))
+
+    async def select(self, table, user_id, columns="*", *, eq=None, gte=None, lt=None, cursor=None,
+                     order=None, descending=False, limit=None):
+        query = get_supabase().table(table).select(columns).eq("user_id", user_id)
+        for column, value in (eq or {}).items():
+            query = query.eq(column, value)
+        for column, value in (gte or {}).items():
+            query = query.gte(column, value)
+        for column, value in (lt or {}).items():
+            query = query.lt(column, value)
+        if cursor:
+            query = query.or_(keyset_filter(cursor, order, descending=descending))
+        if order:
+            query = query.order(order, desc=descending).order("id", desc=descending)
+        if limit:
+            query = query.limit(limit)
+        with span("supabase.select"):
+            response = await query.execute()
+        return response.data or []
+
+    async def insert(self, table, user_id, rows):
+        with span("supabase.insert"):
+            response = await get_supabase().table(table).insert(
+                [{**row, "user_id": user_id} for row in rows]
+            ).execute()
+        return response.data or []
+
+    async def update(self, table, user_id, ids, values):
+        with span("supabase.update"):
+            response = await (
+                get_supabase().table(table)
+                .update(values)
+                .in_("id", list(ids))
+                .eq("user_id", user_id)
+                .execute()
+            )
+        return response.data or []
+
+    async def delete(self, table, user_id, ids):
+        with span("supabase.delete"):
+            response = await (
+                get_supabase().table(table)
+                .delete()
+                .in_("id", list(ids))
+                .eq("user_id", user_id)
+                .execute()
+            )
+        return response.data or []
+
+
+class CoalescingStorage(Storage):
+    """
+    Wraps a backend so concurrent identical select() calls share one query.
+    A write stops the sharing of the user's in-flight reads on that table
+    when it starts and again when it finishes, so a read issued during or
+    after a write never joins a read from before it. Nothing is kept per
+    user once the calls are done.
+    """
+
+    def __init__(self, inner: Storage):
+        self.inner = inner
+        self.name = inner.name
+        self.reads = SingleFlight("reads")
+
+    async def open(self):
+        await self.inner.open()
+
+    async def close(self):
+        await self.inner.close()
+
+    async def warm_up(self):
+        await self.inner.warm_up()
+
+    async def select(self, table, user_id, columns="*", *, eq=None, gte=None, lt=None, cursor=None,
+                     order=None, descending=False, limit=None):
+        key = (
+            table, user_id, columns,
+            tuple(sorted((eq or {}).items())), tuple(sorted((gte or {}).items())), tuple(sorted((lt or {}).items())),
+            cursor, order, descending, limit,
+        )
+        return await self.reads.do(key, lambda: self.inner.select(
+            table, user_id, columns, eq=eq, gte=gte, lt=lt, cursor=cursor,
+            order=order, descending=descending, limit=limit,
+        ))
+
+    def _written(self, table: str, user_id: str):
+        self.reads.forget(lambda key: key[0] == table and key[1] == user_id)
+
+    async def insert(self, table, user_id, rows):
+        self._written(table, user_id)
+        try:
+            return await self.inner.insert(table, user_id, rows)
+        finally:
+            self._written(table, user_id)
+
+    async def update(self, table, user_id, ids, values):
+        self._written(table, user_id)
+        try:
+            return await self.inner.update(table, user_id, ids, values)
+        finally:
+            self._written(table, user_id)
+
+    async def delete(self, table, user_id, ids):
+        # Deletes also add tombstones
+        self._written(table, user_id)
+        self._written("deleted_records", user_id)
+        try:
+            return await self.inner.delete(table, user_id, ids)
+        finally:
+            self._written(table, user_id)
+            self._written("deleted_records", user_id)
+
+    def stats(self) -> dict:
+        return {**self.inner.stats(), "single_flight": self.reads.stats()}
+
+
+_storage: Storage = None
+
+
+def build_storage(backend: str = STORAGE_BACKEND, coalesce_reads: bool = STORAGE_COALESCE_READS) -> Storage:
+    if backend == "supabase":
+        storage = SupabaseStorage()
+    elif backend == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        storage = SQLiteStorage()
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected supabase or sqlite)")
+    return CoalescingStorage(storage) if coalesce_reads else storage
+
+
+async def open_storage() -> Storage:
+    """Build the configured backend once, at app startup"""
+    global _storage
+    if _storage is None:
+        storage = build_storage()
+        await storage.open()
+        _storage = storage
+    return _storage
+
+
+async def close_storage():
+    global _storage
+    if _storage is not None:
+        storage, _storage = _storage, None
+        await storage.close()
+
+
+def get_storage() -> Storage:
+    if _storage is None:
+        raise RuntimeError("Storage is not initialized; is the app started?")
+    return _storage
@@ -0,0 +1,36 @@
+# test_time_parser.py
+# Run:  python -m pytest test_time_parser.py  (or python test_time_parser.py)
+# "tonight" phrases on the regex fast path; no network or dateparser needed.
+
+from datetime import datetime
+
+from time_parser import normalize, parse_fast
+
+AFTERNOON = datetime(2026, 10, 18, 15, 0)
+LATE = datetime(2026, 10, 18, 22, 30)
+
+
+def test_tonight_at_hour_is_pm():
+    assert parse_fast(normalize("tonight at 8"), AFTERNOON) == datetime(2026, 10, 18, 20, 0)
+    assert parse_fast(normalize("8:30 tonight"), AFTERNOON) == datetime(2026, 10, 18, 20, 30)
+    assert parse_fast(normalize("tonight at 8pm"), AFTERNOON) == datetime(2026, 10, 18, 20, 0)
+    assert parse_fast(normalize("tonight at 21:00"), AFTERNOON) == datetime(2026, 10, 18, 21, 0)
+
+
+def test_bare_tonight_is_evening():
+    assert parse_fast(normalize("Tonight"), AFTERNOON) == datetime(2026, 10, 18, 20, 0)
+    # Already evening: now, not a time that has passed
+    assert parse_fast(normalize("tonight"), LATE) == LATE
+
+
+def test_ambiguous_or_past_tonight_falls_back():
+    assert parse_fast(normalize("tonight at 12"), AFTERNOON) is None
+    assert parse_fast(normalize("tonight at noon"), AFTERNOON) is None
+    assert parse_fast(normalize("tonight at 8"), LATE) is None
+
+
+if __name__ == "__main__":
+    test_tonight_at_hour_is_pm()
+    test_bare_tonight_is_evening()
+    test_ambiguous_or_past_tonight_falls_back()
+    print("OK")
@@ -0,0 +1,282 @@
+"""
+Natural-Language Time Parsing
+Regex fast path for common phrases, dateparser fallback, bounded memo
+"""
+
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from fastapi.concurrency import run_in_threadpool
+from cache import TTLCache
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Parser Configuration
+TIME_PARSE_LANGUAGES = [
+    lang.strip() for lang in os.getenv("TIME_PARSE_LANGUAGES", "en").split(",") if lang.strip()
+]
+TIME_PARSE_CACHE_SIZE = int(os.getenv("TIME_PARSE_CACHE_SIZE", "2048"))
+# Empty means naive datetimes in server-local time (the historical behaviour)
+TIME_PARSE_TIMEZONE = os.getenv("TIME_PARSE_TIMEZONE", "")
+
+TONIGHT_HOUR = 20  # what a bare "tonight" means
+
+WARM_UP_PHRASES = ("tomorrow at 5pm", "next friday 2pm", "in 2 hours", "march 3rd 10:30")
+
+_WEEKDAYS = {
+    name: i for i, names in enumerate((
+        ("monday", "mon"), ("tuesday", "tue", "tues"), ("wednesday", "wed"),
+        ("thursday", "thu", "thur", "thurs"), ("friday", "fri"),
+        ("saturday", "sat"), ("sunday", "sun"),
+    )) for name in names
+}
+_UNITS = {
+    "min": "minutes", "mins": "minutes", "minute": "minutes", "minutes": "minutes",
+    "hr": "hours", "hrs": "hours", "hour": "hours", "hours": "hours",
+    "day": "days", "days": "days", "week": "weeks", "weeks": "weeks",
+}
+
+_TIME = r"(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<ampm>am|pm|a\.m\.|p\.m\.)?|(?P<named>noon|midnight)"
+_DAY = r"(?P<day>today|tonight|tomorrow|(?:next\s+|this\s+)?(?:" + "|".join(_WEEKDAYS) + r"))"
+_DAY_TIME = re.compile(rf"^(?:{_DAY})?(?:\s*(?:at|@)?\s*(?:{_TIME}))?$")
+_TIME_DAY = re.compile(rf"^(?:at\s+)?(?:{_TIME})\s+(?:on\s+)?{_DAY}$")
+_IN = re.compile(r"^in\s+(?P<n>\d+|an?|one)\s+(?P<unit>" + "|".join(_UNITS) + r")$")
+_ISO = re.compile(r"^\d{4}-\d{2}-\d{2}(?:[ t]\d{2}:\d{2}(?::\d{2})?)?$")
+_NORMALIZE = re.compile(r"\s+")
+
+
+def normalize(phrase: str) -> str:
+    return _NORMALIZE.sub(" ", phrase.strip().lower()).strip(" .,!?")
+
+
+def _clock(match):
+    """(hour, minute) from a _TIME match, or None when the phrase has no time"""
+    if match.group("named"):
+        return (12, 0) if match.group("named") == "noon" else (0, 0)
+    if match.group("hour") is None:
+        return None
+    hour, minute = int(match.group("hour")), int(match.group("minute") or 0)
+    ampm = (match.group("ampm") or "").replace(".", "")
+    if ampm:
+        if not 1 <= hour <= 12:
+            raise ValueError
+        hour = hour % 12 + (12 if ampm == "pm" else 0)
+    if hour > 23 or minute > 59:
+        raise ValueError
+    return hour, minute
+
+
+def _resolve_day(day: str, now: datetime):
+    """Start of the named day; None for today. Weekdays mean the next one after today."""
+    if day in (None, "today"):
+        return None
+    if day == "tomorrow":
+        return now + timedelta(days=1)
+    name = day.split()[-1]
+    days_ahead = (_WEEKDAYS[name] - now.weekday()) % 7 or 7
+    return (now + timedelta(days=days_ahead)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _tonight(match, now: datetime):
+    """
+    "tonight" is today, evening. A bare "tonight" is TONIGHT_HOUR (or now,
+    if that has passed) and an hour without am/pm is read as pm. Anything
+    else ("tonight at noon", "tonight at 12", a time already past) is left
+    to the full parser.
+    """
+    if match.group("named"):
+        return None
+    clock = _clock(match)
+    if clock is None:
+        return max(now, now.replace(hour=TONIGHT_HOUR, minute=0, second=0, microsecond=0))
+    hour, minute = clock
+    if not match.group("ampm"):
+        if hour in (0, 12):
+            return None  # noon or midnight?
+        if hour < 12:
+            hour += 12
+    result = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return result if result >= now else None
+
+
+def parse_fast(phrase: str, now: datetime):
+    """
+    Common phrases without dateparser. Returns None when the phrase isn't
+    one we recognise, so the caller falls back to the full parser.
+    Mirrors dateparser's conventions (future dates preferred): "tomorrow"
+    keeps the current time of day, a bare weekday means midnight, a bare
+    time means its next occurrence.
+    """
+    if not phrase:
+        return None
+    try:
+        if phrase == "now":
+            return now
+        match = _IN.match(phrase)
+        if match:
+            n = match.group("n")
+            amount = 1 if n in ("a", "an", "one") else int(n)
+            return now + timedelta(**{_UNITS[match.group("unit")]: amount})
+        if _ISO.match(phrase):
+            parsed = datetime.fromisoformat(phrase.replace("t", "T"))
+            return parsed.replace(tzinfo=now.tzinfo)
+        match = _DAY_TIME.match(phrase) or _TIME_DAY.match(phrase)
+        if match:
+            if not (match.group("day") or match.group("ampm") or match.group("minute") or match.group("named")):
+                return None  # a bare number is more likely a day of the month
+            if match.group("day") == "tonight":
+                return _tonight(match, now)
+            clock = _clock(match)
+            day = _resolve_day(match.group("day"), now)
+            if clock is None:
+                return day if day is not None else now
+            base = day if day is not None else now
+            result = base.replace(hour=clock[0], minute=clock[1], second=0, microsecond=0)
+            if match.group("day") is None and result < now:
+                result += timedelta(days=1)  # a bare time that has passed means tomorrow
+            return result
+    except (ValueError, OverflowError):
+        return None
+    return None
+
+
+class TimeParser:
+    """
+    parse() tries the fast path first (exact, cheap), then the memo, then
+    dateparser. The memo is keyed on (phrase, timezone, reference date) and
+    stores either an absolute result or an offset from "now", so phrases
+    like "in 3 hours" stay correct across the day.
+    """
+
+    def __init__(self, languages: list = TIME_PARSE_LANGUAGES, cache_size: int = TIME_PARSE_CACHE_SIZE,
+                 default_timezone: str = TIME_PARSE_TIMEZONE):
+        self.languages = languages
+        self.default_timezone = default_timezone or None
+        self._memo = TTLCache(maxsize=cache_size, ttl=86400)
+        self._dateparser = None
+        self._import_lock = threading.Lock()
+        self.fast_hits = 0
+        self.fallback_parses = 0
+        self.fallback_errors = 0
+
+    def _now(self, tz: str = None) -> datetime:
+        if tz:
+            return datetime.now(ZoneInfo(tz))
+        return datetime.now()
+
+    def _load(self):
+        if self._dateparser is None:
+            with self._import_lock:
+                if self._dateparser is None:
+                    import dateparser  # slow import; done once, ideally at startup
+                    self._dateparser = dateparser
+        return self._dateparser
+
+    def _fallback(self, phrase: str, tz: str, base: datetime):
+        settings = {"PREFER_DATES_FROM": "future", "RELATIVE_BASE": base.replace(tzinfo=None)}
+        if tz:
+            settings.update({"TIMEZONE": tz, "RETURN_AS_TIMEZONE_AWARE": True})
+        self.fallback_parses += 1
+        return self._load().parse(phrase, languages=self.languages, settings=settings)
+
+    def _memo_entry(self, phrase: str, tz: str, now: datetime):
+        """
+        Parse against two reference times on the same day. Equal results are
+        absolute for the day; results that moved with the reference are an
+        offset from it. Anything else (e.g. a phrase crossing midnight) isn't memoized.
+        """
+        result = self._fallback(phrase, tz, now)
+        if result is None:
+            return ("none", None), None
+        other = now - timedelta(minutes=1) if now.hour or now.minute else now + timedelta(minutes=1)
+        other_result = self._fallback(phrase, tz, other)
+        if other_result == result:
+            return ("absolute", result), result
+        if other_result is not None and result - other_result == now - other:
+            return ("relative", result - now), result
+        return None, result
+
+    def lookup(self, phrase: str, tz: str = None, now: datetime = None):
+        """(found, result) without calling dateparser; found is False on a memo miss"""
+        tz = tz or self.default_timezone
+        now = now or self._now(tz)
+        key = normalize(phrase)
+        fast = parse_fast(key, now)
+        if fast is not None:
+            self.fast_hits += 1
+            return True, fast
+        entry = self._memo.get((key, tz, now.date()))
+        if entry is None:
+            return False, None
+        kind, value = entry
+        if kind == "relative":
+            return True, now + value
+        return True, value
+
+    def parse(self, phrase: str, tz: str = None, now: datetime = None):
+        """A datetime for the phrase, or None when it can't be understood"""
+        tz = tz or self.default_timezone
+        now = now or self._now(tz)
+        found, result = self.lookup(phrase, tz, now)
+        if found:
+            return result
+        key = normalize(phrase)
+        entry, result = self._memo_entry(key, tz, now)
+        if entry is not None:
+            self._memo.set((key, tz, now.date()), entry)
+        return result
+
+    async def parse_async(self, phrase: str, tz: str = None):
+        """Fast path and memo hits stay on the event loop; dateparser runs in the threadpool"""
+        with span("time_parse"):
+            found, result = self.lookup(phrase, tz)
+            if found:
+                return result
+            return await run_in_threadpool(self.parse, phrase, tz)
+
+    async def parse_many_async(self, phrases: list, tz: str = None) -> dict:
+        """phrase -> datetime or None; every dateparser miss shares one threadpool hop"""
+        with span("time_parse"):
+            results, misses = {}, []
+            for phrase in dict.fromkeys(phrases):
+                found, result = self.lookup(phrase, tz)
+                if found:
+                    results[phrase] = result
+                else:
+                    misses.append(phrase)
+            if misses:
+                parsed = await run_in_threadpool(lambda: [self._parse_or_none(phrase, tz) for phrase in misses])
+                results.update(zip(misses, parsed))
+            return results
+
+    def _parse_or_none(self, phrase: str, tz: str = None):
+        """parse(), but a fallback that raises (e.g. dateparser missing) only fails this phrase"""
+        try:
+            return self.parse(phrase, tz)
+        except Exception as e:
+            self.fallback_errors += 1
+            logger.warning("Could not parse time '%s': %s", phrase, e)
+            return None
+
+    def warm_up(self):
+        """Import dateparser and load its language data before the first request needs it"""
+        now = self._now(self.default_timezone)
+        for phrase in WARM_UP_PHRASES:
+            self._fallback(phrase, self.default_timezone, now)
+
+    def stats(self) -> dict:
+        return {
+            "languages": self.languages,
+            "fast_path_hits": self.fast_hits,
+            "fallback_parses": self.fallback_parses,
+            "fallback_errors": self.fallback_errors,
+            "memo": self._memo.stats(),
+        }
+
+
+time_parser = TimeParser()
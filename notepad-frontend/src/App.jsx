@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import {
   Trash2,
   LogOut,
@@ -18,11 +18,13 @@ const API_BASE = "http://127.0.0.1:8000";
 
 
 // --- LLM helper ---
-async function askAssistant(message, token) {
+// Streams the reply from /chat/stream (Server-Sent Events).
+// onDelta receives the text so far; the full reply is returned at the end.
+async function askAssistant(message, token, onDelta) {
   const formData = new FormData();
   formData.append("message", message);
 
-  const res = await fetch(`${API_BASE}/chat`, {
+  const res = await fetch(`${API_BASE}/chat/stream`, {
     method: "POST",
     headers: {
       Authorization: `Bearer ${token}`,
@@ -33,10 +35,73 @@ async function askAssistant(message, token) {
     const text = await res.text();
     throw new Error(`Chat request failed: ${res.status} ${text}`);
   }
-  const data = await res.json();
-  return data.reply;
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let reply = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Events are separated by a blank line
+    let sep;
+    while ((sep = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      const dataLine = raw.split("\n").find((l) => l.startsWith("data: "));
+      if (!dataLine) continue;
+      const data = JSON.parse(dataLine.slice(6));
+      if (data.delta !== undefined) reply += data.delta;
+      if (data.reply !== undefined) reply = data.reply;
+      if (onDelta) onDelta(reply);
+    }
+  }
+  return reply;
+}
+
+
+// --- List helper ---
+// List endpoints are paginated; follow X-Next-Cursor until the last page.
+async function fetchAllPages(path, token) {
+  let rows = [];
+  let cursor = null;
+  do {
+    const url = new URL(`${API_BASE}${path}`);
+    url.searchParams.set("limit", "500");
+    if (cursor) url.searchParams.set("cursor", cursor);
+    const res = await fetch(url, {
+      headers: { Authorization: `Bearer ${token}` },
+    });
+    if (!res.ok) return null;
+    rows = rows.concat(await res.json());
+    cursor = res.headers.get("X-Next-Cursor");
+  } while (cursor);
+  return rows;
+}
+
+
+// --- Change feed helpers ---
+// Apply one change from /changes to a list: replace or add upserted rows,
+// drop deleted ids, keep the list in its display order.
+function applyChange(rows, change, compare) {
+  const deleted = new Set(change.deleted.map(String));
+  const upserted = new Map(change.upserted.map((r) => [String(r.id), r]));
+  const kept = rows
+    .filter((r) => !deleted.has(String(r.id)))
+    .map((r) => {
+      const updated = upserted.get(String(r.id));
+      if (!updated) return r;
+      upserted.delete(String(r.id));
+      return { ...r, ...updated };
+    });
+  return [...upserted.values(), ...kept].sort(compare);
 }
 
+const newestFirst = (a, b) => String(b.created_at).localeCompare(String(a.created_at));
+const soonestFirst = (a, b) => String(a.start_time).localeCompare(String(b.start_time));
+
 
 export default function App() {
   const [supabaseClient, setSupabaseClient] = useState(null);
@@ -91,11 +156,35 @@ export default function App() {
     };
   }, []);
 
+  // Live updates: the feed pushes every change to this user's notes and
+  // events (including ones the assistant makes), so lists are only fetched
+  // when the feed says our copy can't be brought up to date ("ready" with
+  // no position yet, or "reset").
+  const feedCursor = useRef(null);
   useEffect(() => {
-    if (session) {
+    if (!session) return;
+    const url = new URL(`${API_BASE}/changes`);
+    url.searchParams.set("access_token", session.access_token);
+    if (feedCursor.current) url.searchParams.set("cursor", feedCursor.current);
+    const feed = new EventSource(url);
+
+    const refetch = (e) => {
+      const { cursor } = JSON.parse(e.data);
+      if (cursor) feedCursor.current = cursor;
       fetchNotes();
       fetchEvents();
-    }
+    };
+    feed.addEventListener("ready", (e) => {
+      if (!feedCursor.current) refetch(e);
+    });
+    feed.addEventListener("reset", refetch);
+    feed.addEventListener("change", (e) => {
+      const change = JSON.parse(e.data);
+      feedCursor.current = change.cursor;
+      if (change.table === "notes") setNotes((prev) => applyChange(prev, change, newestFirst));
+      if (change.table === "events") setEvents((prev) => applyChange(prev, change, soonestFirst));
+    });
+    return () => feed.close();
   }, [session]);
 
   const fetchNotes = async () => {
@@ -103,10 +192,8 @@ export default function App() {
     setLoading(true);
     setError("");
     try {
-      const res = await fetch(`${API_BASE}/notes`, {
-        headers: { Authorization: `Bearer ${session.access_token}` },
-      });
-      if (res.ok) setNotes(await res.json());
+      const rows = await fetchAllPages("/notes", session.access_token);
+      if (rows) setNotes(rows);
       else setError("Failed to load notes");
     } catch (_err) {
       setError("Backend Sync Error");
@@ -119,10 +206,8 @@ export default function App() {
     if (!session) return;
     setLoading(true);
     try {
-      const res = await fetch(`${API_BASE}/events`, {
-        headers: { Authorization: `Bearer ${session.access_token}` },
-      });
-      if (res.ok) setEvents(await res.json());
+      const rows = await fetchAllPages("/events", session.access_token);
+      if (rows) setEvents(rows);
     } catch (_err) {
       setError("Schedule Sync Error");
     } finally {
@@ -186,7 +271,6 @@ export default function App() {
 
       setTitle("");
       setContent("");
-      fetchNotes();
     } catch (err) {
       setError(`Failed to commit note: ${err.message}`);
     } finally {
@@ -224,7 +308,6 @@ export default function App() {
       setEventDesc("");
       setEventStart("");
       setEventEnd("");
-      fetchEvents();
     } catch (err) {
       setError(`Failed to log event: ${err.message}`);
     } finally {
@@ -234,20 +317,20 @@ export default function App() {
 
   const deleteNote = async (id) => {
     if (!session) return;
-    await fetch(`${API_BASE}/notes/${id}`, {
+    const res = await fetch(`${API_BASE}/notes/${id}`, {
       method: "DELETE",
       headers: { Authorization: `Bearer ${session.access_token}` },
     });
-    fetchNotes();
+    if (!res.ok) fetchNotes();
   };
 
   const deleteEvent = async (id) => {
     if (!session) return;
-    await fetch(`${API_BASE}/events/${id}`, {
+    const res = await fetch(`${API_BASE}/events/${id}`, {
       method: "DELETE",
       headers: { Authorization: `Bearer ${session.access_token}` },
     });
-    fetchEvents();
+    if (!res.ok) fetchEvents();
   };
 
   // ✅ NEW: Update Note Status
@@ -283,7 +366,8 @@ export default function App() {
     setAiError("");
     setAiLoading(true);
     try {
-      const reply = await askAssistant(aiQuestion, session.access_token);
+      setAiAnswer("");
+      const reply = await askAssistant(aiQuestion, session.access_token, setAiAnswer);
       setAiAnswer(reply);
       setAiQuestion("");
     } catch (err) {
@@ -299,6 +383,7 @@ export default function App() {
       setSession(null);
       setNotes([]);
       setEvents([]);
+      feedCursor.current = null;
     }
   };
 
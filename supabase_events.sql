@@ -0,0 +1,16 @@
+-- =======================================================
+-- 📅 SUPABASE EVENT QUERY SCRIPT (for GET /events/occurrences, /events/upcoming)
+-- RUN THIS IN YOUR SUPABASE DASHBOARD > SQL EDITOR
+-- =======================================================
+
+-- 1. Recurring events are stored once, as a rule (FREQ=WEEKLY;BYDAY=MO,WE;...)
+--    recurrence_end is the start of the last occurrence, 9999-12-31 if it never ends
+ALTER TABLE events ADD COLUMN IF NOT EXISTS recurrence text;
+ALTER TABLE events ADD COLUMN IF NOT EXISTS recurrence_end timestamptz;
+
+-- 2. Indexes matching the window scans
+--    one-off events: start_time in [from, to)
+--    recurring events: recurrence_end >= from and start_time < to
+create index if not exists events_user_start_idx on events (user_id, start_time, id);
+create index if not exists events_user_recurrence_idx on events (user_id, recurrence_end)
+  where recurrence_end is not null;
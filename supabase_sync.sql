@@ -0,0 +1,69 @@
+-- =======================================================
+-- 🔄 SUPABASE DELTA SYNC SCRIPT (for GET /sync)
+-- RUN THIS IN YOUR SUPABASE DASHBOARD > SQL EDITOR
+-- =======================================================
+
+-- 1. Track when every row last changed
+ALTER TABLE notes ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now();
+ALTER TABLE events ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now();
+
+create or replace function set_updated_at()
+returns trigger as $$
+begin
+  new.updated_at = clock_timestamp();
+  return new;
+end;
+$$ language plpgsql;
+
+drop trigger if exists notes_set_updated_at on notes;
+create trigger notes_set_updated_at
+before update on notes
+for each row execute function set_updated_at();
+
+drop trigger if exists events_set_updated_at on events;
+create trigger events_set_updated_at
+before update on events
+for each row execute function set_updated_at();
+
+-- 2. Tombstones: one row per deleted note/event
+create table if not exists deleted_records (
+  id bigserial primary key,
+  table_name text not null,
+  row_id text not null,
+  user_id text not null,
+  deleted_at timestamptz not null default clock_timestamp()
+);
+
+-- SECURITY DEFINER so the insert isn't blocked by RLS on deleted_records
+create or replace function record_deletion()
+returns trigger
+security definer
+as $$
+begin
+  insert into deleted_records (table_name, row_id, user_id)
+  values (TG_TABLE_NAME, old.id::text, old.user_id::text);
+  return old;
+end;
+$$ language plpgsql;
+
+drop trigger if exists notes_record_deletion on notes;
+create trigger notes_record_deletion
+after delete on notes
+for each row execute function record_deletion();
+
+drop trigger if exists events_record_deletion on events;
+create trigger events_record_deletion
+after delete on events
+for each row execute function record_deletion();
+
+-- 3. Indexes matching the /sync keyset scans
+create index if not exists notes_user_updated_idx on notes (user_id, updated_at, id);
+create index if not exists events_user_updated_idx on events (user_id, updated_at, id);
+create index if not exists deleted_records_user_idx on deleted_records (user_id, deleted_at, id);
+
+-- 4. Users can only read their own tombstones
+ALTER TABLE deleted_records ENABLE ROW LEVEL SECURITY;
+
+create policy "Users can read own tombstones"
+on deleted_records for select
+using ( auth.uid()::text = user_id::text );